@@ -0,0 +1,285 @@
+import logging
+from collections import Counter
+from datetime import datetime
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+_COMPLETED = {'status': 'done', 'completed_at': {'$exists': True}}
+
+# Sub-pipelines that can be combined into a single $facet stage
+FACETS = {
+    'status': [
+        {'$group': {'_id': '$status', 'count': {'$sum': 1}}}
+    ],
+    'priority': [
+        {'$group': {'_id': '$priority', 'count': {'$sum': 1}}}
+    ],
+    'completed_by_month': [
+        {'$match': _COMPLETED},
+        {'$group': {
+            '_id': {
+                'year': {'$year': '$completed_at'},
+                'month': {'$month': '$completed_at'}
+            },
+            'count': {'$sum': 1}
+        }},
+        {'$sort': {'_id.year': 1, '_id.month': 1}}
+    ],
+    'completion_time': [
+        {'$match': _COMPLETED},
+        {'$project': {
+            'completion_time': {
+                '$divide': [
+                    {'$subtract': ['$completed_at', '$created_at']},
+                    3600000  # Convert to hours
+                ]
+            }
+        }},
+        {'$group': {
+            '_id': None,
+            'avg_completion_time': {'$avg': '$completion_time'}
+        }}
+    ]
+}
+
+
+def facet_pipeline(match, facets, archive=None):
+    """
+    One $match over the indexed fields, then every requested facet in a
+    single pass. With an archive collection name, its matching tasks are
+    unioned in first so both tiers are counted.
+    """
+    pipeline = [{'$match': match}]
+    if archive:
+        pipeline.append({'$unionWith': {'coll': archive, 'pipeline': [{'$match': match}]}})
+    pipeline.append({'$facet': {name: FACETS[name] for name in facets}})
+    return pipeline
+
+
+def _counts(rows):
+    return {row['_id']: row['count'] for row in rows if row['_id']}
+
+
+def _month_key(completed_at):
+    return f"{completed_at.year}-{completed_at.month}"
+
+
+def _month_sort_key(month):
+    year, month = month.split('-')
+    return int(year), int(month)
+
+
+def _safe_key(value):
+    # Rollup counters are stored as sub-document fields
+    return isinstance(value, str) and value and '.' not in value and not value.startswith('$')
+
+
+def task_contribution(task):
+    """The rollup counters a single task adds to its company's totals."""
+    contribution = Counter()
+    if not task:
+        return contribution
+    if _safe_key(task.get('status')):
+        contribution[f"status.{task['status']}"] += 1
+    if _safe_key(task.get('priority')):
+        contribution[f"priority.{task['priority']}"] += 1
+    completed_at = task.get('completed_at')
+    if task.get('status') == 'done' and isinstance(completed_at, datetime):
+        contribution[f"completed_by_month.{_month_key(completed_at)}"] += 1
+        created_at = task.get('created_at')
+        if isinstance(created_at, datetime):
+            contribution['completion_hours_total'] += (completed_at - created_at).total_seconds() / 3600
+            contribution['completion_count'] += 1
+    return contribution
+
+
+def company_pipeline(company_code, archive=None):
+    return facet_pipeline({'company_code': company_code}, list(FACETS), archive)
+
+
+def shape_company_analytics(result):
+    """Turn the $facet output of company_pipeline into the API response."""
+    completion_time = result['completion_time']
+    return {
+        'status_stats': _counts(result['status']),
+        'priority_stats': _counts(result['priority']),
+        'completed_by_month': [
+            {
+                'month': f"{stat['_id']['year']}-{stat['_id']['month']}",
+                'count': stat['count']
+            } for stat in result['completed_by_month']
+        ],
+        'avg_completion_time': completion_time[0]['avg_completion_time'] if completion_time else 0
+    }
+
+
+def rollup_to_analytics(rollup):
+    """Turn a task_rollups document into the same response shape."""
+    months = {k: v for k, v in rollup.get('completed_by_month', {}).items() if v > 0}
+    completion_count = rollup.get('completion_count', 0)
+    return {
+        'status_stats': {k: v for k, v in rollup.get('status', {}).items() if v > 0},
+        'priority_stats': {k: v for k, v in rollup.get('priority', {}).items() if v > 0},
+        'completed_by_month': [
+            {'month': month, 'count': months[month]}
+            for month in sorted(months, key=_month_sort_key)
+        ],
+        'avg_completion_time': (rollup.get('completion_hours_total', 0) / completion_count
+                                if completion_count > 0 else 0)
+    }
+
+
+class TaskAnalytics:
+    """
+    Task statistics for the dashboard routes.
+
+    Without a rollup collection every read runs one $facet aggregation. With
+    one, each company has a counters document that write routes keep up to
+    date with atomic $inc updates. Reads then fetch that single document and
+    only fall back to the aggregation to build it the first time.
+
+    The aggregations may read from `reporting_collection`, typically the
+    tasks collection with a secondary read preference. Rollup rebuilds always
+    read tasks_collection, since their result is written back.
+
+    Every $inc also bumps the rollup's `writes` counter. A rebuild notes the
+    counter before scanning the tasks and only stores its result if the
+    counter has not moved, so increments that land during the scan are never
+    overwritten; it retries, and while it cannot finish reads are answered
+    by the aggregation. A write whose task update is seen by the scan but
+    whose $inc lands after the rebuild is stored is still counted twice;
+    `python analytics.py` rebuilds every company's rollup and is meant to
+    run periodically to correct such drift.
+    """
+
+    REBUILD_ATTEMPTS = 3
+
+    def __init__(self, tasks_collection, rollups_collection=None, archive_collection=None,
+                 reporting_collection=None):
+        self.tasks_collection = tasks_collection
+        self.rollups_collection = rollups_collection
+        self.archive_collection = archive_collection
+        self.reporting_collection = reporting_collection if reporting_collection is not None else tasks_collection
+
+    @property
+    def archive_name(self):
+        return self.archive_collection.name if self.archive_collection is not None else None
+
+    def stats(self, match):
+        """Status and priority counts for an arbitrary task filter."""
+        result = list(self.reporting_collection.aggregate(
+            facet_pipeline(match, ['status', 'priority'], self.archive_name)
+        ))[0]
+        return {
+            'status_stats': _counts(result['status']),
+            'priority_stats': _counts(result['priority'])
+        }
+
+    def company_analytics(self, company_code):
+        if self.rollups_collection is not None:
+            rollup = self.rollups_collection.find_one({'_id': company_code})
+            if rollup is None or rollup.get('building'):
+                rollup = self.rebuild_rollup(company_code)
+            if rollup is not None:
+                return rollup_to_analytics(rollup)
+        return self._aggregate(company_code)
+
+    def _aggregate(self, company_code):
+        result = list(self.reporting_collection.aggregate(company_pipeline(company_code, self.archive_name)))[0]
+        return shape_company_analytics(result)
+
+    def rebuild_rollup(self, company_code):
+        """
+        Recompute a company's counters from both task tiers and store them.
+        Returns None if writes kept changing the rollup during every attempt.
+        """
+        for _ in range(self.REBUILD_ATTEMPTS):
+            current = self.rollups_collection.find_one({'_id': company_code}, {'writes': 1})
+            if current is None:
+                # A placeholder collects the increments made while scanning
+                try:
+                    self.rollups_collection.insert_one({'_id': company_code, 'writes': 0, 'building': True})
+                except DuplicateKeyError:
+                    continue
+                writes = 0
+            else:
+                writes = current.get('writes', 0)
+
+            rollup = self._scan(company_code)
+            rollup['writes'] = writes
+            stored = self.rollups_collection.replace_one(
+                {'_id': company_code, 'writes': writes if writes else {'$in': [0, None]}}, rollup
+            )
+            if stored.matched_count:
+                return rollup
+        logger.warning(f"Task rollup for {company_code} kept changing during rebuild; using the aggregation")
+        return None
+
+    def _scan(self, company_code):
+        totals = Counter()
+        collections = [self.tasks_collection]
+        if self.archive_collection is not None:
+            collections.append(self.archive_collection)
+        for collection in collections:
+            for task in collection.find(
+                    {'company_code': company_code},
+                    {'status': 1, 'priority': 1, 'completed_at': 1, 'created_at': 1}):
+                totals.update(task_contribution(task))
+
+        rollup = {'_id': company_code, 'status': {}, 'priority': {}, 'completed_by_month': {},
+                  'completion_hours_total': totals.pop('completion_hours_total', 0),
+                  'completion_count': totals.pop('completion_count', 0)}
+        for key, count in totals.items():
+            group, name = key.split('.', 1)
+            rollup[group][name] = count
+        return rollup
+
+    def rebuild_all(self):
+        """Rebuild the rollup of every company that has one. Returns the companies that could not be stored."""
+        return [company_code for company_code in self.rollups_collection.distinct('_id')
+                if self.rebuild_rollup(company_code) is None]
+
+    def record_changes(self, changes):
+        """
+        Apply the difference between the old and new state of many tasks to
+        their companies' rollups, one $inc per company. Pass before=None for
+        inserts and after=None for deletes. Companies without a rollup
+        document yet are left alone; it is built from scratch on the next read.
+        """
+        if self.rollups_collection is None:
+            return
+        deltas = {}
+        for before, after in changes:
+            company_code = (after or before).get('company_code')
+            delta = deltas.setdefault(company_code, Counter())
+            delta.update(task_contribution(after))
+            delta.subtract(task_contribution(before))
+
+        for company_code, delta in deltas.items():
+            delta = {key: value for key, value in delta.items() if value}
+            if not delta:
+                continue
+            delta['writes'] = 1
+            try:
+                self.rollups_collection.update_one({'_id': company_code}, {'$inc': delta})
+            except Exception as e:
+                # The next rebuild corrects any drift; never fail the write route
+                logger.error(f"Error updating task rollup for {company_code}: {e}")
+
+
+if __name__ == '__main__':
+    import sys
+    from dotenv import load_dotenv
+
+    import connection
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    db = connection.command_line_database()
+    failed = TaskAnalytics(db['tasks'], db['task_rollups'], archive_collection=db['completed_tasks'],
+                           reporting_collection=connection.for_reporting(db['tasks'])).rebuild_all()
+    if failed:
+        print(f"Could not rebuild the rollup of: {', '.join(failed)}")
+        sys.exit(1)
@@ -1,124 +1,276 @@
-from flask import Flask, request, jsonify
+import time
+_import_started = time.perf_counter()
+
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-from pymongo import MongoClient
 from datetime import datetime, timedelta
 import os
+import atexit
+import threading
 from dotenv import load_dotenv
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from flask_caching import Cache
-from marshmallow import Schema, fields, validate
-from flasgger import Swagger
-import bcrypt
+import rate_limits
+from schemas import TaskSchema, UserSchema, AdminSchema, CompanySchema
+from marshmallow import ValidationError
+from validation import validate_json, compile_schema, error_message
 import logging
 from werkzeug.security import check_password_hash, generate_password_hash
 import random
 import string
 from bson import ObjectId
+import pagination
+import listing
+from indexes import ensure_indexes
+from identity import IdentityResolver
+import metrics
+import instrumentation
+import json_provider
+import connection
+from analytics import TaskAnalytics
+import search
+from events import TaskEvents
+from comments import CommentStore
+from queries import (active_tasks_query, completed_tasks_query, admin_tasks_query, visibility_filter,
+                     editable_filter, completable_filter, deletable_filter, at_version)
+import bulk
+import names
+from lease import Lease
+from pymongo import InsertOne, ReturnDocument
+import response_cache
+from passwords import PasswordHasher, PasswordHasherUnavailable
+import archive
+import audit
+import export
+import bulk_import
 
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('app.log'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'your-secret-key')
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=1)
+# Benchmarks turn this off; every other deployment keeps the limits
+app.config['RATELIMIT_ENABLED'] = os.getenv('RATELIMIT_ENABLED', 'true').lower() == 'true'
+RATELIMIT_DEFAULT = os.getenv('RATELIMIT_DEFAULT', '1000 per day;100 per hour').split(';')
+
+# Per-request DB / serialization / handler timings, exported on /metrics
+instrumentation.init_app(app)
+# Encodes ObjectId and datetime natively, so documents are returned as read
+json_provider.init_app(app, os.getenv('JSON_PROVIDER', 'orjson'))
 
 # Initialize extensions
 jwt = JWTManager(app)
+# Per-caller limits, counted in shared storage (see rate_limits.py)
 limiter = Limiter(
     app=app,
-    key_func=get_remote_address,
-    default_limits=["1000 per day", "100 per hour"]
+    key_func=rate_limits.identity_key,
+    default_limits=RATELIMIT_DEFAULT,
+    storage_uri=os.getenv('RATELIMIT_STORAGE_URI', 'memory://'),
+    strategy=os.getenv('RATELIMIT_STRATEGY', 'sliding-window-counter'),
+    in_memory_fallback_enabled=True,
+    swallow_errors=True
 )
-cache = Cache(app, config={'CACHE_TYPE': 'simple'})
-swagger = Swagger(app)
 
 # Configure CORS
+CORS_ORIGINS = ["http://localhost:4200", "https://taskmateangular.vercel.app"]
+CORS_EXPOSE_HEADERS = ["Content-Type", "Authorization", "X-Next-Cursor"]
 CORS(app, resources={
     r"/*": {
-        "origins": ["http://localhost:4200", "https://taskmateangular.vercel.app"],
+        "origins": CORS_ORIGINS,
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
         "allow_headers": ["Content-Type", "Authorization"],
         "supports_credentials": True,
-        "expose_headers": ["Content-Type", "Authorization"],
+        "expose_headers": CORS_EXPOSE_HEADERS,
         "max_age": 3600
     }
 })
 
-# MongoDB connection
-try:
-    client = MongoClient(os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'))
-    db = client['task_manager']
-    tasks_collection = db['tasks']
-    completed_tasks_collection = db['completed_tasks']
-    users_collection = db['users']
-    admin_collection = db['admins']
-    company_collection = db['companies']
-    client.server_info()
-    logger.info("Successfully connected to MongoDB!")
-except Exception as e:
-    logger.error(f"Error connecting to MongoDB: {e}")
-    raise
+# MongoDB connection. Each worker process connects on first use (see
+# create_app); pool size and timeouts come from MONGO_* settings.
+client = connection.LazyClient(event_listeners=[instrumentation.MongoCommandTimer()])
+db = client[os.getenv('MONGODB_DB', 'task_manager')]
+tasks_collection = db['tasks']
+completed_tasks_collection = db['completed_tasks']
+users_collection = db['users']
+admin_collection = db['admins']
+company_collection = db['companies']
+comments_collection = db['comments']
+metrics.register('mongo_pool', client.stats)
 
-# Validation schemas
-class TaskSchema(Schema):
-    title = fields.Str(required=True, validate=validate.Length(min=1, max=100))
-    description = fields.Str(validate=validate.Length(max=500))
-    status = fields.Str(validate=validate.OneOf(['todo', 'in_progress', 'done']))
-    priority = fields.Str(validate=validate.OneOf(['low', 'medium', 'high']))
-    category = fields.Str()
-    due_date = fields.DateTime(allow_none=True)
-    created_at = fields.DateTime(dump_only=True)
-    user_id = fields.Str(dump_only=True)
-
-class UserSchema(Schema):
-    username = fields.Str(required=True, validate=validate.Length(min=3, max=50))
-    password = fields.Str(required=True, validate=validate.Length(min=6))
-    email = fields.Email(required=True)
-    role = fields.Str(required=True, validate=validate.OneOf(['user', 'admin']))
-    company_code = fields.Str(required=True)
-
-class AdminSchema(Schema):
-    username = fields.Str(required=True)
-    password = fields.Str(required=True)
-    company_code = fields.Str(required=True)
-
-class CompanySchema(Schema):
-    name = fields.Str(required=True)
-    code = fields.Str(required=True)
-    created_by = fields.Str(required=True)
+# Cached user lookups for @jwt_required routes
+identity = IdentityResolver(
+    users_collection,
+    maxsize=int(os.getenv('IDENTITY_CACHE_SIZE', '10000')),
+    ttl=int(os.getenv('IDENTITY_CACHE_TTL', '60'))
+)
+metrics.register('identity_cache', identity.stats)
+
+# Per-company request quotas, in the same storage as the per-caller limits
+company_quotas = rate_limits.CompanyQuotas(
+    company_collection, os.getenv('RATELIMIT_COMPANY_DEFAULT', '20000 per hour')
+)
+metrics.register('company_rate_limits', company_quotas.stats)
+
+@app.before_request
+def enforce_company_quota():
+    if not app.config['RATELIMIT_ENABLED']:
+        return None
+    current_user = rate_limits.current_identity()
+    if not current_user:
+        return None
+    user = identity.resolve(current_user)
+    if not user or not user.get('company_code'):
+        return None
+    return company_quotas.check(limiter.limiter, user['company_code'])
+
+# Dashboard statistics, optionally served from incrementally maintained rollups
+analytics = TaskAnalytics(
+    tasks_collection,
+    db['task_rollups'] if os.getenv('ANALYTICS_ROLLUPS', 'false').lower() == 'true' else None,
+    archive_collection=completed_tasks_collection,
+    reporting_collection=connection.for_reporting(tasks_collection)
+)
+
+# Cached dashboard responses, shared between workers when CACHE_REDIS_URL is set
+cache = response_cache.ResponseCache(response_cache.create_backend(
+    redis_url=os.getenv('CACHE_REDIS_URL'),
+    max_entries=int(os.getenv('CACHE_MAX_ENTRIES', '1000'))
+))
+metrics.register('response_cache', cache.stats)
+ANALYTICS_CACHE_SECONDS = 60
+
+# Comments live in their own collection; tasks keep a count and last timestamp
+comment_store = CommentStore(comments_collection, tasks_collection)
+
+# Real-time task feed: 'changestream' (needs a replica set) or 'local'
+task_events = TaskEvents(tasks_collection, backend=os.getenv('EVENTS_BACKEND', 'changestream'))
+metrics.register('task_events', task_events.stats)
+
+# Audit trail of task writes, stored in batches by a background writer
+audit_log = audit.AuditLog(
+    db['audit_log'],
+    batch_size=int(os.getenv('AUDIT_BATCH_SIZE', '500')),
+    flush_interval=int(os.getenv('AUDIT_FLUSH_INTERVAL_MS', '1000')) / 1000,
+    max_pending=int(os.getenv('AUDIT_MAX_PENDING', '10000')),
+    enqueue_timeout=int(os.getenv('AUDIT_ENQUEUE_TIMEOUT_MS', '100')) / 1000
+)
+metrics.register('audit_log', audit_log.stats)
+atexit.register(audit_log.close)
+
+# bcrypt runs in a bounded process pool so logins cannot starve task traffic
+password_hasher = PasswordHasher(
+    rounds=int(os.getenv('BCRYPT_ROUNDS', '12')),
+    workers=int(os.getenv('BCRYPT_WORKERS', '2')),
+    max_pending=int(os.getenv('BCRYPT_MAX_PENDING', '16'))
+)
+metrics.register('password_hasher', password_hasher.stats)
+
+# Bulk imports: a separate hasher so an import never queues logins, and at most
+# IMPORT_MAX_RUNNING imports per worker
+import_hasher = PasswordHasher(
+    rounds=int(os.getenv('BCRYPT_ROUNDS', '12')),
+    workers=int(os.getenv('IMPORT_HASH_WORKERS', '2'))
+)
+metrics.register('import_hasher', import_hasher.stats)
+import_runner = bulk_import.ImportRunner(
+    db['imports'], db['import_failures'], max_running=int(os.getenv('IMPORT_MAX_RUNNING', '1'))
+)
+# Uploads are copied to disk before the import starts
+IMPORT_MAX_BYTES = int(os.getenv('IMPORT_MAX_BYTES', str(50 * 1024 * 1024)))
+
+# Task search: 'mongo' (text index) or 'memory' (in-process inverted index)
+task_search = search.create_search(tasks_collection, os.getenv('SEARCH_BACKEND', 'mongo'))
+
+# Completed tasks older than ARCHIVE_AFTER_DAYS move to completed_tasks_collection.
+# Set ARCHIVE_INTERVAL_SECONDS to run the job in each worker instead of from cron.
+archive_interval = int(os.getenv('ARCHIVE_INTERVAL_SECONDS', '0'))
+archiver = None
+
+# Usernames are stored on tasks; this job copies renames onto them (0 disables)
+name_reconcile_interval = int(os.getenv('NAME_RECONCILE_INTERVAL_SECONDS', '300'))
+name_reconciler = None
+
+background_pid = None
+background_lock = threading.Lock()
 
+@app.before_request
+def ensure_background_jobs():
+    global background_pid
+    # Threads do not survive fork(); start them per worker on its first request
+    if background_pid == os.getpid():
+        return
+    with background_lock:
+        if background_pid != os.getpid():
+            start_background_jobs()
+            background_pid = os.getpid()
+
+def start_background_jobs():
+    global archiver, name_reconciler
+    if archive_interval > 0:
+        archiver = archive.ArchiveScheduler(
+            tasks_collection,
+            completed_tasks_collection,
+            timedelta(days=int(os.getenv('ARCHIVE_AFTER_DAYS', '30'))),
+            archive_interval
+        )
+        archiver.start()
+    if name_reconcile_interval > 0:
+        name_reconciler = names.NameReconciler(
+            users_collection,
+            [tasks_collection, completed_tasks_collection],
+            name_reconcile_interval,
+            on_change=lambda companies: cache.invalidate(*(f"company:{code}" for code in companies)),
+            # Held for two intervals, so the holder renews it before it can expire
+            lease=Lease(db['leases'], 'name-reconciler', ttl=name_reconcile_interval * 2)
+        )
+        name_reconciler.start()
+
+# Validation schemas
 task_schema = TaskSchema()
 user_schema = UserSchema()
+# Items of the bulk routes, checked like the single-task routes' bodies
+bulk_create_schema = compile_schema(TaskSchema, required=('description', 'due_date', 'priority'))
+bulk_update_schema = compile_schema(TaskSchema, partial=True)
+
+def check_password(user, password):
+    """
+    Verify a login password and upgrade the stored hash if it was created
+    with a different bcrypt cost than the one currently configured.
+    """
+    stored_hash = user['password']
+    
+    # If stored hash is a string, convert it to bytes
+    if isinstance(stored_hash, str):
+        stored_hash = stored_hash.encode('utf-8')
+    
+    if not password_hasher.verify(password, stored_hash):
+        return False
+    
+    if password_hasher.needs_rehash(stored_hash):
+        try:
+            users_collection.update_one(
+                {'_id': user['_id']},
+                {'$set': {'password': password_hasher.hash(password)}}
+            )
+        except Exception as e:
+            # The old hash still works; try again on the next login
+            logger.error(f"Password rehash error: {e}")
+    return True
+
+def password_hasher_busy():
+    response = jsonify({'error': 'Server busy, please retry shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
 
 # Authentication routes
 @app.route('/auth/register', methods=['POST'])
-def register():
+@validate_json(UserSchema, partial=('company_code',))
+def register(data):
     try:
-        data = request.get_json()
-        required_fields = ['username', 'email', 'password', 'role']
-        
-        # Check for required fields
-        for field in required_fields:
-            if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
-        
-        # Validate password length
-        if len(data['password']) < 6:
-            return jsonify({'error': 'Password must be at least 6 characters long'}), 400
-        
         # Check if username already exists
         if users_collection.find_one({'username': data['username']}):
             return jsonify({'error': 'Username already exists'}), 400
@@ -129,8 +281,7 @@ def register():
         
         try:
             # Hash password using bcrypt
-            salt = bcrypt.gensalt()
-            hashed_password = bcrypt.hashpw(data['password'].encode('utf-8'), salt)
+            hashed_password = password_hasher.hash(data['password'])
             
             # Create user object
             user = {
@@ -152,6 +303,8 @@ def register():
                 'message': 'Registration successful. Please complete your registration.',
                 'user': user
             }), 201
+        except PasswordHasherUnavailable:
+            return password_hasher_busy()
         except Exception as e:
             logger.error(f"Password hashing error: {e}")
             return jsonify({'error': 'Error creating user'}), 500
@@ -161,16 +314,9 @@ def register():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/auth/complete-registration', methods=['POST'])
-def complete_registration():
+@validate_json(AdminSchema, only=('username', 'company_code', 'company_name'))
+def complete_registration(data):
     try:
-        data = request.get_json()
-        required_fields = ['username', 'company_code']
-        
-        # Check for required fields
-        for field in required_fields:
-            if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
-        
         # Find user
         user = users_collection.find_one({'username': data['username']})
         if not user:
@@ -212,6 +358,8 @@ def complete_registration():
                 }
             }
         )
+        identity.invalidate(user['_id'])
+        cache.invalidate(f"user:{user['_id']}")
         
         # Generate access token
         access_token = create_access_token(identity={
@@ -237,13 +385,10 @@ def complete_registration():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/auth/login', methods=['POST'])
-@limiter.limit("10 per minute")
-def login():
+@limiter.limit("10 per minute", key_func=get_remote_address)
+@validate_json(AdminSchema, only=('username', 'password'))
+def login(data):
     try:
-        data = request.json
-        if not data or 'username' not in data or 'password' not in data:
-            return jsonify({"error": "Username and password are required"}), 400
-            
         user = users_collection.find_one({"username": data['username']})
         
         if not user:
@@ -251,15 +396,7 @@ def login():
             return jsonify({"error": "Invalid credentials"}), 401
             
         try:
-            # Ensure both password and stored hash are bytes
-            password_bytes = data['password'].encode('utf-8')
-            stored_hash = user['password']
-            
-            # If stored hash is a string, convert it to bytes
-            if isinstance(stored_hash, str):
-                stored_hash = stored_hash.encode('utf-8')
-                
-            if bcrypt.checkpw(password_bytes, stored_hash):
+            if check_password(user, data['password']):
                 access_token = create_access_token(identity=str(user['_id']))
                 return jsonify({
                     "access_token": access_token,
@@ -274,6 +411,8 @@ def login():
             else:
                 logger.error(f"Login failed: Invalid password for user - {data['username']}")
                 return jsonify({"error": "Invalid credentials"}), 401
+        except PasswordHasherUnavailable:
+            return password_hasher_busy()
         except Exception as e:
             logger.error(f"Password verification error: {e}")
             return jsonify({"error": "Invalid credentials"}), 401
@@ -283,64 +422,120 @@ def login():
         return jsonify({"error": str(e)}), 500
 
 # Task routes
+def tasks_written(changes, actor):
+    """
+    Propagate task writes by `actor`, given as (before, after) pairs, to the
+    analytics rollups, the search index, the real-time feed and the audit log.
+    """
+    audit_log.record(changes, actor)
+    analytics.record_changes(changes)
+    comment_store.delete_for_tasks([ObjectId(before['_id']) for before, after in changes if after is None])
+    cache.invalidate(*{f"company:{(after or before).get('company_code')}" for before, after in changes})
+    for before, after in changes:
+        if after is None:
+            task_search.task_removed(before)
+        else:
+            task_search.task_changed(after)
+        task_events.task_written(before, after)
+
+def task_written(before, after, actor):
+    tasks_written([(before, after)], actor)
+
+class VersionError(ValueError):
+    pass
+
+def expected_version(data=None):
+    """
+    The task version the client last read, from the body's 'version' or an
+    If-Match header, or None to write unconditionally.
+    """
+    value = (data or {}).get('version') if isinstance(data, dict) else None
+    if value is None and request.headers.get('If-Match'):
+        value = request.headers['If-Match'].strip().strip('"')
+    if value is None:
+        return None
+    try:
+        version = int(value)
+    except (TypeError, ValueError):
+        raise VersionError('version must be an integer')
+    if version < 0:
+        raise VersionError('version must be an integer')
+    return version
+
+def task_write_failed(task_id, user, allowed, unauthorized_message):
+    """
+    Explain why a conditional task write matched nothing. Only runs on the
+    failure path, so successful writes stay at one round trip.
+    """
+    task = tasks_collection.find_one({'_id': ObjectId(task_id), **allowed}, {'version': 1})
+    if task:
+        return jsonify({
+            'error': 'Task was changed by someone else; reload it and retry',
+            'version': task.get('version', 0)
+        }), 409
+    if tasks_collection.find_one({'_id': ObjectId(task_id), 'company_code': user['company_code']}, {'_id': 1}):
+        return jsonify({'error': unauthorized_message}), 403
+    return jsonify({'error': 'Task not found'}), 404
+
+def cache_scope():
+    """Cache responses per user and company; any task write in the company invalidates them."""
+    return user_cache_scope(identity.resolve(get_jwt_identity()))
+
+def user_cache_scope(user):
+    if not user:
+        return None, None
+    return (
+        [str(user['_id']), user['company_code']],
+        [f"company:{user['company_code']}", f"user:{user['_id']}"]
+    )
+
+def task_list_response(query, sort=pagination.DEFAULT_SORT):
+    """
+    Run a task listing query and build the response.
+
+    Without ?limit/?cursor/?fields the full list is returned as before.
+    Otherwise one keyset page is returned and the cursor for the next page
+    is sent in the X-Next-Cursor header.
+    """
+    next_cursor = None
+    if pagination.is_requested(request.args):
+        tasks, next_cursor = pagination.fetch_page(tasks_collection, query, request.args, sort)
+    else:
+        tasks = list(tasks_collection.find(query, pagination.HIDDEN_FIELDS).sort(pagination.sort_order(sort)))
+    
+    response = jsonify(tasks)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response, 200
+
 @app.route('/tasks', methods=['GET'])
 @jwt_required()
 def get_tasks():
     try:
         current_user = get_jwt_identity()
-        user = users_collection.find_one({'_id': ObjectId(current_user)})
+        user = identity.resolve(current_user)
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        # Get active tasks (not done) based on user role
-        if user['role'] == 'admin':
-            # Admin can see all active tasks in their company
-            tasks = list(tasks_collection.find({
-                'company_code': user['company_code'],
-                'status': {'$ne': 'done'}  # Only get non-completed tasks
-            }))
-        else:
-            # Regular users can only see active tasks assigned to them
-            tasks = list(tasks_collection.find({
-                'company_code': user['company_code'],
-                '$or': [
-                    {'created_by': str(user['_id'])},
-                    {'assigned_to': str(user['_id'])}
-                ],
-                'status': {'$ne': 'done'}  # Only get non-completed tasks
-            }))
-        
-        # Convert ObjectId to string
-        for task in tasks:
-            task['_id'] = str(task['_id'])
-            if 'created_by' in task:
-                task['created_by'] = str(task['created_by'])
-            if 'assigned_to' in task:
-                task['assigned_to'] = str(task['assigned_to'])
-        
-        return jsonify(tasks), 200
+        # Admins see all active tasks in their company, users only their own
+        query = listing.filtered(active_tasks_query(user), request.args, listing.ACTIVE_STATUSES)
+        return task_list_response(query, listing.sort_key(request.args))
+    except pagination.PaginationError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error in get_tasks: {e}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/tasks', methods=['POST'])
 @jwt_required()
-def create_task():
+@validate_json(TaskSchema, required=('description', 'due_date', 'priority'))
+def create_task(data):
     try:
         current_user = get_jwt_identity()
-        data = request.get_json()
-        print(data)
-        
-        # Validate required fields
-        required_fields = ['title', 'description', 'due_date', 'priority']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
         
         # Get user details
-        user = users_collection.find_one({'_id': ObjectId(current_user)})
-        print("user",user)
+        user = identity.resolve(current_user)
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
@@ -348,12 +543,13 @@ def create_task():
         task = {
             'title': data['title'],
             'description': data['description'],
-            'due_date': datetime.fromisoformat(data['due_date'].replace('Z', '+00:00')),
+            'due_date': data['due_date'],
             'priority': data['priority'],
             'status': 'todo',
             'company_code': user['company_code'],
-            'created_by': str(user['_id']),
-            'created_at': datetime.utcnow()
+            **names.creator_names(user),
+            'created_at': datetime.utcnow(),
+            'version': 1
         }
         
         # If assigned_to is provided, verify it's a valid user in the same company
@@ -361,41 +557,69 @@ def create_task():
             assigned_user = users_collection.find_one({
                 '_id': ObjectId(data['assigned_to']),
                 'company_code': user['company_code']
-            })
+            }, {'username': 1})
             if not assigned_user:
                 return jsonify({'error': 'Invalid user assignment'}), 400
-            task['assigned_to'] = str(assigned_user['_id'])
+            task.update(names.assignee_names(assigned_user))
         
         # Insert task into database
+        task['search_terms'] = search.search_terms_for(task)
         result = tasks_collection.insert_one(task)
         task['_id'] = str(result.inserted_id)
+        del task['search_terms']
+        task_written(None, task, user)
         
         return jsonify(task), 201
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+UPDATE_ATTEMPTS = 3
+
+def write_task_update(task_id, user, update_data, version):
+    """
+    Apply `update_data` to a task the user may edit, at `version` if given.
+    Returns the task as it was before the write, or None if nothing matched.
+
+    Search terms depend on fields the request may not have sent, so when a
+    search field changes they are computed from the current task and set in
+    the same write, conditional on the version they were computed from. If
+    another write lands in between, the update is retried from a fresh read.
+    """
+    query = {'_id': ObjectId(task_id), **editable_filter(user)}
+    if not any(field in update_data for field in search.SEARCH_FIELDS):
+        # One round trip: the filter only matches tasks the user may update (admin, creator or assignee)
+        return tasks_collection.find_one_and_update(
+            at_version(query, version),
+            {'$set': update_data, '$inc': {'version': 1}},
+            projection=pagination.HIDDEN_FIELDS,
+            return_document=ReturnDocument.BEFORE
+        )
+    for _ in range(UPDATE_ATTEMPTS):
+        current = tasks_collection.find_one(at_version(query, version), pagination.HIDDEN_FIELDS)
+        if not current:
+            return None
+        search_terms = search.search_terms_for({**current, **update_data})
+        task = tasks_collection.find_one_and_update(
+            at_version(query, current.get('version', 0)),
+            {'$set': {**update_data, 'search_terms': search_terms}, '$inc': {'version': 1}},
+            projection=pagination.HIDDEN_FIELDS,
+            return_document=ReturnDocument.BEFORE
+        )
+        if task:
+            return task
+    return None
+
 @app.route('/tasks/<task_id>', methods=['PUT'])
 @jwt_required()
-def update_task(task_id):
+@validate_json(TaskSchema, partial=True)
+def update_task(task_id, data):
     try:
         current_user = get_jwt_identity()
-        data = request.get_json()
-        
-        # Get task
-        task = tasks_collection.find_one({'_id': ObjectId(task_id)})
-        if not task:
-            return jsonify({'error': 'Task not found'}), 404
         
-        # Verify user has permission to update the task
-        user = users_collection.find_one({'_id': ObjectId(current_user)})
+        user = identity.resolve(current_user)
         if not user:
             return jsonify({'error': 'User not found'}), 404
-        
-        # Allow update if user is admin, task creator, or assigned user
-        if (user['role'] != 'admin' and 
-            str(task['created_by']) != str(user['_id']) and 
-            str(task.get('assigned_to')) != str(user['_id'])):
-            return jsonify({'error': 'Unauthorized to update this task'}), 403
+        version = expected_version(data)
         
         # Update task fields
         update_data = {}
@@ -404,7 +628,7 @@ def update_task(task_id):
         if 'description' in data:
             update_data['description'] = data['description']
         if 'due_date' in data:
-            update_data['due_date'] = datetime.fromisoformat(data['due_date'].replace('Z', '+00:00'))
+            update_data['due_date'] = data['due_date']
         if 'priority' in data:
             update_data['priority'] = data['priority']
         if 'status' in data:
@@ -414,26 +638,22 @@ def update_task(task_id):
             assigned_user = users_collection.find_one({
                 '_id': ObjectId(data['assigned_to']),
                 'company_code': user['company_code']
-            })
+            }, {'username': 1})
             if not assigned_user:
                 return jsonify({'error': 'Invalid user assignment'}), 400
-            update_data['assigned_to'] = str(assigned_user['_id'])
+            update_data.update(names.assignee_names(assigned_user))
+        if not update_data:
+            return jsonify({'error': 'No fields to update'}), 400
         
-        # Update task
-        tasks_collection.update_one(
-            {'_id': ObjectId(task_id)},
-            {'$set': update_data}
-        )
-        
-        # Get updated task
-        updated_task = tasks_collection.find_one({'_id': ObjectId(task_id)})
-        updated_task['_id'] = str(updated_task['_id'])
-        if 'created_by' in updated_task:
-            updated_task['created_by'] = str(updated_task['created_by'])
-        if 'assigned_to' in updated_task:
-            updated_task['assigned_to'] = str(updated_task['assigned_to'])
+        task = write_task_update(task_id, user, update_data, version)
+        if not task:
+            return task_write_failed(task_id, user, editable_filter(user), 'Unauthorized to update this task')
+        updated_task = {**task, **update_data, 'version': task.get('version', 0) + 1}
+        task_written(task, updated_task, user)
         
         return jsonify(updated_task), 200
+    except VersionError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -442,26 +662,23 @@ def update_task(task_id):
 def delete_task(task_id):
     try:
         current_user = get_jwt_identity()
-        user = users_collection.find_one({'_id': ObjectId(current_user)})
+        user = identity.resolve(current_user)
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        # Get the task
-        task = tasks_collection.find_one({'_id': ObjectId(task_id)})
+        # Delete the task if the user is an admin or its creator
+        task = tasks_collection.find_one_and_delete(
+            at_version({'_id': ObjectId(task_id), **deletable_filter(user)}, expected_version()),
+            projection=pagination.HIDDEN_FIELDS
+        )
         if not task:
-            return jsonify({'error': 'Task not found'}), 404
-        
-        # Check if user has permission to delete the task
-        if user['role'] != 'admin' and str(task['created_by']) != str(user['_id']):
-            return jsonify({'error': 'Unauthorized to delete this task'}), 403
+            return task_write_failed(task_id, user, deletable_filter(user), 'Unauthorized to delete this task')
         
-        # Delete the task
-        result = tasks_collection.delete_one({'_id': ObjectId(task_id)})
-        
-        if result.deleted_count:
-            return jsonify({'message': 'Task deleted successfully'}), 200
-        return jsonify({'error': 'Task not found'}), 404
+        task_written(task, None, user)
+        return jsonify({'message': 'Task deleted successfully'}), 200
+    except VersionError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error in delete_task: {e}")
         return jsonify({'error': str(e)}), 500
@@ -477,37 +694,46 @@ def search_tasks():
         in: query
         type: string
         required: true
+        description: Words to search for; the last word also matches as a prefix
+      - name: limit
+        in: query
+        type: integer
+        required: false
+      - name: cursor
+        in: query
+        type: string
+        required: false
+        description: Value of the X-Next-Cursor header from the previous page
     responses:
       200:
-        description: List of matching tasks
+        description: Matching tasks, best match first
     """
     try:
-        user_id = get_jwt_identity()
-        query = request.args.get('q', '').strip()
+        user = identity.resolve(get_jwt_identity())
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
         
-        if not query:
+        query = request.args.get('q', '')
+        if not query.strip():
             return jsonify([])
 
-        results = tasks_collection.find({
-            'user_id': user_id,
-            '$or': [
-                {'title': {'$regex': query, '$options': 'i'}},
-                {'description': {'$regex': query, '$options': 'i'}},
-                {'category': {'$regex': query, '$options': 'i'}}
-            ]
-        })
-        
-        tasks = list(results)
-        for task in tasks:
-            task['_id'] = str(task['_id'])
-        return jsonify(tasks)
+        limit = pagination.parse_limit(request.args.get('limit'))
+        offset = search.decode_offset(request.args.get('cursor'))
+        tasks, next_cursor = task_search.search(user, query, limit, offset)
+        
+        response = jsonify(tasks)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
+    except pagination.PaginationError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error in search_tasks: {e}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/tasks/stats', methods=['GET'])
 @jwt_required()
-@cache.cached(timeout=300)
+@cache.cached(timeout=300, scope=cache_scope)
 def get_task_stats():
     """
     Get task statistics
@@ -518,28 +744,7 @@ def get_task_stats():
     """
     try:
         user_id = get_jwt_identity()
-        pipeline = [
-            {'$match': {'user_id': user_id}},
-            {'$group': {
-                '_id': '$status',
-                'count': {'$sum': 1}
-            }}
-        ]
-        stats = list(tasks_collection.aggregate(pipeline))
-        
-        priority_pipeline = [
-            {'$match': {'user_id': user_id}},
-            {'$group': {
-                '_id': '$priority',
-                'count': {'$sum': 1}
-            }}
-        ]
-        priority_stats = list(tasks_collection.aggregate(priority_pipeline))
-        
-        return jsonify({
-            'status_stats': {stat['_id']: stat['count'] for stat in stats if stat['_id']},
-            'priority_stats': {stat['_id']: stat['count'] for stat in priority_stats if stat['_id']}
-        })
+        return jsonify(analytics.stats({'user_id': user_id}))
     except Exception as e:
         logger.error(f"Error in get_task_stats: {e}")
         return jsonify({'error': str(e)}), 500
@@ -549,32 +754,30 @@ def get_task_stats():
 def complete_task(task_id):
     try:
         current_user = get_jwt_identity()
-        user = users_collection.find_one({'_id': ObjectId(current_user)})
+        user = identity.resolve(current_user)
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        # Get the task
-        task = tasks_collection.find_one({'_id': ObjectId(task_id)})
-        if not task:
-            return jsonify({'error': 'Task not found'}), 404
-        
-        # Check if user has permission to complete the task
-        if user['role'] != 'admin' and str(task['assigned_to']) != str(user['_id']):
-            return jsonify({'error': 'Unauthorized to complete this task'}), 403
-        
-        # Update task status to done
-        tasks_collection.update_one(
-            {'_id': ObjectId(task_id)},
-            {
-                '$set': {
-                    'status': 'done',
-                    'completed_at': datetime.utcnow()
-                }
-            }
+        # Update task status to done if the user is an admin or its assignee
+        completion = {
+            'status': 'done',
+            'completed_at': datetime.utcnow()
+        }
+        task = tasks_collection.find_one_and_update(
+            at_version({'_id': ObjectId(task_id), **completable_filter(user)},
+                       expected_version(request.get_json(silent=True))),
+            {'$set': completion, '$inc': {'version': 1}},
+            projection=pagination.HIDDEN_FIELDS,
+            return_document=ReturnDocument.BEFORE
         )
+        if not task:
+            return task_write_failed(task_id, user, completable_filter(user), 'Unauthorized to complete this task')
+        task_written(task, {**task, **completion, 'version': task.get('version', 0) + 1}, user)
         
         return jsonify({'message': 'Task completed successfully'}), 200
+    except VersionError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error in complete_task: {e}")
         return jsonify({'error': str(e)}), 500
@@ -584,137 +787,397 @@ def complete_task(task_id):
 def get_completed_tasks():
     try:
         current_user = get_jwt_identity()
-        user = users_collection.find_one({'_id': ObjectId(current_user)})
+        user = identity.resolve(current_user)
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        # Get completed tasks based on user role
-        if user['role'] == 'admin':
-            # Admin can see all completed tasks in their company
-            tasks = list(tasks_collection.find({
-                'company_code': user['company_code'],
-                'status': 'done'
-            }))
-        else:
-            # Regular users can only see completed tasks assigned to them
-            tasks = list(tasks_collection.find({
-                'company_code': user['company_code'],
-                # 'assigned_to': str(user['_id']),
-                '$or': [
-                    {'created_by': str(user['_id'])},
-                    {'assigned_to': str(user['_id'])}
-                ],
-                'status': 'done'
-            }))
-        
-        # Convert ObjectId to string
-        for task in tasks:
-            task['_id'] = str(task['_id'])
-            if 'created_by' in task:
-                task['created_by'] = str(task['created_by'])
-            if 'assigned_to' in task:
-                task['assigned_to'] = str(task['assigned_to'])
-        
-        return jsonify(tasks), 200
+        # Admins see all completed tasks in their company, users only their own,
+        # from both the hot collection and the archive
+        tasks, next_cursor = archive.find_both_tiers(
+            connection.for_reporting(tasks_collection),
+            connection.for_reporting(completed_tasks_collection),
+            listing.filtered(completed_tasks_query(user), request.args, listing.COMPLETED_STATUSES),
+            request.args,
+            listing.sort_key(request.args)
+        )
+        response = jsonify(tasks)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
+    except pagination.PaginationError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error in get_completed_tasks: {e}")
         return jsonify({'error': str(e)}), 500
 
+# Bulk task routes
+@app.route('/tasks/bulk', methods=['POST'])
+@jwt_required()
+def bulk_create_tasks():
+    """
+    Create many tasks at once
+    ---
+    parameters:
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            tasks:
+              type: array
+              items:
+                type: object
+    responses:
+      200:
+        description: Per-item results, in request order
+    """
+    try:
+        user = identity.resolve(get_jwt_identity())
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        items = bulk.read_items(request.get_json(silent=True), 'tasks')
+        result = bulk.BulkResult()
+        assignees = bulk.valid_assignees(
+            users_collection,
+            [item.get('assigned_to') for item in items if isinstance(item, dict) and 'assigned_to' in item],
+            user['company_code']
+        )
+        
+        operations = []
+        created = {}
+        now = datetime.utcnow()
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                result.fail(index, 'Task must be an object')
+                continue
+            try:
+                item = bulk_create_schema.load(item)
+            except ValidationError as e:
+                result.fail(index, error_message(e.messages), fields=e.messages)
+                continue
+            
+            task = {
+                '_id': ObjectId(),
+                'title': item['title'],
+                'description': item['description'],
+                'due_date': item['due_date'],
+                'priority': item['priority'],
+                'status': 'todo',
+                'company_code': user['company_code'],
+                **names.creator_names(user),
+                'created_at': now,
+                'version': 1
+            }
+            if 'assigned_to' in item:
+                if str(item['assigned_to']) not in assignees:
+                    result.fail(index, 'Invalid user assignment')
+                    continue
+                task.update(names.assignee_names(assignees[str(item['assigned_to'])]))
+            task['search_terms'] = search.search_terms_for(task)
+            operations.append((index, InsertOne(task)))
+            created[index] = task
+        
+        written = bulk.execute(tasks_collection, operations, result, 'created',
+                               {index: {'_id': str(task['_id'])} for index, task in created.items()})
+        tasks_written([(None, created[index]) for index in written], user)
+        
+        return jsonify(result.to_dict()), 200
+    except bulk.BulkError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in bulk_create_tasks: {e}")
+        return jsonify({'error': str(e)}), 500
 
-@app.route('/analytics/tasks', methods=['GET'])
+@app.route('/tasks/bulk', methods=['PUT'])
 @jwt_required()
-def get_task_analytics():
+def bulk_update_tasks():
+    """
+    Update many tasks at once
+    ---
+    parameters:
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            tasks:
+              type: array
+              description: Objects with an _id, the fields to change and optionally the version last read
+              items:
+                type: object
+    responses:
+      200:
+        description: Per-item results, in request order
+    """
     try:
-        current_user = get_jwt_identity()
-        user = users_collection.find_one({'_id': ObjectId(current_user)})
+        user = identity.resolve(get_jwt_identity())
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        items = bulk.read_items(request.get_json(silent=True), 'tasks')
+        result = bulk.BulkResult()
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                result.fail(index, 'Task must be an object')
+        task_ids = bulk.parse_task_ids(
+            [item.get('_id') if isinstance(item, dict) else None for item in items], result
+        )
+        tasks = {task['_id']: task for task in tasks_collection.find({
+            '_id': {'$in': list(task_ids.values())},
+            'company_code': user['company_code']
+        })}
+        assignees = bulk.valid_assignees(
+            users_collection,
+            [item.get('assigned_to') for item in items if isinstance(item, dict) and 'assigned_to' in item],
+            user['company_code']
+        )
         
+        writes = []
+        changes = {}
+        for index, task_id in task_ids.items():
+            try:
+                item = bulk_update_schema.load(items[index])
+            except ValidationError as e:
+                result.fail(index, error_message(e.messages), fields=e.messages)
+                continue
+            task = tasks.get(task_id)
+            if not task:
+                result.fail(index, 'Task not found')
+                continue
+            if (user['role'] != 'admin' and
+                str(task['created_by']) != str(user['_id']) and
+                str(task.get('assigned_to')) != str(user['_id'])):
+                result.fail(index, 'Unauthorized to update this task')
+                continue
+            # Like update_task: a stale version is a conflict; without one the version read is used
+            if 'version' in item and item['version'] != task.get('version', 0):
+                result.fail(index, bulk.CONFLICT_MESSAGE, version=task.get('version', 0))
+                continue
+            
+            update_data = {field: item[field] for field in ('title', 'description', 'priority', 'status', 'due_date')
+                           if field in item}
+            if 'assigned_to' in item:
+                if str(item['assigned_to']) not in assignees:
+                    result.fail(index, 'Invalid user assignment')
+                    continue
+                update_data.update(names.assignee_names(assignees[str(item['assigned_to'])]))
+            if not update_data:
+                result.fail(index, 'No fields to update')
+                continue
+            if any(field in update_data for field in search.SEARCH_FIELDS):
+                update_data['search_terms'] = search.search_terms_for({**task, **update_data})
+            
+            writes.append((index, at_version({'_id': task_id, **editable_filter(user)}, task.get('version', 0)),
+                           {'$set': update_data, '$inc': {'version': 1}}))
+            changes[index] = (task, {**task, **update_data, 'version': task.get('version', 0) + 1})
+        
+        written = bulk.execute_conditional(tasks_collection, writes, result, 'updated',
+                                           editable_filter(user), 'Unauthorized to update this task',
+                                           {index: {'_id': str(task_ids[index])} for index in changes})
+        tasks_written([changes[index] for index in written], user)
+        
+        return jsonify(result.to_dict()), 200
+    except bulk.BulkError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in bulk_update_tasks: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/tasks/bulk/complete', methods=['POST'])
+@jwt_required()
+def bulk_complete_tasks():
+    """
+    Complete many tasks at once
+    ---
+    parameters:
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            ids:
+              type: array
+              items:
+                type: string
+    responses:
+      200:
+        description: Per-item results, in request order
+    """
+    try:
+        user = identity.resolve(get_jwt_identity())
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        # Active tasks by status
-        status_pipeline = [
-            {'$match': {'company_code': user['company_code']}},
-            {'$group': {
-                '_id': '$status',
-                'count': {'$sum': 1}
-            }}
-        ]
-        status_stats = list(tasks_collection.aggregate(status_pipeline))
-        
-        # Active tasks by priority
-        priority_pipeline = [
-            {'$match': {'company_code': user['company_code']}},
-            {'$group': {
-                '_id': '$priority',
-                'count': {'$sum': 1}
-            }}
-        ]
-        priority_stats = list(tasks_collection.aggregate(priority_pipeline))
+        result = bulk.BulkResult()
+        task_ids = bulk.parse_task_ids(bulk.read_items(request.get_json(silent=True), 'ids'), result)
+        tasks = {task['_id']: task for task in tasks_collection.find({
+            '_id': {'$in': list(task_ids.values())},
+            'company_code': user['company_code']
+        })}
         
-        # Completed tasks by month
-        completed_pipeline = [
-            {'$match': {
-                'company_code': user['company_code'],
-                'status': 'done',
-                'completed_at': {'$exists': True}
-            }},
-            {'$group': {
-                '_id': {
-                    'year': {'$year': '$completed_at'},
-                    'month': {'$month': '$completed_at'}
-                },
-                'count': {'$sum': 1}
-            }},
-            {'$sort': {'_id.year': 1, '_id.month': 1}}
-        ]
-        completed_stats = list(tasks_collection.aggregate(completed_pipeline))
+        writes = []
+        changes = {}
+        completion = {
+            'status': 'done',
+            'completed_at': datetime.utcnow()
+        }
+        for index, task_id in task_ids.items():
+            task = tasks.get(task_id)
+            if not task:
+                result.fail(index, 'Task not found')
+                continue
+            if user['role'] != 'admin' and str(task.get('assigned_to')) != str(user['_id']):
+                result.fail(index, 'Unauthorized to complete this task')
+                continue
+            writes.append((index, at_version({'_id': task_id, **completable_filter(user)}, task.get('version', 0)),
+                           {'$set': completion, '$inc': {'version': 1}}))
+            changes[index] = (task, {**task, **completion, 'version': task.get('version', 0) + 1})
+        
+        written = bulk.execute_conditional(tasks_collection, writes, result, 'completed',
+                                           completable_filter(user), 'Unauthorized to complete this task',
+                                           {index: {'_id': str(task_ids[index])} for index in changes})
+        tasks_written([changes[index] for index in written], user)
+        
+        return jsonify(result.to_dict()), 200
+    except bulk.BulkError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in bulk_complete_tasks: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/tasks/bulk/delete', methods=['POST'])
+@jwt_required()
+def bulk_delete_tasks():
+    """
+    Delete many tasks at once
+    ---
+    parameters:
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            ids:
+              type: array
+              items:
+                type: string
+    responses:
+      200:
+        description: Per-item results, in request order
+    """
+    try:
+        user = identity.resolve(get_jwt_identity())
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
         
-        # Average completion time
-        completion_time_pipeline = [
-            {'$match': {
-                'company_code': user['company_code'],
-                'status': 'done',
-                'completed_at': {'$exists': True}
-            }},
-            {'$project': {
-                'completion_time': {
-                    '$divide': [
-                        {'$subtract': ['$completed_at', '$created_at']},
-                        3600000  # Convert to hours
-                    ]
-                }
-            }},
-            {'$group': {
-                '_id': None,
-                'avg_completion_time': {'$avg': '$completion_time'}
-            }}
-        ]
-        completion_time = list(tasks_collection.aggregate(completion_time_pipeline))
+        result = bulk.BulkResult()
+        task_ids = bulk.parse_task_ids(bulk.read_items(request.get_json(silent=True), 'ids'), result)
+        tasks = {task['_id']: task for task in tasks_collection.find({
+            '_id': {'$in': list(task_ids.values())},
+            'company_code': user['company_code']
+        })}
+        
+        writes = []
+        for index, task_id in task_ids.items():
+            task = tasks.get(task_id)
+            if not task:
+                result.fail(index, 'Task not found')
+                continue
+            if user['role'] != 'admin' and str(task['created_by']) != str(user['_id']):
+                result.fail(index, 'Unauthorized to delete this task')
+                continue
+            writes.append((index, at_version({'_id': task_id, **deletable_filter(user)}, task.get('version', 0)),
+                           {'$inc': {'version': 1}}))
+        
+        written = bulk.execute_conditional(tasks_collection, writes, result, 'deleted',
+                                           deletable_filter(user), 'Unauthorized to delete this task',
+                                           {index: {'_id': str(task_ids[index])} for index, _, _ in writes},
+                                           delete=True)
+        tasks_written([(tasks[task_ids[index]], None) for index in written], user)
+        
+        return jsonify(result.to_dict()), 200
+    except bulk.BulkError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in bulk_delete_tasks: {e}")
+        return jsonify({'error': str(e)}), 500
+@app.route('/tasks/events', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def task_event_stream():
+    """
+    Server-sent events for task changes the caller can see
+    ---
+    parameters:
+      - name: jwt
+        in: query
+        type: string
+        required: false
+        description: Access token, for EventSource clients that cannot set headers
+      - name: last_event_id
+        in: query
+        type: string
+        required: false
+        description: Resume after this event (the Last-Event-ID header also works)
+    responses:
+      200:
+        description: text/event-stream of created, updated, completed, deleted and reset events
+    """
+    user = identity.resolve(get_jwt_identity())
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    subscription = task_events.subscribe(user, last_event_id)
+    heartbeat = int(os.getenv('EVENTS_HEARTBEAT_SECONDS', '15'))
+    
+    def stream():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                if subscription.overflowed:
+                    yield 'event: reset\ndata: {}\n\n'
+                    return
+                event = subscription.get(timeout=heartbeat)
+                if event is None:
+                    yield ': keep-alive\n\n'
+                    continue
+                data = app.json.dumps({'type': event['type'], 'task': event.get('task')})
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
+        finally:
+            task_events.unsubscribe(subscription)
+    
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/analytics/tasks', methods=['GET'])
+@jwt_required()
+@cache.cached(timeout=ANALYTICS_CACHE_SECONDS, scope=cache_scope)
+def get_task_analytics():
+    try:
+        current_user = get_jwt_identity()
+        user = identity.resolve(current_user)
         
-        return jsonify({
-            'status_stats': {stat['_id']: stat['count'] for stat in status_stats if stat['_id']},
-            'priority_stats': {stat['_id']: stat['count'] for stat in priority_stats if stat['_id']},
-            'completed_by_month': [
-                {
-                    'month': f"{stat['_id']['year']}-{stat['_id']['month']}",
-                    'count': stat['count']
-                } for stat in completed_stats
-            ],
-            'avg_completion_time': completion_time[0]['avg_completion_time'] if completion_time else 0
-        })
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        return jsonify(analytics.company_analytics(user['company_code']))
     except Exception as e:
         logger.error(f"Error in get_task_analytics: {e}")
         return jsonify({'error': str(e)}), 500
 
 # Admin routes
 @app.route('/admin/login', methods=['POST'])
-def admin_login():
+@validate_json(AdminSchema, only=('username', 'password'))
+def admin_login(data):
     try:
-        data = request.get_json()
-        if not data or 'username' not in data or 'password' not in data:
-            return jsonify({"error": "Username and password are required"}), 400
-            
         # Find user in users_collection with admin role
         user = users_collection.find_one({
             "username": data['username'],
@@ -726,15 +1189,7 @@ def admin_login():
             return jsonify({"error": "Invalid credentials"}), 401
             
         try:
-            # Ensure both password and stored hash are bytes
-            password_bytes = data['password'].encode('utf-8')
-            stored_hash = user['password']
-            
-            # If stored hash is a string, convert it to bytes
-            if isinstance(stored_hash, str):
-                stored_hash = stored_hash.encode('utf-8')
-                
-            if bcrypt.checkpw(password_bytes, stored_hash):
+            if check_password(user, data['password']):
                 access_token = create_access_token(identity=str(user['_id']))
                 return jsonify({
                     "access_token": access_token,
@@ -749,6 +1204,8 @@ def admin_login():
             else:
                 logger.error(f"Admin login failed: Invalid password for user - {data['username']}")
                 return jsonify({"error": "Invalid credentials"}), 401
+        except PasswordHasherUnavailable:
+            return password_hasher_busy()
         except Exception as e:
             logger.error(f"Password verification error: {e}")
             return jsonify({"error": "Invalid credentials"}), 401
@@ -759,27 +1216,20 @@ def admin_login():
 
 @app.route('/admin/tasks', methods=['POST'])
 @jwt_required()
-def admin_create_task():
+@validate_json(TaskSchema, required=('description', 'due_date', 'priority', 'assigned_to'))
+def admin_create_task(data):
     try:
         current_user = get_jwt_identity()
-        user = users_collection.find_one({'_id': ObjectId(current_user)})
+        user = identity.resolve(current_user)
         
         if not user or user['role'] != 'admin':
             return jsonify({'error': 'Unauthorized'}), 403
         
-        data = request.get_json()
-        
-        # Validate required fields
-        required_fields = ['title', 'description', 'due_date', 'priority', 'assigned_to']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
-        
         # Verify assigned user is in the same company
         assigned_user = users_collection.find_one({
             '_id': ObjectId(data['assigned_to']),
             'company_code': user['company_code']
-        })
+        }, {'username': 1})
         
         if not assigned_user:
             return jsonify({'error': 'Invalid user assignment'}), 400
@@ -788,92 +1238,398 @@ def admin_create_task():
         task = {
             'title': data['title'],
             'description': data['description'],
-            'due_date': datetime.fromisoformat(data['due_date'].replace('Z', '+00:00')),
+            'due_date': data['due_date'],
             'priority': data['priority'],
             'status': 'todo',
             'company_code': user['company_code'],
-            'created_by': str(user['_id']),
-            'assigned_to': str(assigned_user['_id']),
-            'created_at': datetime.utcnow()
+            **names.creator_names(user),
+            **names.assignee_names(assigned_user),
+            'created_at': datetime.utcnow(),
+            'version': 1
         }
         
         # Insert task into database
+        task['search_terms'] = search.search_terms_for(task)
         result = tasks_collection.insert_one(task)
         task['_id'] = str(result.inserted_id)
+        del task['search_terms']
+        task_written(None, task, user)
         
         return jsonify(task), 201
     except Exception as e:
         logger.error(f"Error in admin_create_task: {e}")
         return jsonify({'error': str(e)}), 500
 
+def unnamed_assignee_ids(tasks):
+    """Assignees of tasks written before names were stored on tasks (until the reconciler has run)."""
+    return [ObjectId(task['assigned_to']) for task in tasks
+            if task.get('assigned_to') and 'assigned_to_name' not in task]
+
+# Fields of the admin dashboard rows; the database drops everything else
+ADMIN_TASK_FIELDS = {
+    'title': 1, 'description': 1, 'due_date': 1, 'priority': 1,
+    'status': 1, 'created_at': 1, 'assigned_to': 1, 'assigned_to_name': 1, 'version': 1
+}
+
+@instrumentation.serialization
+def admin_task_rows(tasks, user_map):
+    """Fill in defaults for tasks read with ADMIN_TASK_FIELDS, naming legacy assignees from user_map."""
+    for task in tasks:
+        task.setdefault('assigned_to', None)
+        # The admin dashboard has always received these as isoformat() without an offset
+        for field in ('due_date', 'created_at'):
+            if isinstance(task.get(field), datetime):
+                task[field] = task[field].isoformat()
+        if 'assigned_to_name' not in task:
+            task['assigned_to_name'] = user_map.get(str(task['assigned_to']), 'Unassigned')
+    return tasks
+
 @app.route('/admin/tasks', methods=['GET'])
 @jwt_required()
 def admin_get_tasks():
     try:
         current_user_id = get_jwt_identity()
-        user = users_collection.find_one({'_id': ObjectId(current_user_id)})
+        user = identity.resolve(current_user_id)
 
         if not user or user.get('role') != 'admin':
             return jsonify({'message': 'Unauthorized'}), 403
 
         # Fetch tasks created by current admin
-        tasks = list(tasks_collection.find({
-            'created_by': str(user['_id']),
-            'company_code': user['company_code']
-        }))
+        query = listing.filtered(admin_tasks_query(user), request.args)
+        sort = pagination.sort_order(listing.sort_key(request.args))
+        tasks = list(tasks_collection.find(query, ADMIN_TASK_FIELDS).sort(sort))
 
-        # Collect all assigned_to user IDs
-        assigned_user_ids = [ObjectId(task['assigned_to']) for task in tasks if 'assigned_to' in task]
-        assigned_users = list(users_collection.find({'_id': {'$in': assigned_user_ids}}))
-        user_map = {str(user['_id']): user.get('username', 'Unknown') for user in assigned_users}
-
-        response = []
-        for task in tasks:
-            task_data = {
-                '_id': str(task['_id']),
-                'title': task['title'],
-                'description': task['description'],
-                'due_date': task['due_date'].isoformat() if isinstance(task['due_date'], datetime) else task['due_date'],
-                'priority': task['priority'],
-                'status': task['status'],
-                'created_at': task['created_at'].isoformat() if isinstance(task['created_at'], datetime) else task['created_at'],
-                'assigned_to': str(task['assigned_to']) if 'assigned_to' in task else None,
-                'assigned_to_name': user_map.get(str(task.get('assigned_to')), 'Unassigned')
-            }
-            response.append(task_data)
+        # Assignee names are stored on tasks; only legacy tasks need a users lookup
+        user_map = {}
+        legacy_ids = unnamed_assignee_ids(tasks)
+        if legacy_ids:
+            assigned_users = users_collection.find({'_id': {'$in': legacy_ids}}, {'username': 1})
+            user_map = {str(user['_id']): user.get('username', 'Unknown') for user in assigned_users}
 
-        return jsonify(response), 200
+        return jsonify(admin_task_rows(tasks, user_map)), 200
 
+    except listing.ListingError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error in admin_get_tasks: {e}")
         return jsonify({'error': str(e)}), 500
 
+# Streaming exports running at once in this process (see gunicorn.conf.py)
+export_slots = threading.BoundedSemaphore(int(os.getenv('EXPORT_MAX_CONCURRENT', '4')))
+
+@app.route('/admin/tasks/export', methods=['GET'])
+@jwt_required()
+@limiter.limit(os.getenv('EXPORT_RATE_LIMIT', '30 per hour'))
+def admin_export_tasks():
+    """
+    Download every task of the company, streamed
+    ---
+    parameters:
+      - name: format
+        in: query
+        type: string
+        enum: [ndjson, csv]
+        required: false
+      - name: status
+        in: query
+        type: string
+        required: false
+        description: Comma-separated statuses, e.g. todo,in_progress
+      - name: date_field
+        in: query
+        type: string
+        enum: [created_at, due_date, completed_at]
+        required: false
+      - name: from
+        in: query
+        type: string
+        required: false
+        description: Inclusive start of the date range (ISO 8601)
+      - name: to
+        in: query
+        type: string
+        required: false
+        description: Exclusive end of the date range (ISO 8601)
+    responses:
+      200:
+        description: One task per line (NDJSON) or row (CSV)
+      503:
+        description: EXPORT_MAX_CONCURRENT exports are already running in this worker
+    """
+    try:
+        user = identity.resolve(get_jwt_identity())
+        if not user or user.get('role') != 'admin':
+            return jsonify({'error': 'Unauthorized'}), 403
+        
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in export.FORMATS:
+            return jsonify({'error': f"format must be one of: {', '.join(export.FORMATS)}"}), 400
+        query, read_archive = export.export_query(user['company_code'], request.args)
+        
+        collections = [connection.for_reporting(tasks_collection)]
+        if read_archive:
+            collections.append(connection.for_reporting(completed_tasks_collection))
+        tasks = export.iter_tasks(collections, query, int(os.getenv('EXPORT_BATCH_SIZE', '1000')))
+        body = export.csv_chunks(tasks) if export_format == 'csv' else export.ndjson_chunks(tasks, app.json.dumps)
+        
+        # An export holds a worker thread until the download finishes
+        if not export_slots.acquire(blocking=False):
+            response = jsonify({'error': 'Too many exports in progress, please retry shortly'})
+            response.headers['Retry-After'] = '30'
+            return response, 503
+        filename = f"tasks-{user['company_code']}-{datetime.utcnow():%Y%m%d}.{export_format}"
+        # No Content-Length: the body is sent with chunked transfer encoding as it is read
+        response = Response(body, content_type=export.FORMATS[export_format], headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'Cache-Control': 'no-store',
+            'X-Accel-Buffering': 'no'
+        })
+        response.call_on_close(export_slots.release)
+        return response
+    except export.ExportError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in admin_export_tasks: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/tasks/<task_id>/comments', methods=['POST'])
 @jwt_required()
 def add_comment(task_id):
-    current_user = get_jwt_identity()
-    data = request.get_json()
-    
-    comment = {
-        'user': current_user['username'],
-        'text': data['text'],
-        'timestamp': datetime.utcnow().isoformat()
-    }
-    
-    tasks_collection.update_one(
-        {'_id': ObjectId(task_id)},
-        {'$push': {'comments': comment}}
-    )
-    return jsonify({'message': 'Comment added successfully'}), 200
+    try:
+        user = identity.resolve(get_jwt_identity())
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        data = request.get_json()
+        if not data or not data.get('text'):
+            return jsonify({'error': 'Missing required field: text'}), 400
+        
+        # Only tasks the user can see may be commented on
+        task = tasks_collection.find_one({'_id': ObjectId(task_id), **visibility_filter(user)}, {'_id': 1})
+        if not task:
+            return jsonify({'error': 'Task not found'}), 404
+        
+        comment_store.add(task['_id'], user, data['text'])
+        return jsonify({'message': 'Comment added successfully'}), 200
+    except Exception as e:
+        logger.error(f"Error in add_comment: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/tasks/<task_id>/comments', methods=['GET'])
+@jwt_required()
+def get_comments(task_id):
+    """
+    List a task's comments, oldest first
+    ---
+    parameters:
+      - name: limit
+        in: query
+        type: integer
+        required: false
+      - name: cursor
+        in: query
+        type: string
+        required: false
+        description: Value of the X-Next-Cursor header from the previous page
+    responses:
+      200:
+        description: One page of comments
+    """
+    try:
+        user = identity.resolve(get_jwt_identity())
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        task = tasks_collection.find_one({'_id': ObjectId(task_id), **visibility_filter(user)}, {'_id': 1})
+        if not task:
+            return jsonify({'error': 'Task not found'}), 404
+        
+        comments, next_cursor = comment_store.page(task['_id'], request.args)
+        response = jsonify(comments)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response, 200
+    except pagination.PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in get_comments: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/tasks/<task_id>/history', methods=['GET'])
+@jwt_required()
+def get_task_history(task_id):
+    """
+    List who changed a task and how, newest first
+    ---
+    parameters:
+      - name: limit
+        in: query
+        type: integer
+        required: false
+      - name: cursor
+        in: query
+        type: string
+        required: false
+        description: Value of the X-Next-Cursor header from the previous page
+    responses:
+      200:
+        description: One page of audit entries
+    """
+    try:
+        user = identity.resolve(get_jwt_identity())
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        # Admins may also read the history of deleted tasks of their company
+        if user['role'] != 'admin':
+            task = tasks_collection.find_one({'_id': ObjectId(task_id), **visibility_filter(user)}, {'_id': 1})
+            if not task:
+                return jsonify({'error': 'Task not found'}), 404
+        
+        entries, next_cursor = audit_log.page(ObjectId(task_id), user['company_code'], request.args)
+        response = jsonify(entries)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response, 200
+    except pagination.PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in get_task_history: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/admin/import/<kind>', methods=['POST'])
+@jwt_required()
+def admin_import(kind):
+    """
+    Import users or tasks from a CSV or NDJSON file, in the background
+    ---
+    parameters:
+      - name: kind
+        in: path
+        type: string
+        enum: [users, tasks]
+        required: true
+      - name: file
+        in: formData
+        type: file
+        required: false
+        description: The file; alternatively send it as the request body
+      - name: format
+        in: query
+        type: string
+        enum: [csv, ndjson]
+        required: false
+        description: Defaults to the file extension or content type
+      - name: allow_admins
+        in: query
+        type: boolean
+        required: false
+        description: Import user rows whose role is admin (users only)
+    responses:
+      202:
+        description: The import was queued; poll the Location header for progress
+      413:
+        description: The file is larger than IMPORT_MAX_BYTES
+    """
+    try:
+        user = identity.resolve(get_jwt_identity())
+        if not user or user.get('role') != 'admin':
+            return jsonify({'error': 'Unauthorized'}), 403
+        if kind not in ('users', 'tasks'):
+            return jsonify({'error': 'Can only import users or tasks'}), 404
+        
+        # Checked before request.files reads a multipart body
+        if request.content_length is not None and request.content_length > IMPORT_MAX_BYTES:
+            raise bulk_import.ImportTooLarge(f'File is larger than {IMPORT_MAX_BYTES} bytes')
+        upload = request.files.get('file')
+        filename = upload.filename if upload else None
+        file_format = bulk_import.detect_format(
+            request.args.get('format'), filename, upload.mimetype if upload else request.mimetype
+        )
+        path = bulk_import.save_upload(upload.stream if upload else request.stream, IMPORT_MAX_BYTES)
+        
+        if kind == 'users':
+            allow_admins = request.args.get('allow_admins', 'false').lower() == 'true'
+            def job(rows, report):
+                bulk_import.import_users(rows, users_collection, import_hasher, user['company_code'], report,
+                                         allow_admins=allow_admins)
+        else:
+            def job(rows, report):
+                bulk_import.import_tasks(rows, users_collection, tasks_collection, user, report,
+                                         on_written=lambda tasks: tasks_written([(None, task) for task in tasks], user))
+        
+        document = import_runner.submit(kind, user, path, file_format, filename, job)
+        response = jsonify(document)
+        response.headers['Location'] = f"/admin/imports/{document['_id']}"
+        return response, 202
+    except bulk_import.ImportTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    except bulk_import.ImportFileError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in admin_import: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/admin/imports/<import_id>', methods=['GET'])
+@jwt_required()
+def admin_get_import(import_id):
+    """
+    Progress of an import
+    ---
+    responses:
+      200:
+        description: Status (queued, running, done or failed) and imported/failed row counts
+    """
+    try:
+        user = identity.resolve(get_jwt_identity())
+        if not user or user.get('role') != 'admin':
+            return jsonify({'error': 'Unauthorized'}), 403
+        
+        document = db['imports'].find_one({'_id': ObjectId(import_id), 'company_code': user['company_code']})
+        if not document:
+            return jsonify({'error': 'Import not found'}), 404
+        return jsonify(document), 200
+    except Exception as e:
+        logger.error(f"Error in admin_get_import: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/admin/imports/<import_id>/report', methods=['GET'])
+@jwt_required()
+def admin_import_report(import_id):
+    """
+    Download the rows of an import that failed, as CSV
+    ---
+    responses:
+      200:
+        description: One line per failed row with its row number, the reason and the row's data
+    """
+    try:
+        user = identity.resolve(get_jwt_identity())
+        if not user or user.get('role') != 'admin':
+            return jsonify({'error': 'Unauthorized'}), 403
+        
+        document = db['imports'].find_one({'_id': ObjectId(import_id), 'company_code': user['company_code']},
+                                          {'_id': 1})
+        if not document:
+            return jsonify({'error': 'Import not found'}), 404
+        
+        failures = db['import_failures'].find({'import_id': document['_id']}).sort('row', 1).batch_size(1000)
+        body = export.csv_table(('row', 'error', 'data'), bulk_import.report_rows(failures))
+        return Response(body, content_type='text/csv; charset=utf-8', headers={
+            'Content-Disposition': f'attachment; filename="import-{import_id}-failures.csv"'
+        })
+    except Exception as e:
+        logger.error(f"Error in admin_import_report: {e}")
+        return jsonify({'error': str(e)}), 500
 
 @app.route('/admin/company', methods=['POST'])
 @jwt_required()
-def create_company():
-    current_user = get_jwt_identity()
-    if current_user['role'] != 'admin':
+@validate_json(CompanySchema, only=('name',))
+def create_company(data):
+    current_user = identity.resolve(get_jwt_identity())
+    if not current_user or current_user['role'] != 'admin':
         return jsonify({'message': 'Unauthorized'}), 403
     
-    data = request.get_json()
     company_code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
     
     company_data = {
@@ -894,7 +1650,7 @@ def create_company():
 def get_admin_company_employees():
     try:
         current_user = get_jwt_identity()
-        user = users_collection.find_one({'_id': ObjectId(current_user)})
+        user = identity.resolve(current_user)
         
         if not user or user['role'] != 'admin':
             return jsonify({'error': 'Unauthorized'}), 403
@@ -904,7 +1660,6 @@ def get_admin_company_employees():
             'company_code': user['company_code'],
             'role': 'user'
         }))
-        print(employees)
         
         # Convert ObjectId to string and remove sensitive data
         for employee in employees:
@@ -924,34 +1679,100 @@ def admin_delete_task(task_id):
         logger.info(f"Attempting to delete task with ID: {task_id}")
         
         current_user = get_jwt_identity()
-        user = users_collection.find_one({'_id': ObjectId(current_user)})
+        user = identity.resolve(current_user)
         
         if not user or user['role'] != 'admin':
             logger.error(f"Unauthorized delete attempt by user: {current_user}")
             return jsonify({'error': 'Unauthorized'}), 403
         
-        # Get the task
-        task = tasks_collection.find_one({'_id': ObjectId(task_id)})
+        # Delete the task if it belongs to the admin's company
+        task = tasks_collection.find_one_and_delete(
+            at_version({'_id': ObjectId(task_id), **deletable_filter(user)}, expected_version()),
+            projection=pagination.HIDDEN_FIELDS
+        )
         if not task:
-            logger.error(f"Task not found: {task_id}")
-            return jsonify({'error': 'Task not found'}), 404
-        
-        # Verify task belongs to admin's company
-        if task['company_code'] != user['company_code']:
-            logger.error(f"Task company code mismatch: {task['company_code']} != {user['company_code']}")
-            return jsonify({'error': 'Unauthorized to delete this task'}), 403
-        
-        # Delete the task
-        result = tasks_collection.delete_one({'_id': ObjectId(task_id)})
-        
-        if result.deleted_count:
-            logger.info(f"Successfully deleted task: {task_id}")
-            return jsonify({'message': 'Task deleted successfully'}), 200
-        logger.error(f"Failed to delete task: {task_id}")
-        return jsonify({'error': 'Task not found'}), 404
+            logger.error(f"Failed to delete task: {task_id}")
+            return task_write_failed(task_id, user, deletable_filter(user), 'Unauthorized to delete this task')
+        
+        task_written(task, None, user)
+        logger.info(f"Successfully deleted task: {task_id}")
+        return jsonify({'message': 'Task deleted successfully'}), 200
+    except VersionError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error in admin_delete_task: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/metrics', methods=['GET'])
+@limiter.exempt
+def get_metrics():
+    # Prometheus asks for text/plain or OpenMetrics; everyone else gets JSON
+    if instrumentation.wants_prometheus(request.accept_mimetypes, request.args):
+        body, content_type = instrumentation.prometheus_response(metrics.snapshot)
+        return Response(body, content_type=content_type)
+    return jsonify(metrics.snapshot()), 200
+
+# Application factory
+startup = {'pid': os.getpid(), 'import_ms': 0.0, 'init_ms': 0.0}
+metrics.register('startup', lambda: dict(startup))
+_created = False
+
+def configure_logging():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(os.getenv('LOG_FILE', 'app.log')),
+            logging.StreamHandler()
+        ]
+    )
+
+def prepare_database():
+    """Check the connection and create indexes with a client that is closed afterwards."""
+    setup_client, _ = connection.create_client()
+    try:
+        setup_client.server_info()
+        logger.info("Successfully connected to MongoDB!")
+        failed = ensure_indexes(setup_client[db.name])
+        if failed:
+            # The app still starts; queries needing these indexes scan until they are fixed
+            logger.error(f"Missing {len(failed)} index(es) after startup: {', '.join(failed)}")
+    except Exception as e:
+        logger.error(f"Error connecting to MongoDB: {e}")
+        raise
+    finally:
+        # Nothing opened here may survive into forked workers
+        setup_client.close()
+
+def create_app():
+    """
+    Finish setting up the app and return it. Safe to run in the gunicorn
+    master with --preload: no MongoDB client created here outlives the call,
+    and each worker connects on its first query.
+    """
+    global _created
+    if _created:
+        return app
+    started = time.perf_counter()
+    configure_logging()
+    
+    # flasgger is slow to import and only serves /apidocs
+    if os.getenv('SWAGGER_ENABLED', 'true').lower() == 'true':
+        from flasgger import Swagger
+        Swagger(app)
+    
+    if os.getenv('MONGO_PREPARE_ON_START', 'true').lower() == 'true':
+        prepare_database()
+    
+    _created = True
+    startup['pid'] = os.getpid()
+    startup['import_ms'] = (_import_finished - _import_started) * 1000
+    startup['init_ms'] = (time.perf_counter() - started) * 1000
+    logger.info(f"App ready in {startup['import_ms'] + startup['init_ms']:.0f} ms "
+                f"(import {startup['import_ms']:.0f} ms, init {startup['init_ms']:.0f} ms)")
+    return app
+
+_import_finished = time.perf_counter()
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5000) 
\ No newline at end of file
+    create_app().run(debug=True, port=5000) 
\ No newline at end of file
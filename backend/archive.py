@@ -0,0 +1,129 @@
+"""
+Archive tier for completed tasks.
+
+Tasks that have been done for longer than ARCHIVE_AFTER_DAYS are moved from
+tasks_collection into completed_tasks_collection in batches, keeping the hot
+collection (and get_tasks) small. Reads of completed tasks and the analytics
+routes query both tiers, so archiving is invisible to clients; archived
+tasks are read-only.
+
+Run once from cron with `python archive.py`, or set ARCHIVE_INTERVAL_SECONDS
+to run it periodically inside each worker (the job is idempotent).
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from pymongo import ReplaceOne
+
+import pagination
+from queries import at_version
+
+logger = logging.getLogger(__name__)
+
+
+def archive_completed(tasks_collection, archive_collection, older_than, batch_size=500):
+    """Move tasks completed before now - older_than to the archive. Returns the number moved."""
+    cutoff = datetime.utcnow() - older_than
+    moved = 0
+    while True:
+        batch = list(tasks_collection.find(
+            {'status': 'done', 'completed_at': {'$lt': cutoff}}
+        ).limit(batch_size))
+        if not batch:
+            return moved
+
+        # Upserts keep a rerun after a crash from duplicating anything
+        archive_collection.bulk_write(
+            [ReplaceOne({'_id': task['_id']}, task, upsert=True) for task in batch],
+            ordered=False
+        )
+
+        # Each task is only removed if it is still the version that was copied.
+        # One that was edited, reopened or deleted meanwhile keeps its hot state
+        # and the archived copy is dropped; the next run picks it up again.
+        stale = []
+        for task in batch:
+            result = tasks_collection.delete_one(
+                at_version({'_id': task['_id'], 'status': 'done'}, task.get('version') or 0)
+            )
+            if result.deleted_count:
+                moved += 1
+            else:
+                stale.append(task['_id'])
+        if stale:
+            archive_collection.delete_many({'_id': {'$in': stale}})
+        if len(batch) < batch_size:
+            return moved
+
+
+def tier_reads(tasks_collection, archive_collection, query, args=None, sort=pagination.DEFAULT_SORT):
+    """
+    Completed-task reads across both tiers: (cursors, merge). The cursors may
+    be PyMongo or Motor ones; merge(results) takes each cursor's documents
+    and returns (tasks, next_cursor) in `sort` order. With pagination
+    arguments each tier is read with the same keyset and the pages are
+    merged, so cursors keep working across the boundary.
+    """
+    limit = None
+    projection = pagination.HIDDEN_FIELDS
+    if args is not None and pagination.is_requested(args):
+        query, projection, limit = pagination.page_query(query, args, sort)
+
+    cursors = []
+    for collection in (tasks_collection, archive_collection):
+        cursor = collection.find(query, projection)
+        if limit is not None:
+            cursor = cursor.sort(pagination.sort_order(sort)).limit(limit + 1)
+        cursors.append(cursor)
+
+    def merge(results):
+        tasks = pagination.sort_tasks([task for tier in results for task in tier], sort)
+        if limit is None:
+            return tasks, None
+        return pagination.finish_page(tasks[:limit + 1], limit, args, sort)
+
+    return cursors, merge
+
+
+def find_both_tiers(tasks_collection, archive_collection, query, args=None, sort=pagination.DEFAULT_SORT):
+    """Completed-task reads across both tiers: (tasks, next_cursor), see tier_reads."""
+    cursors, merge = tier_reads(tasks_collection, archive_collection, query, args, sort)
+    return merge([list(cursor) for cursor in cursors])
+
+
+class ArchiveScheduler(threading.Thread):
+
+    def __init__(self, tasks_collection, archive_collection, older_than, interval):
+        super().__init__(name='task-archiver', daemon=True)
+        self.tasks_collection = tasks_collection
+        self.archive_collection = archive_collection
+        self.older_than = older_than
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                moved = archive_completed(self.tasks_collection, self.archive_collection, self.older_than)
+                if moved:
+                    logger.info(f"Archived {moved} completed task(s)")
+            except Exception as e:
+                logger.error(f"Error archiving completed tasks: {e}")
+
+
+if __name__ == '__main__':
+    import os
+    from dotenv import load_dotenv
+
+    import connection
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    db = connection.command_line_database()
+    days = int(os.getenv('ARCHIVE_AFTER_DAYS', '30'))
+    moved = archive_completed(db['tasks'], db['completed_tasks'], timedelta(days=days))
+    print(f"Archived {moved} task(s) completed more than {days} day(s) ago")
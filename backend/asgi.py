@@ -0,0 +1,252 @@
+"""
+Async serving mode.
+
+    uvicorn asgi:application --workers 4
+
+The read-heavy routes in ASYNC_ROUTES are served natively on the event loop
+using Motor, so a slow aggregation no longer pins a worker. Everything else
+goes to the Flask app in app.py, run in a thread pool through a2wsgi. That
+includes writes, auth and any request these handlers cannot authenticate.
+Responses are encoded with Flask's own JSON provider, so both modes return
+identical JSON.
+
+The async routes keep the layers Flask applies around the same views:
+
+* rate limits: the caller's RATELIMIT_DEFAULT limits and the company quota
+  are counted in the Flask app's limiter storage under the same keys, so a
+  caller has one budget whichever mode serves the request.
+* response cache: /analytics/tasks shares the Flask app's cache entries and
+  invalidation tags.
+* instrumentation: request latency is recorded on /metrics and as a span.
+  Motor's commands are not attributed to the request.
+"""
+import asyncio
+import logging
+import os
+import time
+from urllib.parse import parse_qsl
+
+from a2wsgi import WSGIMiddleware
+from flask_jwt_extended import decode_token
+from limits import parse_many
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import app as wsgi
+import archive
+import connection
+import instrumentation
+import listing
+import metrics
+import pagination
+import rate_limits
+from analytics import company_pipeline, rollup_to_analytics, shape_company_analytics
+from identity import AsyncIdentityResolver
+from queries import active_tasks_query, completed_tasks_query, admin_tasks_query
+
+logger = logging.getLogger(__name__)
+
+flask_app = wsgi.create_app()
+fallback = WSGIMiddleware(flask_app, workers=int(os.getenv('ASGI_WSGI_THREADS', '10')))
+
+motor_client, motor_pool = connection.create_client(client_class=AsyncIOMotorClient)
+db = motor_client[os.getenv('MONGODB_DB', 'task_manager')]
+tasks_collection = db['tasks']
+archive_collection = db['completed_tasks']
+users_collection = db['users']
+# Reporting routes may read from secondaries
+reporting_tasks = connection.for_reporting(tasks_collection)
+reporting_archive = connection.for_reporting(archive_collection)
+metrics.register('motor_pool', motor_pool.stats)
+identity = AsyncIdentityResolver(users_collection, wsgi.identity.cache)
+
+
+async def current_user(headers):
+    """Resolve the bearer token like @jwt_required(); None means let Flask answer."""
+    auth = headers.get('authorization', '')
+    if not auth.startswith('Bearer '):
+        return None
+    try:
+        with flask_app.app_context():
+            claims = decode_token(auth[len('Bearer '):])
+    except Exception:
+        return None
+    return await identity.resolve(claims[flask_app.config['JWT_IDENTITY_CLAIM']])
+
+
+async def task_list(query, args, sort):
+    next_cursor = None
+    if pagination.is_requested(args):
+        query, projection, limit = pagination.page_query(query, args, sort)
+        tasks = await tasks_collection.find(query, projection).sort(pagination.sort_order(sort)).to_list(limit + 1)
+        tasks, next_cursor = pagination.finish_page(tasks, limit, args, sort)
+    else:
+        tasks = await tasks_collection.find(query, pagination.HIDDEN_FIELDS).sort(pagination.sort_order(sort)).to_list(None)
+    headers = {'X-Next-Cursor': next_cursor} if next_cursor else {}
+    return 200, tasks, headers
+
+
+async def get_tasks(user, args):
+    query = listing.filtered(active_tasks_query(user), args, listing.ACTIVE_STATUSES)
+    return await task_list(query, args, listing.sort_key(args))
+
+
+async def get_completed_tasks(user, args):
+    query = listing.filtered(completed_tasks_query(user), args, listing.COMPLETED_STATUSES)
+    cursors, merge = archive.tier_reads(reporting_tasks, reporting_archive, query, args, listing.sort_key(args))
+    tasks, next_cursor = merge([await cursor.to_list(None) for cursor in cursors])
+    headers = {'X-Next-Cursor': next_cursor} if next_cursor else {}
+    return 200, tasks, headers
+
+
+async def get_task_analytics(user, args):
+    analytics = wsgi.analytics
+    if analytics.rollups_collection is not None:
+        rollup = await db[analytics.rollups_collection.name].find_one({'_id': user['company_code']})
+        if rollup is None or rollup.get('building'):
+            loop = asyncio.get_running_loop()
+            return 200, await loop.run_in_executor(None, analytics.company_analytics, user['company_code']), {}
+        return 200, rollup_to_analytics(rollup), {}
+    result = await reporting_tasks.aggregate(
+        company_pipeline(user['company_code'], analytics.archive_name)
+    ).to_list(1)
+    return 200, shape_company_analytics(result[0]), {}
+
+
+async def admin_get_tasks(user, args):
+    if user.get('role') != 'admin':
+        return 403, {'message': 'Unauthorized'}, {}
+    query = listing.filtered(admin_tasks_query(user), args)
+    sort = pagination.sort_order(listing.sort_key(args))
+    tasks = await tasks_collection.find(query, wsgi.ADMIN_TASK_FIELDS).sort(sort).to_list(None)
+    user_map = {}
+    legacy_ids = wsgi.unnamed_assignee_ids(tasks)
+    if legacy_ids:
+        assigned_users = await users_collection.find({'_id': {'$in': legacy_ids}}, {'username': 1}).to_list(None)
+        user_map = {str(u['_id']): u.get('username', 'Unknown') for u in assigned_users}
+    return 200, wsgi.admin_task_rows(tasks, user_map), {}
+
+
+ASYNC_ROUTES = {
+    ('GET', '/tasks'): get_tasks,
+    ('GET', '/tasks/completed'): get_completed_tasks,
+    ('GET', '/analytics/tasks'): get_task_analytics,
+    ('GET', '/admin/tasks'): admin_get_tasks,
+}
+
+# Handler -> timeout, as in the @cache.cached decorators of the Flask views
+CACHED_ROUTES = {
+    get_task_analytics: wsgi.ANALYTICS_CACHE_SECONDS,
+}
+
+DEFAULT_LIMITS = [limit for value in wsgi.RATELIMIT_DEFAULT for limit in parse_many(value)]
+
+
+def rate_limited(user, endpoint):
+    """
+    Count the request like Flask-Limiter and enforce_company_quota do for
+    the Flask view `endpoint`. Returns a 429 (status, body, headers) or None.
+    Blocking when the limiter storage is Redis, so run it in an executor.
+    """
+    strategy = wsgi.limiter.limiter
+    breach = rate_limits.hit(strategy, DEFAULT_LIMITS, f"user:{user['_id']}", endpoint)
+    if breach is not None:
+        limit, retry_after = breach
+        return 429, {'error': f'Rate limit exceeded ({limit})'}, {'Retry-After': str(retry_after)}
+    breach = wsgi.company_quotas.exceeded(strategy, user['company_code'])
+    if breach is not None:
+        limit, retry_after = breach
+        return 429, {'error': f'Company rate limit exceeded ({limit})'}, {'Retry-After': str(retry_after)}
+    return None
+
+
+def encode(body):
+    with flask_app.app_context():
+        response = flask_app.json.response(body)
+    return response.get_data(), response.mimetype
+
+
+async def send_response(send, status, payload, mimetype, extra_headers, origin):
+    headers = [
+        (b'content-type', mimetype.encode('latin-1')),
+        (b'content-length', str(len(payload)).encode('latin-1')),
+    ]
+    for name, value in extra_headers.items():
+        headers.append((name.lower().encode('latin-1'), value.encode('latin-1')))
+    if origin in wsgi.CORS_ORIGINS:
+        headers += [
+            (b'access-control-allow-origin', origin.encode('latin-1')),
+            (b'access-control-allow-credentials', b'true'),
+            (b'access-control-expose-headers', ', '.join(wsgi.CORS_EXPOSE_HEADERS).encode('latin-1')),
+            (b'vary', b'Origin'),
+        ]
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': payload})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            motor_client.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def handle(handler, user, args, full_path):
+    """(status, payload, mimetype, headers) for an authenticated request to `handler`."""
+    loop = asyncio.get_running_loop()
+    if flask_app.config['RATELIMIT_ENABLED']:
+        limited = await loop.run_in_executor(None, rate_limited, user, handler.__name__)
+        if limited is not None:
+            status, body, extra_headers = limited
+            return (status, *encode(body), extra_headers)
+
+    timeout = CACHED_ROUTES.get(handler)
+    key = None
+    if timeout is not None:
+        parts, tags = wsgi.user_cache_scope(user)
+        key, cached = await loop.run_in_executor(
+            None, wsgi.cache.lookup, handler.__name__, full_path, parts, tags
+        )
+        if cached is not None:
+            return cached['status'], cached['body'].encode('utf-8'), cached['mimetype'], {}
+
+    try:
+        status, body, extra_headers = await handler(user, args)
+    except pagination.PaginationError as e:
+        status, body, extra_headers = 400, {'error': str(e)}, {}
+    except Exception as e:
+        logger.error(f"Error in async {handler.__name__}: {e}")
+        status, body, extra_headers = 500, {'error': str(e)}, {}
+    payload, mimetype = encode(body)
+    if timeout is not None:
+        await loop.run_in_executor(
+            None, wsgi.cache.store, key, status, mimetype, payload.decode('utf-8'), timeout
+        )
+    return status, payload, mimetype, extra_headers
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+
+    handler = ASYNC_ROUTES.get((scope.get('method'), scope.get('path'))) if scope['type'] == 'http' else None
+    if handler is not None:
+        started = time.perf_counter()
+        headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope['headers']}
+        user = await current_user(headers)
+        if user is not None:
+            query_string = scope.get('query_string', b'').decode('latin-1')
+            args = {}
+            for key, value in parse_qsl(query_string, keep_blank_values=True):
+                args.setdefault(key, value)  # first value wins, like request.args.get
+            # Same form as Flask's request.full_path, so cache keys match
+            full_path = f"{scope['path']}?{query_string}"
+            status, payload, mimetype, extra_headers = await handle(handler, user, args, full_path)
+            await send_response(send, status, payload, mimetype, extra_headers, headers.get('origin'))
+            instrumentation.record_request(scope['path'], scope['method'], status, time.perf_counter() - started)
+            return
+
+    return await fallback(scope, receive, send)
@@ -0,0 +1,211 @@
+"""
+Audit trail of task writes.
+
+Routes record who changed which task without waiting on MongoDB: entries go
+into a bounded in-process queue and a writer thread stores them with
+insert_many, in batches of up to AUDIT_BATCH_SIZE entries or whatever
+arrived within AUDIT_FLUSH_INTERVAL_MS of the first one. An entry therefore
+shows up in a task's history about one flush interval after the write.
+
+When the database falls behind and AUDIT_MAX_PENDING entries are queued,
+recording blocks the route for at most AUDIT_ENQUEUE_TIMEOUT_MS and then
+drops the entry (counted in the 'dropped' stat) rather than failing a task
+write that already happened. close() flushes what is queued; the app calls
+it at exit, so a graceful worker shutdown loses nothing.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, PyMongoError
+
+import pagination
+from events import event_type
+
+logger = logging.getLogger(__name__)
+
+SORT_ORDER = [('at', -1), ('_id', -1)]
+
+# Fields that change on every write or are internal; not worth auditing
+IGNORED_FIELDS = {'_id', 'search_terms', 'comments', 'comment_count', 'last_comment_at', 'version'}
+
+_FLUSH = object()
+
+
+def changed_fields(before, after):
+    """{field: [old, new]} for every audited field that differs."""
+    fields = (set(before) | set(after)) - IGNORED_FIELDS
+    return {
+        field: [before.get(field), after.get(field)]
+        for field in sorted(fields) if before.get(field) != after.get(field)
+    }
+
+
+def make_entry(before, after, actor, at):
+    task = after or before
+    entry = {
+        'task_id': ObjectId(task['_id']),
+        'company_code': task.get('company_code'),
+        'type': event_type(before, after),
+        'title': task.get('title'),
+        'actor_id': str(actor['_id']) if actor else None,
+        'actor_name': actor.get('username') if actor else None,
+        'at': at
+    }
+    if before is not None and after is not None:
+        entry['changes'] = changed_fields(before, after)
+    return entry
+
+
+class AuditLog:
+
+    def __init__(self, collection, batch_size=500, flush_interval=1.0, max_pending=10000,
+                 enqueue_timeout=0.1, retries=3):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.enqueue_timeout = enqueue_timeout
+        self.retries = retries
+        self._lock = threading.Lock()
+        self._queue = None
+        self._writer = None
+        self._pid = None
+        self._closed = threading.Event()
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+
+    def _ensure_writer(self):
+        # Queues and threads do not survive fork(); every worker gets its own
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._queue = queue.Queue(maxsize=self.max_pending)
+                    self._writer = threading.Thread(target=self._run, args=(self._queue,),
+                                                    name='audit-writer', daemon=True)
+                    self._writer.start()
+                    self._pid = pid
+        return self._queue
+
+    def record(self, changes, actor):
+        """Queue one entry per (before, after) pair; the pairs are those passed to tasks_written."""
+        if self._closed.is_set():
+            return
+        pending = self._ensure_writer()
+        at = datetime.utcnow()
+        for before, after in changes:
+            try:
+                pending.put(make_entry(before, after, actor, at), timeout=self.enqueue_timeout)
+                self.recorded += 1
+            except queue.Full:
+                self.dropped += 1
+                logger.error(f"Audit queue full, dropped entry for task {(after or before)['_id']}")
+
+    def _next_batch(self, pending):
+        """Block for the first entry, then collect more until the batch is full or the interval is up."""
+        try:
+            first = pending.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return [], 0
+        taken = 1
+        if first is _FLUSH:
+            return [], taken
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = pending.get(timeout=remaining)
+            except queue.Empty:
+                break
+            taken += 1
+            if entry is _FLUSH:
+                break
+            batch.append(entry)
+        return batch, taken
+
+    def _write(self, batch):
+        for attempt in range(1, self.retries + 1):
+            try:
+                self.collection.insert_many(batch, ordered=False)
+                self.written += len(batch)
+                self.batches += 1
+                return
+            except BulkWriteError as e:
+                # Some entries made it; retrying would duplicate them
+                inserted = e.details.get('nInserted', 0)
+                self.written += inserted
+                self.dropped += len(batch) - inserted
+                logger.error(f"Audit batch partially written ({inserted}/{len(batch)}): {e}")
+                return
+            except PyMongoError as e:
+                logger.error(f"Audit batch write failed (attempt {attempt}/{self.retries}): {e}")
+                if attempt < self.retries:
+                    time.sleep(0.5 * attempt)
+        self.dropped += len(batch)
+
+    def _run(self, pending):
+        while True:
+            batch, taken = self._next_batch(pending)
+            if batch:
+                self._write(batch)
+            for _ in range(taken):
+                pending.task_done()
+            if self._closed.is_set() and pending.empty():
+                return
+
+    def flush(self, timeout=5.0):
+        """Write everything queued so far. Returns False if that took longer than `timeout` seconds."""
+        if self._pid != os.getpid():
+            return True
+        pending = self._queue
+        deadline = time.monotonic() + timeout
+        try:
+            pending.put(_FLUSH, timeout=timeout)
+        except queue.Full:
+            return False
+        with pending.all_tasks_done:
+            while pending.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                pending.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout=5.0):
+        """Stop accepting entries and flush the queue; for shutdown."""
+        flushed = self.flush(timeout)
+        self._closed.set()
+        if not flushed:
+            logger.error(f"Audit log closed with {self._queue.qsize()} entry(ies) unwritten")
+
+    def page(self, task_id, company_code, args):
+        """One page of a task's audit entries, newest first: (entries, next_cursor)."""
+        limit = pagination.parse_limit(args.get('limit'))
+        query = {'task_id': task_id, 'company_code': company_code}
+        if args.get('cursor'):
+            query = pagination.after_cursor(query, args['cursor'], field='at')
+        entries = list(self.collection.find(query).sort(SORT_ORDER).limit(limit + 1))
+        next_cursor = None
+        if len(entries) > limit:
+            entries = entries[:limit]
+            next_cursor = pagination.encode_cursor(entries[-1], field='at')
+        return entries, next_cursor
+
+    def stats(self):
+        return {
+            'pending': self._queue.qsize() if self._pid == os.getpid() else 0,
+            'recorded': self.recorded,
+            'written': self.written,
+            'dropped': self.dropped,
+            'batches': self.batches
+        }
@@ -0,0 +1,296 @@
+"""
+Latency benchmark for the main API routes.
+
+Seeds a database with synthetic companies, users and tasks, then drives
+/auth/login, /tasks, /tasks/completed, /tasks/search, /analytics/tasks and
+/admin/tasks in turn at a fixed concurrency. For each route it reports
+throughput and p50/p95/p99 latency and writes everything to a JSON file, so
+runs on different commits can be compared.
+
+Self-contained run against an in-memory database (needs `pip install mongomock`):
+
+    python bench.py --in-memory
+
+Against a running server and a real MongoDB, seeding a separate database:
+
+    MONGODB_DB=taskmate_bench RATELIMIT_ENABLED=false gunicorn -c gunicorn.conf.py "app:create_app()" -w 4 -b :5000
+    python bench.py --url http://localhost:5000 --mongo-uri mongodb://localhost:27017/ \
+        --database taskmate_bench --companies 10 --users 50 --tasks 200000
+
+Compare against an earlier result:
+
+    python bench.py --in-memory --compare bench_results/<earlier>.json
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import quote
+
+import bcrypt
+from bson import ObjectId
+
+from bench_serving import percentile
+from indexes import ensure_indexes
+from search import search_terms_for
+
+ROUTES = ['login', 'tasks', 'completed', 'search', 'analytics', 'admin_tasks']
+PASSWORD = 'bench-password'
+WORDS = ['deploy', 'invoice', 'review', 'backend', 'release', 'customer', 'report', 'migrate',
+         'design', 'budget', 'meeting', 'onboarding', 'security', 'audit', 'sprint', 'roadmap']
+
+
+def seed(db, companies, users, tasks, rounds, seed_value=0):
+    """
+    Replace the contents of `db` with synthetic data: per company one admin,
+    `users` regular users and `tasks` tasks. Returns the usernames per role.
+    """
+    rng = random.Random(seed_value)
+    for name in ('users', 'companies', 'tasks', 'completed_tasks', 'comments', 'task_rollups'):
+        db[name].delete_many({})
+
+    # Every account shares one password, so hash it once
+    password = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(rounds=rounds))
+    now = datetime.utcnow()
+    accounts = {'admin': [], 'user': []}
+    for c in range(companies):
+        code = f'BENCH{c:04d}'
+        admin_id = ObjectId()
+        people = [{'_id': admin_id, 'username': f'admin{c}', 'email': f'admin{c}@bench.local',
+                   'password': password, 'role': 'admin', 'company_code': code}]
+        people += [{'_id': ObjectId(), 'username': f'user{c}_{u}', 'email': f'user{c}_{u}@bench.local',
+                    'password': password, 'role': 'user', 'company_code': code} for u in range(users)]
+        db['users'].insert_many(people)
+        db['companies'].insert_one({'name': f'Bench {c}', 'code': code, 'created_by': str(admin_id)})
+        for person in people:
+            accounts[person['role']].append(person['username'])
+
+        members = [str(person['_id']) for person in people[1:]] or [str(admin_id)]
+        batch = []
+        for t in range(tasks):
+            created_at = now - timedelta(minutes=rng.randint(0, 60 * 24 * 180))
+            status = rng.choice(['todo', 'in_progress', 'done'])
+            task = {
+                'title': ' '.join(rng.sample(WORDS, 3)),
+                'description': ' '.join(rng.sample(WORDS, 6)),
+                'status': status,
+                'priority': rng.choice(['low', 'medium', 'high']),
+                'category': rng.choice(['work', 'ops', 'sales']),
+                'due_date': created_at + timedelta(days=rng.randint(1, 30)),
+                'created_at': created_at,
+                'created_by': str(admin_id),
+                'assigned_to': rng.choice(members),
+                'company_code': code,
+            }
+            if status == 'done':
+                task['completed_at'] = created_at + timedelta(hours=rng.randint(1, 240))
+            task['search_terms'] = search_terms_for(task)
+            batch.append(task)
+            if len(batch) == 1000:
+                db['tasks'].insert_many(batch)
+                batch = []
+        if batch:
+            db['tasks'].insert_many(batch)
+    return accounts
+
+
+def login(base_url, username):
+    body = json.dumps({'username': username, 'password': PASSWORD}).encode('utf-8')
+    request = urllib.request.Request(base_url + '/auth/login', data=body,
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=60) as response:
+        return json.loads(response.read())['access_token']
+
+
+def route_requests(route, accounts, tokens, rng):
+    """Build (method, path, body, headers) for one request to `route`."""
+    if route == 'login':
+        username = rng.choice(accounts['user'] or accounts['admin'])
+        body = json.dumps({'username': username, 'password': PASSWORD}).encode('utf-8')
+        return 'POST', '/auth/login', body, {'Content-Type': 'application/json'}
+
+    role = 'admin' if route in ('analytics', 'admin_tasks') or not tokens['user'] else 'user'
+    headers = {'Authorization': 'Bearer ' + rng.choice(tokens[role])}
+    path = {
+        'tasks': '/tasks',
+        'completed': '/tasks/completed',
+        'search': '/tasks/search?q=' + quote(rng.choice(WORDS) + ' ' + rng.choice(WORDS)[:3]),
+        'analytics': '/analytics/tasks',
+        'admin_tasks': '/admin/tasks',
+    }[route]
+    return 'GET', path, None, headers
+
+
+def drive(base_url, requests, concurrency):
+    """Send the prepared requests at a fixed concurrency and summarise the latencies."""
+    def one(spec):
+        method, path, body, headers = spec
+        request = urllib.request.Request(base_url + path, data=body, headers=headers, method=method)
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read()
+                ok = response.status == 200
+        except (urllib.error.URLError, OSError):
+            ok = False
+        return time.perf_counter() - start, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, requests))
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency * 1000 for latency, ok in results if ok]
+    return {
+        'requests': len(results),
+        'errors': len(results) - len(latencies),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'max_ms': round(max(latencies), 2) if latencies else 0.0,
+    }
+
+
+def start_in_memory_server(database, bcrypt_rounds):
+    """
+    Import the app against mongomock and serve it from a background thread.
+    mongomock is far slower than MongoDB and not fully thread-safe, so these
+    numbers are only comparable with other in-memory runs.
+    """
+    try:
+        import mongomock
+    except ImportError:
+        raise SystemExit('--in-memory needs mongomock: pip install mongomock')
+    import pymongo
+    from werkzeug.serving import make_server
+
+    pymongo.MongoClient = mongomock.MongoClient
+    os.environ['MONGODB_DB'] = database
+    os.environ['RATELIMIT_ENABLED'] = 'false'
+    # Seeded hashes must use the app's cost, or every login would also rehash
+    os.environ['BCRYPT_ROUNDS'] = str(bcrypt_rounds)
+    os.environ.setdefault('EVENTS_BACKEND', 'local')
+    # mongomock has no $text, so search runs on the in-process index
+    os.environ.setdefault('SEARCH_BACKEND', 'memory')
+    # nor $unionWith, so analytics is served from rollups
+    os.environ.setdefault('ANALYTICS_ROLLUPS', 'true')
+
+    import app as flask_app
+    server = make_server('127.0.0.1', 0, flask_app.create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', flask_app.db, server
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(results, baseline=None):
+    print(f"{'route':<12} {'req/s':>9} {'p50':>10} {'p95':>10} {'p99':>10} {'errors':>7}")
+    for route, r in results.items():
+        line = (f"{route:<12} {r['rps']:>9.1f} {r['p50_ms']:>8.1f}ms {r['p95_ms']:>8.1f}ms "
+                f"{r['p99_ms']:>8.1f}ms {r['errors']:>7}")
+        before = (baseline or {}).get(route)
+        if before and before['p95_ms']:
+            line += f"   p95 {100 * (r['p95_ms'] - before['p95_ms']) / before['p95_ms']:+.0f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the task API routes')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--in-memory', action='store_true', help='serve the app in-process on mongomock')
+    target.add_argument('--url', help='base URL of a running server')
+    parser.add_argument('--mongo-uri', default=os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'),
+                        help='MongoDB the running server uses (with --url)')
+    parser.add_argument('--database', default='taskmate_bench',
+                        help='database to seed; it is emptied first')
+    parser.add_argument('--no-seed', action='store_true', help='reuse data from a previous run')
+    parser.add_argument('--companies', type=int, default=3)
+    parser.add_argument('--users', type=int, default=10, help='regular users per company')
+    parser.add_argument('--tasks', type=int, default=2000, help='tasks per company')
+    parser.add_argument('--bcrypt-rounds', type=int, default=int(os.getenv('BCRYPT_ROUNDS', '12')),
+                        help="cost of the seeded password hashes; match the server's BCRYPT_ROUNDS")
+    parser.add_argument('--routes', default=','.join(ROUTES), help='comma separated subset of ' + ','.join(ROUTES))
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=500, help='requests per route')
+    parser.add_argument('--output', help='result file (default bench_results/<time>-<commit>.json)')
+    parser.add_argument('--compare', help='earlier result file to compare p95 latency with')
+    args = parser.parse_args()
+
+    routes = [route.strip() for route in args.routes.split(',') if route.strip()]
+    unknown = set(routes) - set(ROUTES)
+    if unknown:
+        parser.error(f"Unknown route(s): {', '.join(sorted(unknown))}")
+
+    if args.in_memory:
+        base_url, db, server = start_in_memory_server(args.database, args.bcrypt_rounds)
+    else:
+        from pymongo import MongoClient
+        base_url, server = args.url.rstrip('/'), None
+        db = MongoClient(args.mongo_uri)[args.database]
+
+    started = time.perf_counter()
+    if args.no_seed:
+        accounts = {role: [u['username'] for u in db['users'].find({'role': role}, {'username': 1})]
+                    for role in ('admin', 'user')}
+    else:
+        accounts = seed(db, args.companies, args.users, args.tasks, args.bcrypt_rounds)
+        ensure_indexes(db)
+    print(f"Seeded in {time.perf_counter() - started:.1f}s: {len(accounts['admin'])} companies, "
+          f"{len(accounts['user'])} users, {db['tasks'].estimated_document_count()} tasks")
+
+    rng = random.Random(1)
+    tokens = {role: [login(base_url, name) for name in names[:20]] for role, names in accounts.items()}
+
+    results = {}
+    for route in routes:
+        requests = [route_requests(route, accounts, tokens, rng) for _ in range(args.requests)]
+        # Warm caches and connections so the first requests do not skew the tail
+        drive(base_url, requests[:args.concurrency], args.concurrency)
+        results[route] = drive(base_url, requests, args.concurrency)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['routes']
+    print_table(results, baseline)
+
+    commit = git_commit()
+    report = {
+        'timestamp': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'commit': commit,
+        'target': 'in-memory' if args.in_memory else base_url,
+        'config': {
+            'companies': args.companies, 'users': args.users, 'tasks': args.tasks,
+            'bcrypt_rounds': args.bcrypt_rounds, 'concurrency': args.concurrency,
+            'requests': args.requests
+        },
+        'routes': results
+    }
+    output = args.output or os.path.join(
+        'bench_results', f"{datetime.utcnow():%Y%m%dT%H%M%S}-{commit or 'nogit'}.json"
+    )
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
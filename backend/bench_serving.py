@@ -0,0 +1,83 @@
+"""
+Compare the sync (gunicorn) and async (uvicorn) serving modes.
+
+Start both servers against the same database, e.g.
+
+    gunicorn -c gunicorn.conf.py "app:create_app()" -w 4 -b :5000
+    uvicorn asgi:application --workers 4 --port 8000
+
+then run
+
+    python bench_serving.py --token <jwt> --path /analytics/tasks \
+        --concurrency 200 --requests 5000
+
+Each mode gets the same number of requests at the same concurrency and the
+script prints latency percentiles and throughput side by side.
+"""
+import argparse
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(base_url, path, token, concurrency, total):
+    url = base_url.rstrip('/') + path
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+
+    def one(_):
+        request = urllib.request.Request(url, headers=headers)
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                response.read()
+                ok = response.status == 200
+        except (urllib.error.URLError, OSError):
+            ok = False
+        return time.perf_counter() - start, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency * 1000 for latency, ok in results if ok]
+    return {
+        'ok': len(latencies),
+        'errors': total - len(latencies),
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'mean_ms': statistics.fmean(latencies) if latencies else 0.0,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark sync vs async serving modes')
+    parser.add_argument('--wsgi', default='http://localhost:5000', help='base URL of the gunicorn server')
+    parser.add_argument('--asgi', default='http://localhost:8000', help='base URL of the uvicorn server')
+    parser.add_argument('--path', default='/analytics/tasks')
+    parser.add_argument('--token', default='', help='JWT access token sent as a Bearer header')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'mode':<6} {'ok':>7} {'errors':>7} {'req/s':>9} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for mode, base_url in (('wsgi', args.wsgi), ('asgi', args.asgi)):
+        r = run(base_url, args.path, args.token, args.concurrency, args.requests)
+        print(f"{mode:<6} {r['ok']:>7} {r['errors']:>7} {r['rps']:>9.1f} {r['mean_ms']:>7.1f}ms "
+              f"{r['p50_ms']:>7.1f}ms {r['p95_ms']:>7.1f}ms {r['p99_ms']:>7.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
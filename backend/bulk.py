@@ -0,0 +1,198 @@
+"""
+Helpers for the /tasks/bulk routes.
+
+Each bulk request is validated item by item. Lookups are batched into single
+$in queries and the surviving items are written with one unordered
+bulk_write. The response reports success or failure for every item by its
+position in the request.
+"""
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+MAX_BULK_ITEMS = 10000
+
+# Set on tasks while a bulk request writes them, to tell which writes matched
+WRITE_ID_FIELD = 'bulk_write_id'
+CONFLICT_MESSAGE = 'Task was changed by someone else; reload it and retry'
+
+
+class BulkError(ValueError):
+    """The request as a whole is malformed (as opposed to a single item)."""
+
+
+class BulkResult:
+
+    def __init__(self):
+        self._results = {}
+
+    def ok(self, index, status, **extra):
+        self._results[index] = {'index': index, 'status': status, **extra}
+
+    def fail(self, index, error, **extra):
+        self._results[index] = {'index': index, 'status': 'error', 'error': error, **extra}
+
+    def failed(self, index):
+        return self._results.get(index, {}).get('status') == 'error'
+
+    def to_dict(self):
+        results = [self._results[index] for index in sorted(self._results)]
+        failed = sum(1 for r in results if r['status'] == 'error')
+        return {
+            'results': results,
+            'succeeded': len(results) - failed,
+            'failed': failed
+        }
+
+
+def read_items(data, key):
+    if not isinstance(data, dict) or not isinstance(data.get(key), list):
+        raise BulkError(f'Request body must contain a "{key}" array')
+    items = data[key]
+    if not items:
+        raise BulkError(f'"{key}" must not be empty')
+    if len(items) > MAX_BULK_ITEMS:
+        raise BulkError(f'At most {MAX_BULK_ITEMS} items per request')
+    return items
+
+
+def to_object_id(value):
+    # ObjectId(None) would generate a new id
+    if value is None:
+        return None
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        return None
+
+
+def parse_task_ids(values, result):
+    """
+    Map item index -> ObjectId, failing items whose id is not valid. Repeats
+    of an id fail too, so each task is written at most once per request.
+    """
+    ids = {}
+    seen = set()
+    for index, value in enumerate(values):
+        if result.failed(index):
+            continue
+        task_id = to_object_id(value)
+        if task_id is None:
+            result.fail(index, 'Invalid task id')
+        elif task_id in seen:
+            result.fail(index, 'Duplicate task id')
+        else:
+            seen.add(task_id)
+            ids[index] = task_id
+    return ids
+
+
+def valid_assignees(users_collection, values, company_code):
+    """One $in query for every assignee referenced by a bulk request. Maps user id -> user."""
+    ids = {to_object_id(value) for value in values}
+    ids.discard(None)
+    if not ids:
+        return {}
+    return {
+        str(user['_id']): user for user in users_collection.find(
+            {'_id': {'$in': list(ids)}, 'company_code': company_code}, {'username': 1}
+        )
+    }
+
+
+def execute(collection, operations, result, status, extras=None):
+    """
+    Run (item index, write operation) pairs as one unordered bulk_write and
+    record each item's outcome. Returns the indexes that were written.
+    """
+    if not operations:
+        return []
+    errors = {}
+    try:
+        collection.bulk_write([op for _, op in operations], ordered=False)
+    except BulkWriteError as e:
+        for error in e.details.get('writeErrors', []):
+            errors[operations[error['index']][0]] = error.get('errmsg', 'Write failed')
+
+    written = []
+    for index, _ in operations:
+        if index in errors:
+            result.fail(index, errors[index])
+        else:
+            result.ok(index, status, **(extras or {}).get(index, {}))
+            written.append(index)
+    return written
+
+
+def execute_conditional(collection, writes, result, status, allowed, unauthorized_message,
+                        extras=None, delete=False):
+    """
+    Run (item index, filter, update) writes on existing tasks as one unordered
+    bulk_write and record each item's outcome. Returns the indexes written.
+
+    Each filter carries the route's permission and version checks, so a task
+    changed, reassigned or deleted since it was read matches nothing.
+    bulk_write only counts matches for the whole batch, so every write also
+    stamps the task with an id for this request; when the count falls short,
+    the stamp tells which items were written. Deletes are stamped (bumping the
+    version, so later conditional writes fail) and then removed by stamp.
+    Items that matched nothing fail like the single-task routes would.
+    """
+    if not writes:
+        return []
+    write_id = ObjectId()
+    operations = []
+    for index, query, update in writes:
+        update = {**update, '$set': {**update.get('$set', {}), WRITE_ID_FIELD: write_id}}
+        operations.append((index, UpdateOne(query, update)))
+    ids = {index: query['_id'] for index, query, _ in writes}
+
+    errors = {}
+    try:
+        matched = collection.bulk_write([op for _, op in operations], ordered=False).matched_count
+    except BulkWriteError as e:
+        matched = e.details.get('nMatched', 0)
+        for error in e.details.get('writeErrors', []):
+            errors[operations[error['index']][0]] = error.get('errmsg', 'Write failed')
+
+    if matched == len(ids) - len(errors):
+        stamped = set(ids) - set(errors)
+    else:
+        found = {task['_id'] for task in collection.find(
+            {'_id': {'$in': list(ids.values())}, WRITE_ID_FIELD: write_id}, {'_id': 1}
+        )}
+        stamped = {index for index, task_id in ids.items() if task_id in found}
+    if stamped:
+        if delete:
+            collection.delete_many({WRITE_ID_FIELD: write_id})
+        else:
+            collection.update_many({WRITE_ID_FIELD: write_id}, {'$unset': {WRITE_ID_FIELD: ''}})
+
+    missed = {index: task_id for index, task_id in ids.items() if index not in stamped and index not in errors}
+    current = {}
+    in_company = set()
+    if missed:
+        current = {task['_id']: task for task in collection.find(
+            {'_id': {'$in': list(missed.values())}, **allowed}, {'version': 1}
+        )}
+        in_company = {task['_id'] for task in collection.find(
+            {'_id': {'$in': list(missed.values())}, 'company_code': allowed['company_code']}, {'_id': 1}
+        )}
+
+    written = []
+    for index in ids:
+        if index in errors:
+            result.fail(index, errors[index])
+        elif index in missed:
+            task_id = missed[index]
+            if task_id in current:
+                result.fail(index, CONFLICT_MESSAGE, version=current[task_id].get('version', 0))
+            elif task_id in in_company:
+                result.fail(index, unauthorized_message)
+            else:
+                result.fail(index, 'Task not found')
+        else:
+            result.ok(index, status, **(extras or {}).get(index, {}))
+            written.append(index)
+    return written
@@ -0,0 +1,462 @@
+"""
+Bulk import of users and tasks from CSV or NDJSON files.
+
+A file is read as a stream and handled CHUNK_SIZE rows at a time:
+
+1. every row is validated with UserSchema / TaskSchema;
+2. one $in query per chunk checks usernames and emails against existing
+   users, or resolves the assignees of the tasks;
+3. user passwords are hashed across a process pool (PasswordHasher.hash_many);
+4. the valid rows are written with one unordered insert_many.
+
+Rows that fail any step go to a report with their row number and the
+reason; passwords are never copied into it. Imports run in the background
+(ImportRunner) and their failures are stored in import_failures for
+download, or written to a CSV file when run from the command line:
+
+    python bulk_import.py users people.csv --company ACME --report failures.csv
+    python bulk_import.py tasks backlog.ndjson --company ACME --admin alice
+
+Task rows name their assignee by user id ('assigned_to') or username
+('assignee'). Empty CSV cells count as missing. User rows default to the
+'user' role; rows asking for 'admin' fail unless admins were explicitly
+allowed (--allow-admins, or ?allow_admins=true on the upload route).
+"""
+import csv
+import json
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from bson import ObjectId
+from marshmallow import EXCLUDE, ValidationError
+from pymongo.errors import BulkWriteError
+
+import names
+import search
+from bulk import to_object_id
+from schemas import TaskSchema, UserSchema
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('csv', 'ndjson')
+CONTENT_TYPES = {'text/csv': 'csv', 'application/x-ndjson': 'ndjson', 'application/jsonl': 'ndjson'}
+CHUNK_SIZE = 500
+REQUIRED_TASK_FIELDS = ('title', 'description', 'due_date', 'priority')
+DUPLICATE_KEY = 11000
+
+# Files exported by /admin/tasks/export carry extra columns; they are ignored
+user_schema = UserSchema(unknown=EXCLUDE)
+task_schema = TaskSchema(unknown=EXCLUDE)
+
+
+class ImportFileError(ValueError):
+    pass
+
+
+class ImportTooLarge(ImportFileError):
+    pass
+
+
+def detect_format(requested=None, filename=None, content_type=None):
+    if requested:
+        if requested not in FORMATS:
+            raise ImportFileError(f"format must be one of: {', '.join(FORMATS)}")
+        return requested
+    extension = os.path.splitext(filename or '')[1].lstrip('.').lower()
+    if extension in ('csv', 'ndjson', 'jsonl'):
+        return 'ndjson' if extension == 'jsonl' else extension
+    if content_type in CONTENT_TYPES:
+        return CONTENT_TYPES[content_type]
+    raise ImportFileError('Cannot tell the file format; pass ?format=csv or ?format=ndjson')
+
+
+def read_rows(stream, file_format):
+    """Yield (row number, row, error) from a binary stream; row numbers start at 1 for the first data row."""
+    text = (line.decode('utf-8-sig') if isinstance(line, bytes) else line for line in stream)
+    if file_format == 'csv':
+        for number, row in enumerate(csv.DictReader(text), start=1):
+            yield number, {key: value for key, value in row.items() if key and value not in ('', None)}, None
+        return
+    number = 0
+    for line in text:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield number, {}, 'Invalid JSON'
+            continue
+        if isinstance(row, dict):
+            yield number, row, None
+        else:
+            yield number, {}, 'Row must be a JSON object'
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def format_error(error):
+    """Marshmallow messages ({'field': ['msg']}) as one line."""
+    if isinstance(error, dict):
+        return '; '.join(f"{field}: {' '.join(map(str, messages)) if isinstance(messages, list) else messages}"
+                         for field, messages in error.items())
+    return str(error)
+
+
+def _insert(collection, entries, report):
+    """insert_many the (row number, row, document) entries; returns the documents written."""
+    if not entries:
+        return []
+    errors = {}
+    try:
+        collection.insert_many([document for _, _, document in entries], ordered=False)
+    except BulkWriteError as e:
+        errors = {error['index']: error for error in e.details.get('writeErrors', [])}
+    written = []
+    for index, (number, row, document) in enumerate(entries):
+        if index in errors:
+            error = errors[index]
+            report.fail(number, 'Already exists' if error.get('code') == DUPLICATE_KEY
+                        else error.get('errmsg', 'Write failed'), row)
+        else:
+            written.append(document)
+    report.imported += len(written)
+    return written
+
+
+def import_users(rows, users_collection, hasher, company_code, report, chunk_size=CHUNK_SIZE,
+                 allow_admins=False):
+    """Create users (registration complete) in `company_code`; admins only if `allow_admins`."""
+    seen_usernames, seen_emails = set(), set()
+    for chunk in _chunks(rows, chunk_size):
+        valid = []
+        for number, row, error in chunk:
+            if error:
+                report.fail(number, error, row)
+                continue
+            try:
+                user = user_schema.load({'role': 'user', 'company_code': company_code, **row})
+            except ValidationError as e:
+                report.fail(number, format_error(e.messages), row)
+                continue
+            if user['company_code'] != company_code:
+                report.fail(number, f'company_code must be {company_code}', row)
+            elif user['role'] != 'user' and not allow_admins:
+                report.fail(number, 'role must be user; admins can only be imported when explicitly allowed', row)
+            elif user['username'] in seen_usernames:
+                report.fail(number, 'Duplicate username in file', row)
+            elif user['email'] in seen_emails:
+                report.fail(number, 'Duplicate email in file', row)
+            else:
+                seen_usernames.add(user['username'])
+                seen_emails.add(user['email'])
+                valid.append((number, row, user))
+
+        if valid:
+            taken = list(users_collection.find({'$or': [
+                {'username': {'$in': [user['username'] for _, _, user in valid]}},
+                {'email': {'$in': [user['email'] for _, _, user in valid]}}
+            ]}, {'username': 1, 'email': 1}))
+            taken_usernames = {user.get('username') for user in taken}
+            taken_emails = {user.get('email') for user in taken}
+            available = []
+            for number, row, user in valid:
+                if user['username'] in taken_usernames:
+                    report.fail(number, 'Username already exists', row)
+                elif user['email'] in taken_emails:
+                    report.fail(number, 'Email already exists', row)
+                else:
+                    available.append((number, row, user))
+            valid = available
+
+        hashes = hasher.hash_many([user['password'] for _, _, user in valid])
+        now = datetime.utcnow()
+        entries = [(number, row, {
+            'username': user['username'],
+            'email': user['email'],
+            'password': hashed,
+            'role': user['role'],
+            'company_code': company_code,
+            'registration_complete': True,
+            'created_at': now
+        }) for (number, row, user), hashed in zip(valid, hashes)]
+        _insert(users_collection, entries, report)
+        report.flush()
+
+
+def import_tasks(rows, users_collection, tasks_collection, admin, report, on_written=None,
+                 chunk_size=CHUNK_SIZE):
+    """Create tasks in the admin's company, created by the admin. `on_written` gets each chunk's new tasks."""
+    company_code = admin['company_code']
+    for chunk in _chunks(rows, chunk_size):
+        parsed = []
+        for number, row, error in chunk:
+            if error:
+                report.fail(number, error, row)
+                continue
+            try:
+                task = task_schema.load(row)
+            except ValidationError as e:
+                report.fail(number, format_error(e.messages), row)
+                continue
+            missing = [field for field in REQUIRED_TASK_FIELDS if task.get(field) is None]
+            if missing:
+                report.fail(number, f'Missing required field: {missing[0]}', row)
+                continue
+            parsed.append((number, row, task))
+
+        # One query for every assignee the chunk refers to
+        ids = {to_object_id(row['assigned_to']) for _, row, _ in parsed if row.get('assigned_to')}
+        ids.discard(None)
+        usernames = {str(row['assignee']) for _, row, _ in parsed if row.get('assignee')}
+        by_id, by_username = {}, {}
+        if ids or usernames:
+            for user in users_collection.find({
+                'company_code': company_code,
+                '$or': [{'_id': {'$in': list(ids)}}, {'username': {'$in': list(usernames)}}]
+            }, {'username': 1}):
+                by_id[str(user['_id'])] = user
+                by_username[user['username']] = user
+
+        now = datetime.utcnow()
+        entries = []
+        for number, row, task in parsed:
+            document = {
+                '_id': ObjectId(),
+                'title': task['title'],
+                'description': task['description'],
+                'due_date': task['due_date'],
+                'priority': task['priority'],
+                'status': task.get('status', 'todo'),
+                'company_code': company_code,
+                **names.creator_names(admin),
+                'created_at': now,
+                'version': 1
+            }
+            if task.get('category'):
+                document['category'] = task['category']
+            if document['status'] == 'done':
+                document['completed_at'] = now
+            if row.get('assigned_to') or row.get('assignee'):
+                assignee = (by_id.get(str(row['assigned_to'])) if row.get('assigned_to')
+                            else by_username.get(str(row['assignee'])))
+                if not assignee:
+                    report.fail(number, 'Invalid user assignment', row)
+                    continue
+                document.update(names.assignee_names(assignee))
+            document['search_terms'] = search.search_terms_for(document)
+            entries.append((number, row, document))
+
+        written = _insert(tasks_collection, entries, report)
+        if written and on_written:
+            on_written(written)
+        report.flush()
+
+
+class Report:
+    """Counts and failed rows of one import. Subclasses decide where failures go on flush()."""
+
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self._pending = []
+
+    def fail(self, number, error, row):
+        self.failed += 1
+        self._pending.append({
+            'row': number,
+            'error': error,
+            'data': {key: value for key, value in row.items() if key != 'password'}
+        })
+
+    def flush(self):
+        self._pending = []
+
+
+class FileReport(Report):
+    """Writes failures to a CSV file (command line imports)."""
+
+    def __init__(self, path):
+        super().__init__()
+        self._file = open(path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(('row', 'error', 'data'))
+
+    def flush(self):
+        for failure in self._pending:
+            self._writer.writerow((failure['row'], failure['error'], json.dumps(failure['data'], default=str)))
+        super().flush()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+
+class MongoReport(Report):
+    """Stores failures in import_failures and progress on the import document."""
+
+    def __init__(self, imports_collection, failures_collection, import_id):
+        super().__init__()
+        self.imports_collection = imports_collection
+        self.failures_collection = failures_collection
+        self.import_id = import_id
+
+    def flush(self):
+        if self._pending:
+            now = datetime.utcnow()
+            self.failures_collection.insert_many([
+                {'import_id': self.import_id, 'created_at': now, **failure} for failure in self._pending
+            ], ordered=False)
+        self.imports_collection.update_one(
+            {'_id': self.import_id},
+            {'$set': {'imported': self.imported, 'failed': self.failed}}
+        )
+        super().flush()
+
+
+def save_upload(stream, max_bytes=None):
+    """
+    Copy an upload to a temporary file the background import can read after
+    the request ends. Raises ImportTooLarge past `max_bytes`.
+    """
+    handle, path = tempfile.mkstemp(prefix='taskmate-import-')
+    size = 0
+    try:
+        with os.fdopen(handle, 'wb') as file:
+            while True:
+                block = stream.read(1024 * 1024)
+                if not block:
+                    break
+                size += len(block)
+                if max_bytes is not None and size > max_bytes:
+                    raise ImportTooLarge(f'File is larger than {max_bytes} bytes')
+                file.write(block)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def report_rows(failures):
+    """Stored failures as CSV cells: row, error, data (JSON)."""
+    for failure in failures:
+        yield [failure['row'], failure['error'], json.dumps(failure.get('data', {}), default=str)]
+
+
+class ImportRunner:
+    """
+    Runs imports in background threads, at most `max_running` at a time per
+    worker process; the rest wait as 'queued'.
+    """
+
+    def __init__(self, imports_collection, failures_collection, max_running=1):
+        self.imports_collection = imports_collection
+        self.failures_collection = failures_collection
+        self.max_running = max_running
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _pool(self):
+        # Threads do not survive fork(); every worker gets its own
+        with self._lock:
+            if self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_running,
+                                                    thread_name_prefix='import')
+                self._pid = os.getpid()
+            return self._executor
+
+    def submit(self, kind, user, path, file_format, filename, job):
+        """
+        Queue `job(rows, report)` over the rows of the file at `path`, which
+        is deleted afterwards. Returns the import document.
+        """
+        document = {
+            '_id': ObjectId(),
+            'kind': kind,
+            'status': 'queued',
+            'company_code': user['company_code'],
+            'created_by': str(user['_id']),
+            'filename': filename,
+            'format': file_format,
+            'imported': 0,
+            'failed': 0,
+            'created_at': datetime.utcnow()
+        }
+        self.imports_collection.insert_one(document)
+        self._pool().submit(self._run, document['_id'], path, file_format, job)
+        return document
+
+    def _run(self, import_id, path, file_format, job):
+        report = MongoReport(self.imports_collection, self.failures_collection, import_id)
+        self.imports_collection.update_one({'_id': import_id}, {'$set': {'status': 'running'}})
+        status, error = 'done', None
+        try:
+            with open(path, 'rb') as file:
+                job(read_rows(file, file_format), report)
+        except Exception as e:
+            logger.error(f"Import {import_id} failed: {e}")
+            status, error = 'failed', str(e)
+        finally:
+            os.remove(path)
+        report.flush()
+        self.imports_collection.update_one({'_id': import_id}, {'$set': {
+            'status': status,
+            'error': error,
+            'finished_at': datetime.utcnow()
+        }})
+
+
+if __name__ == '__main__':
+    import argparse
+    from dotenv import load_dotenv
+
+    import connection
+
+    from passwords import PasswordHasher
+
+    parser = argparse.ArgumentParser(description='Import users or tasks from a CSV or NDJSON file')
+    parser.add_argument('kind', choices=('users', 'tasks'))
+    parser.add_argument('file')
+    parser.add_argument('--company', required=True, help='company code')
+    parser.add_argument('--admin', help='username of the admin creating the tasks (tasks only)')
+    parser.add_argument('--format', choices=FORMATS)
+    parser.add_argument('--report', default='import-failures.csv', help='CSV file for the rows that failed')
+    parser.add_argument('--allow-admins', action='store_true', help="import rows whose role is 'admin'")
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    db = connection.command_line_database()
+    report = FileReport(args.report)
+    with open(args.file, 'rb') as file:
+        rows = read_rows(file, detect_format(args.format, args.file))
+        if args.kind == 'users':
+            hasher = PasswordHasher(rounds=int(os.getenv('BCRYPT_ROUNDS', '12')), workers=os.cpu_count() or 1)
+            import_users(rows, db['users'], hasher, args.company, report, allow_admins=args.allow_admins)
+            hasher.shutdown()
+        else:
+            admin = db['users'].find_one({'username': args.admin, 'company_code': args.company, 'role': 'admin'})
+            if not admin:
+                parser.error('--admin must name an admin of the company')
+            import_tasks(rows, db['users'], db['tasks'], admin, report)
+            # The running app updates rollups as it writes; a direct import has to rebuild them
+            if os.getenv('ANALYTICS_ROLLUPS', 'false').lower() == 'true':
+                from analytics import TaskAnalytics
+                TaskAnalytics(db['tasks'], db['task_rollups'],
+                              archive_collection=db['completed_tasks']).rebuild_rollup(args.company)
+    report.close()
+    print(f"Imported {report.imported} {args.kind}; {report.failed} failed (see {args.report})")
@@ -0,0 +1,93 @@
+"""
+Task comments, stored one document per comment in their own collection.
+
+Tasks only keep a denormalized comment_count and last_comment_at, so task
+documents stay small no matter how long a discussion gets. Comments are read
+oldest first, a page at a time, using the (task_id, timestamp, _id) index.
+"""
+from datetime import datetime
+
+import pagination
+
+SORT_ORDER = [('timestamp', 1), ('_id', 1)]
+
+
+class CommentStore:
+
+    def __init__(self, comments_collection, tasks_collection):
+        self.comments_collection = comments_collection
+        self.tasks_collection = tasks_collection
+
+    def add(self, task_id, user, text):
+        comment = {
+            'task_id': task_id,
+            'user': user['username'],
+            'user_id': str(user['_id']),
+            'text': text,
+            'timestamp': datetime.utcnow()
+        }
+        comment['_id'] = self.comments_collection.insert_one(comment).inserted_id
+        self.tasks_collection.update_one(
+            {'_id': task_id},
+            {'$inc': {'comment_count': 1}, '$max': {'last_comment_at': comment['timestamp']}}
+        )
+        return comment
+
+    def page(self, task_id, args):
+        """
+        One page of a task's comments, oldest first: (comments, next_cursor).
+        Documents are returned as stored; the app's JSON provider encodes ids and dates.
+        """
+        limit = pagination.parse_limit(args.get('limit'))
+        query = {'task_id': task_id}
+        if args.get('cursor'):
+            query = pagination.after_cursor(query, args['cursor'], field='timestamp', direction=1)
+        comments = list(self.comments_collection.find(query).sort(SORT_ORDER).limit(limit + 1))
+        next_cursor = None
+        if len(comments) > limit:
+            comments = comments[:limit]
+            next_cursor = pagination.encode_cursor(comments[-1], field='timestamp', direction=1)
+        return comments, next_cursor
+
+    def delete_for_tasks(self, task_ids):
+        if task_ids:
+            self.comments_collection.delete_many({'task_id': {'$in': list(task_ids)}})
+
+    def migrate_embedded(self):
+        """
+        Move comments still embedded in task documents into the comments
+        collection and replace them with the denormalized counters.
+        """
+        migrated = 0
+        for task in self.tasks_collection.find({'comments': {'$exists': True}}, {'comments': 1}):
+            documents = []
+            for comment in task.get('comments') or []:
+                timestamp = comment.get('timestamp')
+                if isinstance(timestamp, str):
+                    timestamp = datetime.fromisoformat(timestamp)
+                documents.append({
+                    'task_id': task['_id'],
+                    'user': comment.get('user'),
+                    'user_id': comment.get('user_id'),
+                    'text': comment.get('text', ''),
+                    'timestamp': timestamp or datetime.utcnow()
+                })
+            if documents:
+                self.comments_collection.insert_many(documents)
+            update = {'$unset': {'comments': ''}, '$inc': {'comment_count': len(documents)}}
+            if documents:
+                update['$max'] = {'last_comment_at': max(d['timestamp'] for d in documents)}
+            self.tasks_collection.update_one({'_id': task['_id']}, update)
+            migrated += len(documents)
+        return migrated
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+
+    import connection
+
+    load_dotenv()
+    db = connection.command_line_database()
+    count = CommentStore(db['comments'], db['tasks']).migrate_embedded()
+    print(f"Moved {count} embedded comment(s) to the comments collection")
@@ -0,0 +1,254 @@
+"""
+MongoDB client configuration.
+
+Every gunicorn worker opens its own client (clients must not cross fork()),
+so MONGO_MAX_POOL_SIZE is per worker: a deployment opens at most
+workers x MONGO_MAX_POOL_SIZE connections. All timeouts are bounded, so a
+slow or unreachable primary fails requests quickly instead of hanging them:
+
+    MONGO_MAX_POOL_SIZE                 connections per worker (20)
+    MONGO_MIN_POOL_SIZE                 connections kept open when idle (0)
+    MONGO_MAX_IDLE_TIME_MS              close connections idle this long (60000)
+    MONGO_WAIT_QUEUE_TIMEOUT_MS         max wait for a free pooled connection (2000)
+    MONGO_SERVER_SELECTION_TIMEOUT_MS   max wait for a usable server (5000)
+    MONGO_CONNECT_TIMEOUT_MS            TCP connect timeout (5000)
+    MONGO_SOCKET_TIMEOUT_MS             max wait for a single reply (15000)
+
+Read-heavy reporting routes (analytics, completed tasks) read with
+MONGO_REPORTING_READ_PREFERENCE (secondaryPreferred by default; optionally
+bounded by MONGO_MAX_STALENESS_SECONDS, minimum 90). Everything else,
+including every read that feeds a write, stays on the primary.
+"""
+import os
+import threading
+import time
+
+from prometheus_client import Histogram
+from pymongo import MongoClient, monitoring
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+
+READ_PREFERENCES = {
+    'primary': Primary,
+    'primaryPreferred': PrimaryPreferred,
+    'secondary': Secondary,
+    'secondaryPreferred': SecondaryPreferred,
+    'nearest': Nearest,
+}
+
+POOL_WAIT_SECONDS = Histogram(
+    'taskmate_mongo_pool_wait_seconds', 'Time waiting to check a connection out of the pool',
+    buckets=(.0001, .0005, .001, .005, .01, .05, .1, .5, 1, 2.5)
+)
+
+
+def _env_int(name, default):
+    return int(os.getenv(name, str(default)))
+
+
+def client_options():
+    return {
+        'maxPoolSize': _env_int('MONGO_MAX_POOL_SIZE', 20),
+        'minPoolSize': _env_int('MONGO_MIN_POOL_SIZE', 0),
+        'maxIdleTimeMS': _env_int('MONGO_MAX_IDLE_TIME_MS', 60000),
+        'waitQueueTimeoutMS': _env_int('MONGO_WAIT_QUEUE_TIMEOUT_MS', 2000),
+        'serverSelectionTimeoutMS': _env_int('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000),
+        'connectTimeoutMS': _env_int('MONGO_CONNECT_TIMEOUT_MS', 5000),
+        'socketTimeoutMS': _env_int('MONGO_SOCKET_TIMEOUT_MS', 15000),
+    }
+
+
+def reporting_read_preference():
+    name = os.getenv('MONGO_REPORTING_READ_PREFERENCE', 'secondaryPreferred')
+    if name not in READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference '{name}', expected one of: {', '.join(READ_PREFERENCES)}")
+    if name == 'primary':
+        return Primary()
+    return READ_PREFERENCES[name](max_staleness=_env_int('MONGO_MAX_STALENESS_SECONDS', -1))
+
+
+def for_reporting(collection):
+    """The same collection, read with the reporting read preference."""
+    return collection.with_options(read_preference=reporting_read_preference())
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Checkout counts and wait times of the client's connection pools."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiting = threading.local()
+        self.checkouts = 0
+        self.checkout_failures = {}
+        self.checked_in = 0
+        self.created = 0
+        self.closed = 0
+        self.cleared = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def connection_check_out_started(self, event):
+        self._waiting.started = time.perf_counter()
+
+    def _waited(self):
+        started = getattr(self._waiting, 'started', None)
+        self._waiting.started = None
+        return time.perf_counter() - started if started is not None else 0.0
+
+    def connection_checked_out(self, event):
+        waited = self._waited()
+        POOL_WAIT_SECONDS.observe(waited)
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def connection_check_out_failed(self, event):
+        POOL_WAIT_SECONDS.observe(self._waited())
+        with self._lock:
+            self.checkout_failures[event.reason] = self.checkout_failures.get(event.reason, 0) + 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_in += 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.created += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.closed += 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.cleared += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'checkout_failures': sum(self.checkout_failures.values()),
+                'checkout_failures_by_reason': dict(self.checkout_failures),
+                'in_use': self.checkouts - self.checked_in,
+                'open_connections': self.created - self.closed,
+                'pool_clears': self.cleared,
+                'wait_ms_avg': 1000 * self.wait_seconds_total / self.checkouts if self.checkouts else 0.0,
+                'wait_ms_max': 1000 * self.wait_seconds_max,
+                'max_pool_size': client_options()['maxPoolSize'],
+            }
+
+
+def create_client(uri=None, client_class=MongoClient, event_listeners=()):
+    """A client with the configured pool and timeouts. Returns (client, pool_stats)."""
+    pool_stats = PoolStats()
+    client = client_class(
+        uri or os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'),
+        event_listeners=[pool_stats, *event_listeners],
+        **client_options()
+    )
+    return client, pool_stats
+
+
+def command_line_database():
+    """
+    The MONGODB_DB database for command line tools, on a client from
+    create_client() so they run with the same pool and timeouts as the app.
+    """
+    client, _ = create_client()
+    return client[os.getenv('MONGODB_DB', 'task_manager')]
+
+
+class LazyClient:
+    """
+    Creates the client on first use in each process. Nothing connects at
+    import time, so the app can be preloaded by gunicorn and every worker
+    opens its own pool after fork().
+    """
+
+    def __init__(self, uri=None, event_listeners=()):
+        self.uri = uri
+        self.event_listeners = list(event_listeners)
+        self._lock = threading.Lock()
+        self._client = None
+        self._pool_stats = None
+        self._pid = None
+
+    def get(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._client, self._pool_stats = create_client(self.uri, event_listeners=self.event_listeners)
+                    self._pid = pid
+        return self._client
+
+    def __getitem__(self, name):
+        return LazyDatabase(self, name)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.get(), name)
+
+    def stats(self):
+        if self._pid != os.getpid():
+            return {'connected': False}
+        return {'connected': True, **self._pool_stats.stats()}
+
+
+class LazyDatabase:
+
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def get(self):
+        return self.client.get()[self.name]
+
+    def __getitem__(self, name):
+        return LazyCollection(self, name)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.get(), name)
+
+
+class LazyCollection:
+    """Stands in for a Collection; resolves it against the current process' client."""
+
+    def __init__(self, database, name, options=None):
+        self.database_proxy = database
+        self.name = name
+        self.options = options or {}
+        self._resolved = (None, None)
+
+    def get(self):
+        client = self.database_proxy.client.get()
+        cached_client, collection = self._resolved
+        if cached_client is not client:
+            collection = client[self.database_proxy.name][self.name]
+            if self.options:
+                collection = collection.with_options(**self.options)
+            self._resolved = (client, collection)
+        return collection
+
+    def with_options(self, **options):
+        return LazyCollection(self.database_proxy, self.name, {**self.options, **options})
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.get(), name)
@@ -0,0 +1,325 @@
+"""
+Real-time task events.
+
+Every process has one EventHub that fans task events out to its connected
+subscribers. The hub is fed by one of two sources:
+
+* 'changestream' (default): a background thread, started when the first
+  client subscribes, watches tasks_collection with a MongoDB change stream.
+  Events written by any worker therefore reach every worker. Requires a
+  replica set; deletes are routed using the pre-image when the collection has
+  changeStreamPreAndPostImages enabled (MongoDB 6+), otherwise from metadata
+  of tasks seen since the watcher started.
+* 'local': routes publish their own writes directly. Useful for tests and
+  single-process deployments.
+
+The hub keeps a bounded buffer of recent events so a client reconnecting with
+its last event id receives what it missed. With the change stream backend the
+event id is the change's resume token, so a client that reconnects to another
+worker, or after the id left the buffer, is caught up by reading the change
+stream from that token. If the token is no longer in the oplog, or too much
+was missed, the client receives a 'reset' event and should refetch its list.
+"""
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+from pymongo.errors import PyMongoError
+
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+def _audience(*tasks):
+    people = set()
+    for task in tasks:
+        if task:
+            for field in ('created_by', 'assigned_to'):
+                if task.get(field):
+                    people.add(str(task[field]))
+    return people
+
+
+def event_type(before, after):
+    if before is None:
+        return 'created'
+    if after is None:
+        return 'deleted'
+    if after.get('status') == 'done' and before.get('status') != 'done':
+        return 'completed'
+    return 'updated'
+
+
+def task_payload(task):
+    payload = {k: v for k, v in task.items() if k != 'search_terms'}
+    payload['_id'] = str(payload['_id'])
+    for field in ('created_by', 'assigned_to'):
+        if field in payload:
+            payload[field] = str(payload[field])
+    return payload
+
+
+def make_event(event_id, kind, before, after):
+    task = after or before
+    return {
+        'id': event_id,
+        'type': kind,
+        'company_code': task.get('company_code'),
+        'audience': _audience(before, after),
+        'task': task_payload(after) if after else {'_id': str(before['_id'])}
+    }
+
+
+def can_see(user, event):
+    if event['type'] == 'reset':
+        return True
+    if event['company_code'] != user['company_code']:
+        return False
+    return user['role'] == 'admin' or str(user['_id']) in event['audience']
+
+
+class Subscription:
+
+    def __init__(self, user, max_queue):
+        self.user = user
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.overflowed = False
+        self._replay = deque()
+        self._replayed = set()
+
+    def offer(self, event):
+        if not can_see(self.user, event):
+            return
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # A stalled client; it gets a reset and reconnects
+            self.overflowed = True
+
+    def replay(self, events):
+        """
+        Deliver events missed while disconnected ahead of the queued live ones.
+        Live events that were also replayed are skipped.
+        """
+        for event in events:
+            self._replayed.add(event['id'])
+            if can_see(self.user, event):
+                self._replay.append(event)
+
+    def get(self, timeout):
+        if self._replay:
+            return self._replay.popleft()
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                event = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                return None
+            if event['id'] not in self._replayed:
+                return event
+
+
+class EventHub:
+
+    def __init__(self, buffer_size=1000, max_queue=256):
+        self.buffer_size = buffer_size
+        self.max_queue = max_queue
+        self._buffer = deque(maxlen=buffer_size)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def publish(self, event):
+        with self._lock:
+            self._buffer.append(event)
+            self.published += 1
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.offer(event)
+
+    def subscribe(self, user, last_event_id=None):
+        subscription = Subscription(user, self.max_queue)
+        with self._lock:
+            if last_event_id:
+                ids = [event['id'] for event in self._buffer]
+                if last_event_id in ids:
+                    for event in list(self._buffer)[ids.index(last_event_id) + 1:]:
+                        subscription.offer(event)
+                else:
+                    subscription.offer({'id': last_event_id, 'type': 'reset'})
+            self._subscribers.add(subscription)
+        return subscription
+
+    def buffered(self, event_id):
+        with self._lock:
+            return any(event['id'] == event_id for event in self._buffer)
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def stats(self):
+        return {
+            'subscribers': len(self._subscribers),
+            'buffered': len(self._buffer),
+            'published': self.published
+        }
+
+
+class ChangeStreamWatcher(threading.Thread):
+
+    def __init__(self, tasks_collection, hub, retry_delay=5):
+        super().__init__(name='task-change-stream', daemon=True)
+        self.tasks_collection = tasks_collection
+        self.hub = hub
+        self.retry_delay = retry_delay
+        # Routing data for deletes when no pre-image is available
+        self._known = TTLCache(maxsize=100000, ttl=24 * 3600)
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _enable_pre_images(self):
+        try:
+            self.tasks_collection.database.command(
+                'collMod', self.tasks_collection.name,
+                changeStreamPreAndPostImages={'enabled': True}
+            )
+        except PyMongoError as e:
+            logger.warning(f"Change stream pre-images unavailable, deletes routed from cache: {e}")
+
+    def _remember(self, task):
+        self._known.set(str(task['_id']), {
+            '_id': task['_id'],
+            'company_code': task.get('company_code'),
+            'created_by': task.get('created_by'),
+            'assigned_to': task.get('assigned_to'),
+            'status': task.get('status')
+        })
+
+    def to_event(self, change):
+        operation = change['operationType']
+        event_id = change['_id']['_data']
+        after = change.get('fullDocument')
+        before = change.get('fullDocumentBeforeChange')
+        if before is None and operation in ('update', 'replace', 'delete'):
+            before = self._known.get(str(change['documentKey']['_id']))
+
+        if operation == 'insert':
+            kind, before = 'created', None
+        elif operation == 'delete':
+            if before is None:
+                logger.debug(f"Dropping delete of unknown task {change['documentKey']['_id']}")
+                return None
+            self._known.delete(str(before['_id']))
+            return make_event(event_id, 'deleted', before, None)
+        elif operation in ('update', 'replace'):
+            if after is None:
+                return None  # deleted before the lookup; the delete event follows
+            updated = change.get('updateDescription', {}).get('updatedFields', {})
+            kind = 'completed' if updated.get('status') == 'done' else 'updated'
+        else:
+            return None
+
+        self._remember(after)
+        return make_event(event_id, kind, before, after)
+
+    def events_since(self, resume_token, limit):
+        """
+        Events after `resume_token` (an event id) up to now, read with a
+        separate change stream. None if the token is unknown or has left the
+        oplog, or more than `limit` events were missed.
+        """
+        events = []
+        try:
+            with self.tasks_collection.watch(
+                    full_document='updateLookup',
+                    full_document_before_change='whenAvailable',
+                    resume_after={'_data': resume_token}) as stream:
+                while stream.alive:
+                    change = stream.try_next()
+                    if change is None:
+                        break
+                    event = self.to_event(change)
+                    if event:
+                        events.append(event)
+                        if len(events) > limit:
+                            return None
+        except PyMongoError as e:
+            logger.info(f"Cannot resume task events after {resume_token}: {e}")
+            return None
+        return events
+
+    def run(self):
+        self._enable_pre_images()
+        resume_token = None
+        while not self._stopped.is_set():
+            try:
+                with self.tasks_collection.watch(
+                        full_document='updateLookup',
+                        full_document_before_change='whenAvailable',
+                        resume_after=resume_token) as stream:
+                    while not self._stopped.is_set() and stream.alive:
+                        change = stream.try_next()
+                        if change is None:
+                            continue
+                        resume_token = stream.resume_token
+                        event = self.to_event(change)
+                        if event:
+                            self.hub.publish(event)
+            except PyMongoError as e:
+                logger.error(f"Task change stream error: {e}")
+                self._stopped.wait(self.retry_delay)
+
+
+class TaskEvents:
+
+    def __init__(self, tasks_collection, backend='changestream', buffer_size=1000):
+        self.tasks_collection = tasks_collection
+        self.backend = backend
+        self.hub = EventHub(buffer_size=buffer_size)
+        self._watcher = None
+        self._lock = threading.Lock()
+        self._sequence = itertools.count(1)
+        self._started_at = int(time.time())
+
+    def _ensure_watcher(self):
+        # Started lazily so idle workers (and the pre-fork master) hold no cursor
+        with self._lock:
+            if self._watcher is None or not self._watcher.is_alive():
+                self._watcher = ChangeStreamWatcher(self.tasks_collection, self.hub)
+                self._watcher.start()
+
+    def subscribe(self, user, last_event_id=None):
+        if self.backend != 'changestream':
+            return self.hub.subscribe(user, last_event_id)
+        self._ensure_watcher()
+        if not last_event_id or self.hub.buffered(last_event_id):
+            return self.hub.subscribe(user, last_event_id)
+        # Seen by another worker or before this one started: subscribe first so
+        # nothing published during the catch-up read is lost, then replay
+        subscription = self.hub.subscribe(user)
+        missed = self._watcher.events_since(last_event_id, self.hub.buffer_size)
+        if missed is None:
+            subscription.replay([{'id': last_event_id, 'type': 'reset'}])
+        else:
+            subscription.replay(missed)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.hub.unsubscribe(subscription)
+
+    def task_written(self, before, after):
+        """Publish a write made by this process (local backend only)."""
+        if self.backend != 'local':
+            return
+        event_id = f"{self._started_at}-{next(self._sequence)}"
+        self.hub.publish(make_event(event_id, event_type(before, after), before, after))
+
+    def stats(self):
+        return {'backend': self.backend, **self.hub.stats()}
@@ -0,0 +1,138 @@
+"""
+Streaming exports of a company's tasks.
+
+Rows are read from MongoDB cursors EXPORT_BATCH_SIZE documents at a time,
+encoded as NDJSON or CSV and sent in chunks of about CHUNK_BYTES as they
+are produced, so a worker holds one cursor batch and one chunk no matter
+how many tasks are exported. Done tasks are read from the archive as well;
+rows come in storage order, not sorted.
+
+A large export streams for longer than a sync gunicorn worker's timeout,
+which would kill it mid-row; ProcFile runs gthread workers, which do not
+time out requests. Each export holds one worker thread while it runs, so
+the app caps them at EXPORT_MAX_CONCURRENT per process.
+"""
+import csv
+import io
+import itertools
+
+import listing
+import pagination
+from json_provider import bson_default
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+STATUSES = ('todo', 'in_progress', 'done')
+DATE_FIELDS = ('created_at', 'due_date', 'completed_at')
+
+# CSV columns, in order. NDJSON rows carry every field but the internal ones.
+CSV_FIELDS = (
+    '_id', 'title', 'description', 'status', 'priority', 'category', 'due_date',
+    'created_at', 'completed_at', 'created_by', 'created_by_name', 'assigned_to',
+    'assigned_to_name', 'comment_count', 'version'
+)
+
+CHUNK_BYTES = 64 * 1024
+
+# Spreadsheet apps run cells starting with these as formulas
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class ExportError(ValueError):
+    pass
+
+
+def _parse_date(value, name):
+    # The listing's parser, so ?from= means the same naive UTC instant on both
+    try:
+        return listing._parse_date(value, name)
+    except listing.ListingError as e:
+        raise ExportError(str(e))
+
+
+def export_query(company_code, args):
+    """
+    The filter for an export request: (query, read_archive). Supports
+    ?status=todo,done and a ?from=/&to= range on ?date_field= (created_at).
+    """
+    query = {'company_code': company_code}
+    read_archive = True
+
+    if args.get('status'):
+        statuses = [status for status in args['status'].split(',') if status]
+        unknown = [status for status in statuses if status not in STATUSES]
+        if unknown:
+            raise ExportError(f"Unknown status: {', '.join(unknown)}")
+        query['status'] = {'$in': statuses}
+        read_archive = 'done' in statuses
+
+    date_field = args.get('date_field', 'created_at')
+    if date_field not in DATE_FIELDS:
+        raise ExportError(f"date_field must be one of: {', '.join(DATE_FIELDS)}")
+    date_range = {}
+    if args.get('from'):
+        date_range['$gte'] = _parse_date(args['from'], 'from')
+    if args.get('to'):
+        date_range['$lt'] = _parse_date(args['to'], 'to')
+    if date_range:
+        query[date_field] = date_range
+
+    return query, read_archive
+
+
+def iter_tasks(collections, query, batch_size):
+    """Tasks matching `query` from each collection in turn; closes the cursors even if the client goes away."""
+    for collection in collections:
+        with collection.find(query, pagination.HIDDEN_FIELDS).batch_size(batch_size) as cursor:
+            yield from cursor
+
+
+def _chunked(pieces, size=CHUNK_BYTES):
+    chunk, length = [], 0
+    for piece in pieces:
+        chunk.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield b''.join(chunk)
+            chunk, length = [], 0
+    if chunk:
+        yield b''.join(chunk)
+
+
+def ndjson_chunks(tasks, dumps):
+    """`dumps` encodes one document to a str (the app's JSON provider)."""
+    return _chunked(dumps(task).encode('utf-8') + b'\n' for task in tasks)
+
+
+def csv_value(value):
+    if value is None:
+        return ''
+    if not isinstance(value, (str, int, float)):
+        value = bson_default(value)
+        if isinstance(value, list):
+            value = ','.join(str(item) for item in value)
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _csv_lines(header, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in itertools.chain([header], rows):
+        writer.writerow(row)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def csv_table(header, rows):
+    """CSV chunks for rows given as lists of cell values, header first."""
+    return _chunked(_csv_lines(header, rows))
+
+
+def csv_chunks(tasks):
+    return csv_table(CSV_FIELDS, ([csv_value(task.get(field)) for field in CSV_FIELDS] for task in tasks))
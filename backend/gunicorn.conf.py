@@ -0,0 +1,22 @@
+"""
+Gunicorn settings for ProcFile.
+
+Workers use the gthread class. /tasks/events holds its response open for as
+long as the client is connected, exports stream for minutes, and bcrypt runs
+for hundreds of milliseconds; on the default sync class each of those pins
+a whole worker process and is killed after `timeout` seconds. A gthread
+worker serves GUNICORN_THREADS requests at once and heartbeats from its main
+loop, so a long response only occupies one thread and is never timed out.
+
+Every open event stream takes a thread, so size GUNICORN_THREADS for the
+expected number of subscribers per worker plus regular traffic. Threads do
+not hold a MongoDB connection while they wait, so MONGO_MAX_POOL_SIZE can
+stay below the thread count.
+"""
+import os
+
+preload_app = True
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '32'))
+# Restarts a worker whose main loop stops responding; with gthread requests themselves are not timed out
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
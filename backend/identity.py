@@ -0,0 +1,62 @@
+import logging
+
+from bson import ObjectId
+
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Only these fields are needed by the routes to authorize a request
+IDENTITY_PROJECTION = {'role': 1, 'company_code': 1, 'username': 1}
+
+
+class IdentityResolver:
+    """
+    Resolves a JWT identity (user id string) to {_id, role, company_code,
+    username} with a bounded TTL/LRU cache in front of users_collection.
+
+    Invalidation is per process, so the TTL bounds how long another worker
+    can serve a stale role or company_code after a write.
+    """
+
+    def __init__(self, users_collection, maxsize=10000, ttl=60):
+        self.users_collection = users_collection
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def resolve(self, user_id):
+        user_id = str(user_id)
+        user = self.cache.get(user_id)
+        if user is None:
+            user = self.users_collection.find_one({'_id': ObjectId(user_id)}, IDENTITY_PROJECTION)
+            if not user:
+                return None
+            self.cache.set(user_id, user)
+        return dict(user)
+
+    def invalidate(self, user_id):
+        self.cache.delete(str(user_id))
+
+    def stats(self):
+        return self.cache.stats()
+
+
+class AsyncIdentityResolver:
+    """
+    Async counterpart of IdentityResolver for the ASGI entry point. It shares
+    the sync resolver's cache so invalidations made by Flask routes apply to
+    both.
+    """
+
+    def __init__(self, users_collection, cache):
+        self.users_collection = users_collection
+        self.cache = cache
+
+    async def resolve(self, user_id):
+        user_id = str(user_id)
+        user = self.cache.get(user_id)
+        if user is None:
+            user = await self.users_collection.find_one({'_id': ObjectId(user_id)}, IDENTITY_PROJECTION)
+            if not user:
+                return None
+            self.cache.set(user_id, user)
+        return dict(user)
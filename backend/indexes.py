@@ -0,0 +1,239 @@
+"""
+Index management for the task manager database.
+
+Run `python indexes.py` to create the indexes, or `python indexes.py --check`
+to also explain() every route's canonical query and fail if any of them
+still falls back to a collection scan.
+"""
+import argparse
+import logging
+import sys
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Indexes each collection needs, keyed by collection name
+INDEXES = {
+    'users': [
+        # login, register, complete_registration, admin_login
+        IndexModel([('username', ASCENDING)], name='username_unique', unique=True),
+        # register
+        IndexModel([('email', ASCENDING)], name='email_unique', unique=True),
+        # get_admin_company_employees
+        IndexModel([('company_code', ASCENDING), ('role', ASCENDING)], name='company_role'),
+    ],
+    'companies': [
+        # complete_registration
+        IndexModel([('code', ASCENDING)], name='code_unique', unique=True),
+    ],
+    'tasks': [
+        # get_tasks / get_completed_tasks for admins, analytics, paginated listings
+        IndexModel([('company_code', ASCENDING), ('status', ASCENDING),
+                    ('created_at', DESCENDING), ('_id', DESCENDING)],
+                   name='company_status_created'),
+        # $or branches of the non-admin listings, admin_get_tasks
+        IndexModel([('company_code', ASCENDING), ('created_by', ASCENDING),
+                    ('status', ASCENDING)],
+                   name='company_creator_status'),
+        IndexModel([('company_code', ASCENDING), ('assigned_to', ASCENDING),
+                    ('status', ASCENDING)],
+                   name='company_assignee_status'),
+        # listing filters: ?sort=due_date and ?due_before/?due_after, ?priority
+        IndexModel([('company_code', ASCENDING), ('status', ASCENDING),
+                    ('due_date', ASCENDING), ('_id', ASCENDING)],
+                   name='company_status_due'),
+        IndexModel([('company_code', ASCENDING), ('priority', ASCENDING), ('status', ASCENDING),
+                    ('created_at', DESCENDING), ('_id', DESCENDING)],
+                   name='company_priority_status_created'),
+        # search_tasks: ranked full-word matches and prefix matches
+        IndexModel([('company_code', ASCENDING), ('title', TEXT),
+                    ('description', TEXT), ('category', TEXT)],
+                   name='company_text', weights={'title': 10, 'category': 5, 'description': 2}),
+        IndexModel([('company_code', ASCENDING), ('search_terms', ASCENDING)],
+                   name='company_search_terms'),
+        # archive job
+        IndexModel([('status', ASCENDING), ('completed_at', ASCENDING)], name='status_completed'),
+    ],
+    'completed_tasks': [
+        # archive tier of get_completed_tasks and analytics
+        IndexModel([('company_code', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+                   name='company_created'),
+        IndexModel([('company_code', ASCENDING), ('created_by', ASCENDING)], name='company_creator'),
+        IndexModel([('company_code', ASCENDING), ('assigned_to', ASCENDING)], name='company_assignee'),
+        # listing filters of get_completed_tasks
+        IndexModel([('company_code', ASCENDING), ('due_date', ASCENDING), ('_id', ASCENDING)],
+                   name='company_due'),
+        IndexModel([('company_code', ASCENDING), ('priority', ASCENDING),
+                    ('created_at', DESCENDING), ('_id', DESCENDING)],
+                   name='company_priority_created'),
+    ],
+    'comments': [
+        # get_comments keyset pagination, comment cleanup on task delete
+        IndexModel([('task_id', ASCENDING), ('timestamp', ASCENDING), ('_id', ASCENDING)],
+                   name='task_timestamp'),
+    ],
+    'import_failures': [
+        # admin_import_report
+        IndexModel([('import_id', ASCENDING), ('row', ASCENDING)], name='import_row'),
+        # import reports are kept for 30 days
+        IndexModel([('created_at', ASCENDING)], name='expire_created', expireAfterSeconds=30 * 24 * 3600),
+    ],
+    'audit_log': [
+        # get_task_history keyset pagination
+        IndexModel([('task_id', ASCENDING), ('at', DESCENDING), ('_id', DESCENDING)],
+                   name='task_at'),
+    ],
+}
+
+# Canonical query of every hot route: (route, collection, filter, sort)
+_SAMPLE_ID = str(ObjectId())
+CANONICAL_QUERIES = [
+    ('login', 'users', {'username': 'sample'}, None),
+    ('admin_login', 'users', {'username': 'sample', 'role': 'admin'}, None),
+    ('register', 'users', {'email': 'sample@example.com'}, None),
+    ('complete_registration', 'companies', {'code': 'SAMPLE'}, None),
+    ('get_admin_company_employees', 'users', {'company_code': 'SAMPLE', 'role': 'user'}, None),
+    ('get_tasks (admin)', 'tasks',
+     {'company_code': 'SAMPLE', 'status': {'$ne': 'done'}},
+     [('created_at', DESCENDING), ('_id', DESCENDING)]),
+    ('get_tasks (user)', 'tasks',
+     {'company_code': 'SAMPLE',
+      '$or': [{'created_by': _SAMPLE_ID}, {'assigned_to': _SAMPLE_ID}],
+      'status': {'$ne': 'done'}},
+     None),
+    ('get_completed_tasks (admin)', 'tasks',
+     {'company_code': 'SAMPLE', 'status': 'done'},
+     [('created_at', DESCENDING), ('_id', DESCENDING)]),
+    ('get_completed_tasks (user)', 'tasks',
+     {'company_code': 'SAMPLE',
+      '$or': [{'created_by': _SAMPLE_ID}, {'assigned_to': _SAMPLE_ID}],
+      'status': 'done'},
+     None),
+    ('admin_get_tasks', 'tasks', {'created_by': _SAMPLE_ID, 'company_code': 'SAMPLE'},
+     [('created_at', DESCENDING), ('_id', DESCENDING)]),
+    ('get_tasks (?status&sort=due_date&due_before)', 'tasks',
+     {'company_code': 'SAMPLE', 'status': 'todo', 'due_date': {'$lt': 0}},
+     [('due_date', ASCENDING), ('_id', ASCENDING)]),
+    ('get_tasks (?priority)', 'tasks',
+     {'company_code': 'SAMPLE', 'priority': {'$in': ['high', 'medium']}, 'status': {'$ne': 'done'}},
+     [('created_at', DESCENDING), ('_id', DESCENDING)]),
+    ('get_tasks (?assigned_to)', 'tasks',
+     {'company_code': 'SAMPLE', 'assigned_to': _SAMPLE_ID, 'status': {'$ne': 'done'}},
+     [('created_at', DESCENDING), ('_id', DESCENDING)]),
+    ('get_completed_tasks (archive, ?sort=-due_date)', 'completed_tasks',
+     {'company_code': 'SAMPLE', 'status': 'done'},
+     [('due_date', DESCENDING), ('_id', DESCENDING)]),
+    ('get_completed_tasks (archive, ?priority)', 'completed_tasks',
+     {'company_code': 'SAMPLE', 'status': 'done', 'priority': 'high'},
+     [('created_at', DESCENDING), ('_id', DESCENDING)]),
+    ('admin_export_tasks', 'tasks',
+     {'company_code': 'SAMPLE', 'status': {'$in': ['todo', 'in_progress']}}, None),
+    ('get_completed_tasks (archive)', 'completed_tasks',
+     {'company_code': 'SAMPLE', 'status': 'done'},
+     [('created_at', DESCENDING), ('_id', DESCENDING)]),
+    ('archive_completed', 'tasks', {'status': 'done', 'completed_at': {'$lt': 0}}, None),
+    ('reconcile_names (creator)', 'tasks',
+     {'company_code': 'SAMPLE', 'created_by': _SAMPLE_ID, 'created_by_name': {'$ne': 'sample'}}, None),
+    ('reconcile_names (assignee)', 'completed_tasks',
+     {'company_code': 'SAMPLE', 'assigned_to': _SAMPLE_ID, 'assigned_to_name': {'$ne': 'sample'}}, None),
+    ('get_comments', 'comments', {'task_id': ObjectId()},
+     [('timestamp', ASCENDING), ('_id', ASCENDING)]),
+    ('get_task_history', 'audit_log', {'task_id': ObjectId(), 'company_code': 'SAMPLE'},
+     [('at', DESCENDING), ('_id', DESCENDING)]),
+    ('search_tasks (prefix)', 'tasks',
+     {'company_code': 'SAMPLE', 'search_terms': {'$regex': '^sam'}},
+     [('created_at', DESCENDING), ('_id', DESCENDING)]),
+]
+
+
+def ensure_indexes(db):
+    """
+    Create every declared index. create_indexes is a no-op for indexes that
+    already exist, so this is safe to call on every boot. Each collection's
+    indexes are sent in one command; if that fails (e.g. duplicate usernames
+    blocking a unique index), they are retried one at a time so only the
+    index at fault is missing. Returns the indexes that could not be built,
+    as 'collection.index_name'.
+    """
+    failed = []
+    for collection_name, models in INDEXES.items():
+        collection = db[collection_name]
+        try:
+            collection.create_indexes(models)
+            continue
+        except PyMongoError as e:
+            logger.warning(f"Creating the indexes on {collection_name} failed, retrying one at a time: {e}")
+        for model in models:
+            name = model.document['name']
+            try:
+                collection.create_indexes([model])
+            except PyMongoError as e:
+                failed.append(f"{collection_name}.{name}")
+                logger.error(f"Error creating index {name} on {collection_name}: {e}")
+    return failed
+
+
+def _plan_stages(plan):
+    """Yield every stage name in an explain() plan tree."""
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+
+
+def check_query_plans(db):
+    """
+    explain() each canonical query and return the routes whose winning plan
+    contains a COLLSCAN.
+    """
+    failures = []
+    for route, collection_name, query, sort in CANONICAL_QUERIES:
+        cursor = db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.explain().get('queryPlanner', {}).get('winningPlan', {})
+        stages = set(_plan_stages(plan))
+        if 'COLLSCAN' in stages:
+            failures.append(route)
+            logger.error(f"{route}: COLLSCAN on {collection_name}")
+        else:
+            logger.info(f"{route}: {', '.join(sorted(stages))}")
+    return failures
+
+
+def main(argv=None):
+    from dotenv import load_dotenv
+
+    import connection
+
+    parser = argparse.ArgumentParser(description='Create and verify MongoDB indexes')
+    parser.add_argument('--check', action='store_true',
+                        help='fail if any canonical route query still uses a COLLSCAN')
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+    db = connection.command_line_database()
+
+    failed = ensure_indexes(db)
+    if failed:
+        logger.error(f"{len(failed)} index(es) could not be created: {', '.join(failed)}")
+        return 1
+    if args.check:
+        failures = check_query_plans(db)
+        if failures:
+            logger.error(f"{len(failures)} route(s) still use a collection scan: {', '.join(failures)}")
+            return 1
+        logger.info('All canonical queries use an index')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""
+Per-request timings for the Flask app.
+
+Every request records three phases:
+
+* db: time spent in MongoDB commands, measured by a pymongo CommandListener
+  attached to the app's client, together with the number of commands;
+* serialization: JSON encoding (see json_provider) plus helpers that shape
+  documents for the response (functions decorated with @serialization);
+* handler: everything else, i.e. the total minus the other two.
+
+The phases are exported as Prometheus histograms labelled by route rule on
+/metrics (when the scraper asks for the text format), and each request is
+recorded as an OpenTelemetry span when opentelemetry is installed and a
+tracer provider is configured. With gunicorn, set PROMETHEUS_MULTIPROC_DIR
+so the histograms are aggregated across workers.
+"""
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import g, request
+from prometheus_client import (CollectorRegistry, Counter, Histogram, CONTENT_TYPE_LATEST,
+                               generate_latest, REGISTRY)
+from prometheus_client.core import GaugeMetricFamily
+from pymongo import monitoring
+
+try:
+    from opentelemetry import trace
+except ImportError:
+    trace = None
+
+BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+REQUEST_SECONDS = Histogram(
+    'taskmate_request_seconds', 'Request latency by route', ['route', 'method', 'status'],
+    buckets=BUCKETS
+)
+PHASE_SECONDS = Histogram(
+    'taskmate_request_phase_seconds', 'Time spent per request phase', ['route', 'phase'],
+    buckets=BUCKETS
+)
+MONGO_COMMANDS = Histogram(
+    'taskmate_request_mongo_commands', 'MongoDB commands issued per request', ['route'],
+    buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100)
+)
+MONGO_COMMANDS_TOTAL = Counter(
+    'taskmate_mongo_commands', 'MongoDB commands by route and command name', ['route', 'command']
+)
+
+_current = contextvars.ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_seconds = 0.0
+        self.serialization_seconds = 0.0
+        self.commands = {}
+
+    def command_done(self, name, seconds):
+        self.db_seconds += seconds
+        self.commands[name] = self.commands.get(name, 0) + 1
+
+    @property
+    def command_count(self):
+        return sum(self.commands.values())
+
+    def phases(self, total):
+        return {
+            'db': self.db_seconds,
+            'serialization': self.serialization_seconds,
+            'handler': max(0.0, total - self.db_seconds - self.serialization_seconds)
+        }
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """Adds every command's server round trip to the timings of the request that issued it."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event)
+
+    def failed(self, event):
+        self._record(event)
+
+    def _record(self, event):
+        timings = _current.get()
+        if timings is not None:
+            timings.command_done(event.command_name, event.duration_micros / 1e6)
+
+
+@contextmanager
+def serializing():
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.serialization_seconds += time.perf_counter() - start
+
+
+def serialization(fn):
+    """Count a response-shaping helper as serialization time."""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        with serializing():
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def _route():
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+def _start_request():
+    g.request_timings = RequestTimings()
+    g.request_timings_token = _current.set(g.request_timings)
+
+
+def _finish_request(response):
+    timings = g.pop('request_timings', None)
+    if timings is None:
+        return response
+    total = time.perf_counter() - timings.started
+    route = _route()
+    phases = timings.phases(total)
+
+    REQUEST_SECONDS.labels(route, request.method, str(response.status_code)).observe(total)
+    for phase, seconds in phases.items():
+        PHASE_SECONDS.labels(route, phase).observe(seconds)
+    MONGO_COMMANDS.labels(route).observe(timings.command_count)
+    for name, count in timings.commands.items():
+        MONGO_COMMANDS_TOTAL.labels(route, name).inc(count)
+
+    if trace is not None:
+        _record_span(route, response.status_code, timings, total, phases)
+    return response
+
+
+def _record_span(route, status, timings, total, phases, method=None):
+    method = method or request.method
+    end = time.time_ns()
+    span = trace.get_tracer(__name__).start_span(
+        f"{method} {route}", kind=trace.SpanKind.SERVER, start_time=end - int(total * 1e9)
+    )
+    if span.is_recording():
+        attributes = {
+            'http.method': method,
+            'http.route': route,
+            'http.status_code': status,
+            **{f'taskmate.{phase}_ms': seconds * 1000 for phase, seconds in phases.items()}
+        }
+        if timings is not None:
+            attributes['db.commands'] = timings.command_count
+        span.set_attributes(attributes)
+    span.end(end_time=end)
+
+
+def record_request(route, method, status, total):
+    """
+    Record a request served outside Flask (asgi.py). Only the latency is
+    known there: Motor runs commands on its own threads, so they are not
+    attributed to the request.
+    """
+    REQUEST_SECONDS.labels(route, method, str(status)).observe(total)
+    if trace is not None:
+        _record_span(route, status, None, total, {}, method)
+
+
+def _reset_request(exc=None):
+    token = g.pop('request_timings_token', None)
+    if token is not None:
+        _current.reset(token)
+
+
+def init_app(app):
+    """Time every request of `app`. Call before other before_request hooks are registered."""
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_reset_request)
+
+
+class SnapshotCollector:
+    """Exposes numeric values from metrics.snapshot() as gauges."""
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def collect(self):
+        for source, values in self.snapshot().items():
+            for key, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    gauge = GaugeMetricFamily(f'taskmate_{source}_{key}', f'{source} {key}')
+                    gauge.add_metric([], value)
+                    yield gauge
+
+
+def wants_prometheus(accept, args):
+    """True for Prometheus scrapes (text/plain or OpenMetrics preferred over JSON) or ?format=prometheus."""
+    if args.get('format') == 'prometheus':
+        return True
+    text_quality = max((quality for value, quality in accept
+                        if value.startswith(('text/plain', 'application/openmetrics-text'))), default=0)
+    json_quality = max((quality for value, quality in accept if value == 'application/json'), default=0)
+    return text_quality > json_quality
+
+
+def prometheus_response(snapshot):
+    """Body and content type for a Prometheus scrape."""
+    registry = REGISTRY
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    # Subsystem stats are per process and stay out of the multiprocess files
+    local = CollectorRegistry()
+    local.register(SnapshotCollector(snapshot))
+    return generate_latest(registry) + generate_latest(local), CONTENT_TYPE_LATEST
@@ -0,0 +1,90 @@
+"""
+JSON encoding for API responses.
+
+Both providers encode BSON types directly, so routes can return documents
+straight from MongoDB without copying them first:
+
+* ObjectId as its hex string;
+* datetime and date as RFC 1123 in UTC ('Thu, 01 Jan 2026 09:30:00 GMT'),
+  as Flask's default provider does and the Angular client expects;
+* bytes as UTF-8 text, or base64 when they are not valid UTF-8.
+
+'orjson' (default) encodes in C and writes the response body as bytes.
+'stdlib' is Flask's json module with the same conversions; select it with
+JSON_PROVIDER=stdlib if orjson is unavailable on a platform.
+"""
+import base64
+from datetime import date
+
+from bson import ObjectId
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+from instrumentation import serializing
+
+
+def _bytes(value):
+    try:
+        return value.decode('utf-8')
+    except UnicodeDecodeError:
+        return base64.b64encode(value).decode('ascii')
+
+
+def bson_default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, date):
+        # Naive datetimes are UTC, as MongoDB returns them
+        return http_date(value)
+    if isinstance(value, (bytes, bytearray)):
+        return _bytes(bytes(value))
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    return DefaultJSONProvider.default(value)
+
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    default = staticmethod(bson_default)
+
+    def dumps(self, obj, **kwargs):
+        with serializing():
+            return super().dumps(obj, **kwargs)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Same output as StdlibJSONProvider (compact, keys sorted), several times faster."""
+
+    def __init__(self, app):
+        super().__init__(app)
+        import orjson
+        self._orjson = orjson
+
+    def _options(self, pretty):
+        # Datetimes go through bson_default, which keeps Flask's format
+        options = self._orjson.OPT_PASSTHROUGH_DATETIME | self._orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= self._orjson.OPT_SORT_KEYS
+        if pretty:
+            options |= self._orjson.OPT_INDENT_2
+        return options
+
+    def dumps_bytes(self, obj, pretty=False):
+        with serializing():
+            return self._orjson.dumps(obj, default=bson_default, option=self._options(pretty))
+
+    def dumps(self, obj, **kwargs):
+        return self.dumps_bytes(obj, pretty=kwargs.get('indent') is not None).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = self.compact is False or (self.compact is None and self._app.debug)
+        return self._app.response_class(self.dumps_bytes(obj, pretty) + b'\n', mimetype=self.mimetype)
+
+
+PROVIDERS = {'orjson': OrjsonProvider, 'stdlib': StdlibJSONProvider}
+
+
+def init_app(app, name='orjson'):
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown JSON provider '{name}', expected one of: {', '.join(PROVIDERS)}")
+    app.json = PROVIDERS[name](app)
@@ -0,0 +1,45 @@
+"""
+Leases stored in MongoDB, so a periodic job started in every gunicorn worker
+(and on every host) only runs in one process at a time.
+
+    lease = Lease(db['leases'], 'name-reconciler', ttl=600)
+    if lease.acquire():
+        ...
+
+The holder renews the lease by acquiring it again before it expires; if the
+holder dies, another process takes over once `ttl` seconds have passed.
+"""
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+
+class Lease:
+
+    def __init__(self, collection, name, ttl):
+        self.collection = collection
+        self.name = name
+        self.ttl = ttl
+        self._instance = uuid.uuid4().hex[:8]
+
+    @property
+    def owner(self):
+        # Evaluated per call: the lease may be created before gunicorn forks
+        return f"{socket.gethostname()}:{os.getpid()}:{self._instance}"
+
+    def acquire(self):
+        """Take or renew the lease; False while another process holds it."""
+        now = datetime.utcnow()
+        try:
+            self.collection.find_one_and_update(
+                {'_id': self.name, '$or': [{'expires_at': {'$lte': now}}, {'owner': self.owner}]},
+                {'$set': {'owner': self.owner, 'expires_at': now + timedelta(seconds=self.ttl)}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # The lease exists and is held by someone else, so the upsert collided
+            return False
+        return True
@@ -0,0 +1,107 @@
+"""
+Server-side filters and sort orders for the task list routes.
+
+    GET /tasks?priority=high,medium&due_before=2026-04-01&sort=due_date&limit=50
+
+Only the parameters below are accepted, and each is served by a compound
+index declared in indexes.py, so a filtered page never scans the company:
+
+    priority=low,medium,high        company_priority_status_created
+    assigned_to=<user id>,...       company_assignee_status
+    status=todo,in_progress,done    company_status_created
+    due_after= / due_before=        company_status_due (due_after inclusive,
+                                    due_before exclusive, ISO 8601)
+    sort=created_at|due_date        company_status_created / company_status_due
+                                    ('-' prefix for newest first)
+
+Filters narrow the route's own query (visibility, active or done) and never
+widen it: /tasks only accepts the active statuses, /tasks/completed only
+'done'. Without a sort the order stays newest first, as before.
+"""
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+import pagination
+
+PRIORITIES = ('low', 'medium', 'high')
+ACTIVE_STATUSES = ('todo', 'in_progress')
+COMPLETED_STATUSES = ('done',)
+ALL_STATUSES = ACTIVE_STATUSES + COMPLETED_STATUSES
+
+SORTS = {
+    'created_at': ('created_at', 1),
+    '-created_at': ('created_at', -1),
+    'due_date': ('due_date', 1),
+    '-due_date': ('due_date', -1),
+}
+DEFAULT_SORT = '-created_at'
+
+
+class ListingError(pagination.PaginationError):
+    pass
+
+
+def _values(args, name, allowed=None):
+    values = [value.strip() for value in args[name].split(',') if value.strip()]
+    if not values:
+        raise ListingError(f'{name} must not be empty')
+    if allowed is not None:
+        unknown = [value for value in values if value not in allowed]
+        if unknown:
+            raise ListingError(f"{name} must be one of: {', '.join(allowed)}")
+    return values
+
+
+def _match(values):
+    return values[0] if len(values) == 1 else {'$in': values}
+
+
+def _parse_date(value, name):
+    try:
+        date = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ListingError(f'{name} must be an ISO 8601 date')
+    # Dates are stored as naive UTC
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    return date
+
+
+def filtered(query, args, statuses=ALL_STATUSES):
+    """`query` narrowed by the filter parameters in `args`; `statuses` are the ones the route may list."""
+    query = dict(query)
+
+    if args.get('priority') is not None:
+        query['priority'] = _match(_values(args, 'priority', PRIORITIES))
+
+    if args.get('assigned_to') is not None:
+        assignees = _values(args, 'assigned_to')
+        if not all(ObjectId.is_valid(assignee) for assignee in assignees):
+            raise ListingError('assigned_to must be a list of user ids')
+        query['assigned_to'] = _match(assignees)
+
+    if args.get('status') is not None:
+        query['status'] = _match(_values(args, 'status', statuses))
+
+    due = {}
+    if args.get('due_after'):
+        due['$gte'] = _parse_date(args['due_after'], 'due_after')
+    if args.get('due_before'):
+        due['$lt'] = _parse_date(args['due_before'], 'due_before')
+    if due:
+        query['due_date'] = due
+
+    return query
+
+
+def sort_key(args):
+    """The (field, direction) requested with ?sort=, checked against the sort ?cursor= was issued for."""
+    name = args.get('sort') or DEFAULT_SORT
+    if name not in SORTS:
+        raise ListingError(f"sort must be one of: {', '.join(SORTS)}")
+    sort = SORTS[name]
+    # A keyset from another order would silently skip or repeat tasks
+    if args.get('cursor') and pagination.cursor_sort(args['cursor']) != sort:
+        raise ListingError('cursor belongs to a different sort; restart from the first page')
+    return sort
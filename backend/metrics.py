@@ -0,0 +1,21 @@
+"""
+Minimal in-process metrics registry.
+
+Subsystems register a callable returning a dict of counters/gauges and the
+/metrics route reports all of them.
+"""
+import threading
+
+_sources = {}
+_lock = threading.Lock()
+
+
+def register(name, collect):
+    with _lock:
+        _sources[name] = collect
+
+
+def snapshot():
+    with _lock:
+        sources = dict(_sources)
+    return {name: collect() for name, collect in sources.items()}
@@ -0,0 +1,137 @@
+"""
+Display names stored on tasks.
+
+Tasks carry 'created_by_name' and 'assigned_to_name' next to the user ids,
+written together with the ids, so task listings need no users lookup.
+
+Usernames can still change (or be edited directly in the database), and
+tasks written before these fields existed lack them. Each user document
+records in 'names_synced' the username last copied onto its tasks; the
+reconciler picks up users whose username differs from it and rewrites
+their tasks in tasks and completed_tasks, one company-scoped update per
+user and field, served by the company_creator/company_assignee indexes.
+The first run therefore also backfills every existing task.
+
+Finding those users compares two fields of every user document, which no
+index can serve, so NameReconciler takes a lease before each pass: every
+worker starts one, but only one process in the deployment does the work.
+`python names.py` runs a single pass, e.g. from cron with the interval set
+to 0.
+"""
+import logging
+import threading
+
+from pymongo import UpdateMany, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# (id field, name field) pairs kept in sync
+NAME_FIELDS = (('created_by', 'created_by_name'), ('assigned_to', 'assigned_to_name'))
+
+# Users never synced, or renamed since their last sync
+OUT_OF_SYNC = {'$or': [
+    {'names_synced': {'$exists': False}},
+    {'$expr': {'$ne': ['$username', '$names_synced']}}
+]}
+
+
+def creator_names(user):
+    """Fields to store with a task created by `user`."""
+    return {'created_by': str(user['_id']), 'created_by_name': user['username']}
+
+
+def assignee_names(user):
+    """Fields to store with a task assigned to `user`."""
+    return {'assigned_to': str(user['_id']), 'assigned_to_name': user['username']}
+
+
+def fan_out_operations(user):
+    """One UpdateMany per name field, touching only tasks whose stored name is stale."""
+    return [
+        UpdateMany(
+            {'company_code': user.get('company_code'), id_field: str(user['_id']),
+             name_field: {'$ne': user['username']}},
+            {'$set': {name_field: user['username']}}
+        )
+        for id_field, name_field in NAME_FIELDS
+    ]
+
+
+def reconcile_names(users_collection, task_collections, batch_size=200):
+    """
+    Copy changed usernames onto their tasks. Returns the companies whose
+    tasks were rewritten, so their cached responses can be dropped.
+    """
+    companies = set()
+    users = users_collection.find(OUT_OF_SYNC, {'username': 1, 'company_code': 1}).batch_size(batch_size)
+    batch = []
+    for user in users:
+        batch.append(user)
+        if len(batch) >= batch_size:
+            companies |= _reconcile_batch(users_collection, task_collections, batch)
+            batch = []
+    if batch:
+        companies |= _reconcile_batch(users_collection, task_collections, batch)
+    return companies
+
+
+def _reconcile_batch(users_collection, task_collections, users):
+    operations = [op for user in users for op in fan_out_operations(user)]
+    companies = set()
+    for collection in task_collections:
+        result = collection.bulk_write(operations, ordered=False)
+        if result.modified_count:
+            companies |= {user.get('company_code') for user in users}
+    # Only marked synced once every collection has been rewritten; a failure
+    # above leaves the users to the next run
+    users_collection.bulk_write([
+        UpdateOne({'_id': user['_id'], 'username': user['username']},
+                  {'$set': {'names_synced': user['username']}})
+        for user in users
+    ], ordered=False)
+    return companies
+
+
+class NameReconciler(threading.Thread):
+
+    def __init__(self, users_collection, task_collections, interval, on_change=None, lease=None):
+        super().__init__(name='name-reconciler', daemon=True)
+        self.users_collection = users_collection
+        self.task_collections = task_collections
+        self.interval = interval
+        self.on_change = on_change
+        self.lease = lease
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run_once(self):
+        companies = reconcile_names(self.users_collection, self.task_collections)
+        if companies:
+            logger.info(f"Updated display names on tasks of {len(companies)} company(ies)")
+            if self.on_change:
+                self.on_change(companies)
+        return companies
+
+    def run(self):
+        while True:
+            try:
+                if self.lease is None or self.lease.acquire():
+                    self.run_once()
+            except Exception as e:
+                logger.error(f"Error reconciling display names: {e}")
+            if self._stopped.wait(self.interval):
+                return
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+
+    import connection
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    db = connection.command_line_database()
+    companies = reconcile_names(db['users'], [db['tasks'], db['completed_tasks']])
+    print(f"Display names updated for {len(companies)} company(ies)")
@@ -0,0 +1,180 @@
+import base64
+import json
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Fields a client may ask for with ?fields=. '_id' is always returned.
+PROJECTABLE_FIELDS = {
+    'title', 'description', 'due_date', 'priority', 'status', 'category',
+    'company_code', 'created_by', 'created_by_name', 'assigned_to', 'assigned_to_name',
+    'created_at', 'completed_at', 'comment_count', 'last_comment_at', 'version'
+}
+
+# Internal fields that are never sent to clients. 'comments' only exists on
+# tasks written before comments moved to their own collection.
+HIDDEN_FIELDS = {'search_terms': 0, 'comments': 0}
+
+# Default keyset order of the paginated task listings (newest first)
+DEFAULT_SORT = ('created_at', -1)
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def sort_order(sort=DEFAULT_SORT):
+    """Keyset order for a (field, direction) sort, with _id as the tie-breaker."""
+    field, direction = sort
+    return [(field, direction), ('_id', direction)]
+
+
+def sort_tasks(tasks, sort=DEFAULT_SORT):
+    """Sort fetched documents in place like MongoDB would (missing values first)."""
+    field, direction = sort
+    tasks.sort(key=lambda task: (task.get(field) or datetime.min, task['_id']), reverse=direction < 0)
+    return tasks
+
+
+def encode_cursor(task, field='created_at', direction=-1):
+    """Build an opaque cursor pointing just after the given document in (field, direction) order."""
+    value = task.get(field)
+    payload = {
+        'c': value.isoformat() if isinstance(value, datetime) else None,
+        'i': str(task['_id']),
+        's': [field, direction]
+    }
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _cursor_payload(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if not isinstance(payload, dict):
+            raise TypeError('cursor payload must be an object')
+        return payload
+    except (ValueError, TypeError):
+        raise PaginationError('Invalid cursor')
+
+
+def decode_cursor(cursor):
+    """Turn a cursor back into (sort value, ObjectId)."""
+    payload = _cursor_payload(cursor)
+    try:
+        value = datetime.fromisoformat(payload['c']) if payload.get('c') else None
+        return value, ObjectId(payload['i'])
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise PaginationError('Invalid cursor')
+
+
+def cursor_sort(cursor):
+    """The (field, direction) a cursor was issued for. Cursors predating the field were all issued newest first."""
+    sort = _cursor_payload(cursor).get('s', list(DEFAULT_SORT))
+    if not (isinstance(sort, list) and len(sort) == 2):
+        raise PaginationError('Invalid cursor')
+    return tuple(sort)
+
+
+def parse_limit(value):
+    if value is None or value == '':
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        raise PaginationError('limit must be an integer')
+    if limit < 1:
+        raise PaginationError('limit must be positive')
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def parse_fields(value, sort_field='created_at'):
+    """Translate ?fields=a,b into a Mongo projection (None means everything)."""
+    if not value:
+        return None
+    requested = [f.strip() for f in value.split(',') if f.strip()]
+    unknown = [f for f in requested if f not in PROJECTABLE_FIELDS and f != '_id']
+    if unknown:
+        raise PaginationError(f"Unknown field(s): {', '.join(unknown)}")
+    projection = {field: 1 for field in requested}
+    # The sort field is needed to build the next cursor
+    projection[sort_field] = 1
+    return projection
+
+
+def after_cursor(query, cursor, field='created_at', direction=-1):
+    """
+    Restrict a query to documents that sort after the cursor on (field, _id).
+    Missing values sort before every date, so they come last when descending
+    and first when ascending.
+    """
+    sort = _cursor_payload(cursor).get('s')
+    # e.g. a /tasks cursor sent to a comments listing
+    if sort is not None and tuple(sort) != (field, direction):
+        raise PaginationError('cursor belongs to a different listing; restart from the first page')
+    value, last_id = decode_cursor(cursor)
+    op = '$lt' if direction < 0 else '$gt'
+    if value is None:
+        keyset = {field: None, '_id': {op: last_id}}
+        if direction > 0:
+            keyset = {'$or': [{field: {'$ne': None}}, keyset]}
+    else:
+        branches = [
+            {field: {op: value}},
+            {field: value, '_id': {op: last_id}}
+        ]
+        if direction < 0:
+            branches.append({field: None})
+        keyset = {'$or': branches}
+    return {'$and': [query, keyset]}
+
+
+def is_requested(args):
+    """Pagination is opt-in so existing clients keep getting the full list."""
+    return any(key in args for key in ('limit', 'cursor', 'fields'))
+
+
+def page_query(query, args, sort=DEFAULT_SORT):
+    """
+    Build the find() arguments for one page: (query, projection, limit).
+    The caller must fetch limit + 1 documents sorted by sort_order(sort).
+    """
+    field, direction = sort
+    limit = parse_limit(args.get('limit'))
+    projection = parse_fields(args.get('fields'), field)
+    cursor = args.get('cursor')
+    if cursor:
+        query = after_cursor(query, cursor, field, direction)
+    return query, projection or HIDDEN_FIELDS, limit
+
+
+def finish_page(tasks, limit, args, sort=DEFAULT_SORT):
+    """Trim the extra look-ahead document and return (tasks, next_cursor)."""
+    field = sort[0]
+    next_cursor = None
+    if len(tasks) > limit:
+        tasks = tasks[:limit]
+        next_cursor = encode_cursor(tasks[-1], field, sort[1])
+
+    # The sort field was only added to the projection for the cursor
+    if args.get('fields') and field not in [f.strip() for f in args.get('fields').split(',')]:
+        for task in tasks:
+            task.pop(field, None)
+    return tasks, next_cursor
+
+
+def fetch_page(collection, query, args, sort=DEFAULT_SORT):
+    """
+    Run a keyset-paginated find for a task listing.
+
+    Returns (tasks, next_cursor). next_cursor is None on the last page.
+    """
+    query, projection, limit = page_query(query, args, sort)
+    # Fetch one extra document to know whether another page exists
+    tasks = list(collection.find(query, projection).sort(sort_order(sort)).limit(limit + 1))
+    return finish_page(tasks, limit, args, sort)
@@ -0,0 +1,143 @@
+"""
+Password hashing off the request worker.
+
+bcrypt deliberately burns CPU for hundreds of milliseconds, so hashing and
+verification run in a small process pool. The number of in-flight operations
+is bounded: once `max_pending` calls are queued new ones fail fast with
+PasswordQueueFull rather than piling up behind a burst of logins. The limit
+is per process and counts the request threads waiting on the pool, so it
+only comes into play with threaded workers (see gunicorn.conf.py); keep it
+below GUNICORN_THREADS. A call that times out or finds the pool broken raises
+PasswordHasherUnavailable, the base class of PasswordQueueFull.
+
+The bcrypt cost is configurable. Hashes stored with a different cost are
+upgraded transparently after the next successful login.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+
+logger = logging.getLogger(__name__)
+
+
+class PasswordHasherUnavailable(Exception):
+    pass
+
+
+class PasswordQueueFull(PasswordHasherUnavailable):
+    pass
+
+
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds))
+
+
+def _checkpw(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+
+def hash_cost(hashed):
+    """Work factor encoded in a bcrypt hash such as b'$2b$12$...'."""
+    try:
+        return int(hashed.split(b'$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def _to_bytes(value):
+    return value.encode('utf-8') if isinstance(value, str) else value
+
+
+class PasswordHasher:
+
+    def __init__(self, rounds=12, workers=2, max_pending=16, timeout=10):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _executor(self):
+        # Pools cannot be shared across fork(); create one per worker process
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PasswordQueueFull('Too many password operations in progress')
+        with self._lock:
+            self.pending += 1
+        try:
+            return self._executor().submit(fn, *args).result(timeout=self.timeout)
+        except TimeoutError:
+            raise PasswordHasherUnavailable('Password operation timed out')
+        except BrokenProcessPool:
+            # A pool process died; the next call starts a fresh pool
+            self.shutdown()
+            raise PasswordHasherUnavailable('Password worker pool failed')
+        finally:
+            with self._lock:
+                self.pending -= 1
+                self.completed += 1
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(_hashpw, _to_bytes(password), self.rounds)
+
+    def hash_many(self, passwords):
+        """
+        Hash a batch (bulk imports) spread over every pool process. Not bound
+        by max_pending, so use a separate hasher from the one serving logins.
+        """
+        passwords = [_to_bytes(password) for password in passwords]
+        if self.workers <= 0 or len(passwords) < 2:
+            return [_hashpw(password, self.rounds) for password in passwords]
+        with self._lock:
+            self.pending += len(passwords)
+        try:
+            chunksize = max(1, len(passwords) // (self.workers * 4))
+            return list(self._executor().map(_hashpw, passwords, [self.rounds] * len(passwords),
+                                             chunksize=chunksize))
+        finally:
+            with self._lock:
+                self.pending -= len(passwords)
+                self.completed += len(passwords)
+
+    def verify(self, password, hashed):
+        return self._run(_checkpw, _to_bytes(password), _to_bytes(hashed))
+
+    def needs_rehash(self, hashed):
+        return hash_cost(_to_bytes(hashed)) != self.rounds
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=False)
+            self._pool = None
+
+    def stats(self):
+        return {
+            'rounds': self.rounds,
+            'workers': self.workers,
+            'queue_depth': self.pending,
+            'max_pending': self.max_pending,
+            'completed': self.completed,
+            'rejected': self.rejected
+        }
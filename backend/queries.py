@@ -0,0 +1,63 @@
+"""Task filters shared by the sync routes, the async entry point and search."""
+
+
+def visibility_filter(user):
+    """Tasks a user may see: the whole company for admins, otherwise created or assigned."""
+    query = {'company_code': user['company_code']}
+    if user['role'] != 'admin':
+        query['$or'] = [
+            {'created_by': str(user['_id'])},
+            {'assigned_to': str(user['_id'])}
+        ]
+    return query
+
+
+def active_tasks_query(user):
+    query = visibility_filter(user)
+    query['status'] = {'$ne': 'done'}  # Only get non-completed tasks
+    return query
+
+
+def completed_tasks_query(user):
+    query = visibility_filter(user)
+    query['status'] = 'done'
+    return query
+
+
+def admin_tasks_query(user):
+    """Tasks created by the current admin."""
+    return {
+        'created_by': str(user['_id']),
+        'company_code': user['company_code']
+    }
+
+
+def editable_filter(user):
+    """Tasks a user may update: the same ones they can see."""
+    return visibility_filter(user)
+
+
+def completable_filter(user):
+    """Tasks a user may complete: the whole company for admins, otherwise assigned."""
+    query = {'company_code': user['company_code']}
+    if user['role'] != 'admin':
+        query['assigned_to'] = str(user['_id'])
+    return query
+
+
+def deletable_filter(user):
+    """Tasks a user may delete: the whole company for admins, otherwise created."""
+    query = {'company_code': user['company_code']}
+    if user['role'] != 'admin':
+        query['created_by'] = str(user['_id'])
+    return query
+
+
+def at_version(query, version):
+    """
+    Restrict a write to the task version the client last read. Tasks written
+    before versioning have no 'version' field and count as version 0.
+    """
+    if version is None:
+        return query
+    return {**query, 'version': version if version else {'$in': [0, None]}}
@@ -0,0 +1,151 @@
+"""
+Rate limiting shared by all workers.
+
+Counters live in RATELIMIT_STORAGE_URI, e.g. redis://host:6379/1. The
+default memory:// is per process and meant for tests and local runs. The
+sliding-window-counter strategy costs two counter reads and one increment
+per limit, which keeps limits accurate at window edges without the sorted
+sets of a moving window.
+
+Two kinds of limits apply:
+
+* per caller: the default limits are keyed by JWT identity, so colleagues
+  behind one NAT address no longer share a bucket. Unauthenticated requests
+  are keyed by address.
+* per company: every authenticated request also counts against its
+  company's quota, RATELIMIT_COMPANY_DEFAULT unless the company document
+  has its own 'rate_limit' (e.g. "50000 per hour"). Set it with
+
+      python rate_limits.py ACME "50000 per hour"   (or --clear)
+
+  which checks the value first; a stored value that does not parse is
+  logged and the default applies.
+"""
+import logging
+import time
+
+from flask import jsonify
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from flask_limiter.util import get_remote_address
+from limits import parse_many
+
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+def current_identity():
+    """The JWT identity of the request, or None without a valid token."""
+    try:
+        verify_jwt_in_request(optional=True)
+        return get_jwt_identity()
+    except Exception:
+        return None
+
+
+def identity_key():
+    """Rate limit key: the JWT identity when a valid token is sent, else the client address."""
+    identity = current_identity()
+    return f"user:{identity}" if identity else f"ip:{get_remote_address()}"
+
+
+def hit(strategy, limits, *identifiers):
+    """
+    Count one request against each limit. Returns (limit, retry_after seconds)
+    for the first one that is used up, else None. The identifiers form the
+    storage key, so ('user:<id>', '<endpoint>') shares Flask-Limiter's
+    per-route buckets.
+    """
+    for limit in limits:
+        try:
+            if strategy.hit(limit, *identifiers):
+                continue
+            reset_at, _ = strategy.get_window_stats(limit, *identifiers)
+        except Exception as e:
+            # Like the per-caller limits, an unreachable store does not block traffic
+            logger.error(f"Rate limit storage error: {e}")
+            return None
+        return limit, max(1, int(reset_at - time.time()))
+    return None
+
+
+class CompanyQuotas:
+
+    def __init__(self, companies_collection, default, ttl=60):
+        self.companies_collection = companies_collection
+        self.default = default
+        self._cache = TTLCache(maxsize=10000, ttl=ttl)
+        self.rejected = 0
+
+    def limits_for(self, company_code):
+        limits = self._cache.get(company_code)
+        if limits is None:
+            company = self.companies_collection.find_one({'code': company_code}, {'rate_limit': 1})
+            limits = None
+            if (company or {}).get('rate_limit'):
+                try:
+                    limits = parse_many(company['rate_limit'])
+                except ValueError as e:
+                    # Runs before every request; a bad value must not fail the company's traffic
+                    logger.error(f"Invalid rate_limit for company {company_code}: {e}")
+            if limits is None:
+                limits = parse_many(self.default)
+            self._cache.set(company_code, limits)
+        return limits
+
+    def set_limit(self, company_code, value):
+        """Store a company's quota, or clear it with None. Raises ValueError for a value limits cannot parse."""
+        if value is None:
+            update = {'$unset': {'rate_limit': ''}}
+        else:
+            parse_many(value)
+            update = {'$set': {'rate_limit': value}}
+        matched = self.companies_collection.update_one({'code': company_code}, update).matched_count
+        self._cache.delete(company_code)
+        return matched > 0
+
+    def exceeded(self, strategy, company_code):
+        """Count one request for the company: (limit, retry_after) once its quota is used up, else None."""
+        breach = hit(strategy, self.limits_for(company_code), 'company', company_code)
+        if breach:
+            self.rejected += 1
+        return breach
+
+    def check(self, strategy, company_code):
+        """Count one request for the company. Returns a 429 response once its quota is used up."""
+        breach = self.exceeded(strategy, company_code)
+        if breach is None:
+            return None
+        limit, retry_after = breach
+        response = jsonify({'error': f'Company rate limit exceeded ({limit})'})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+
+    def stats(self):
+        return {'default': self.default, 'cached_companies': len(self._cache), 'rejected': self.rejected}
+
+
+if __name__ == '__main__':
+    import argparse
+    from dotenv import load_dotenv
+
+    import connection
+
+    parser = argparse.ArgumentParser(description="Set or clear a company's rate limit")
+    parser.add_argument('company', help='company code')
+    parser.add_argument('limit', nargs='?', help='e.g. "50000 per hour" or "1000 per minute;50000 per day"')
+    parser.add_argument('--clear', action='store_true', help='use RATELIMIT_COMPANY_DEFAULT again')
+    args = parser.parse_args()
+    if bool(args.limit) == args.clear:
+        parser.error('give either a limit or --clear')
+
+    load_dotenv()
+    companies = connection.command_line_database()['companies']
+    try:
+        found = CompanyQuotas(companies, None).set_limit(args.company, None if args.clear else args.limit)
+    except ValueError as e:
+        parser.error(f'invalid limit: {e}')
+    if not found:
+        parser.error(f'no company with code {args.company}')
+    print(f"Rate limit of {args.company}: {args.limit or 'default'} (running workers pick it up within a minute)")
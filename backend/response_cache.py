@@ -0,0 +1,175 @@
+"""
+Response cache for read-heavy JSON routes.
+
+Entries are keyed by route, query string, user and company, so users never
+share each other's cached responses. Each entry also carries tags such as
+'company:<code>' or 'user:<id>'. Invalidating a tag bumps its version, and
+every key built with the old version simply stops being looked up. Nothing
+has to be scanned or deleted, and stale entries age out through the TTL or
+the LRU bound.
+
+The backend is a bounded in-process LRU by default. Set CACHE_REDIS_URL to
+share entries and invalidations between all workers.
+"""
+import hashlib
+import json
+import logging
+import threading
+from functools import wraps
+
+from flask import make_response, request
+
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class LocalBackend:
+
+    def __init__(self, max_entries=1000, default_ttl=300):
+        self.entries = TTLCache(maxsize=max_entries, ttl=default_ttl)
+        # Tag versions are tiny and must not be evicted, or stale keys could come back
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, value, ttl):
+        self.entries.set(key, value, ttl=ttl)
+
+    def tag_versions(self, tags):
+        return [self._tags.get(tag, 0) for tag in tags]
+
+    def bump(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._tags[tag] = self._tags.get(tag, 0) + 1
+
+    def stats(self):
+        return {'backend': 'local', 'size': len(self.entries), 'evictions': self.entries.evictions}
+
+
+class RedisBackend:
+
+    def __init__(self, client, prefix='taskmate:cache:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, value, ex=ttl)
+
+    def tag_versions(self, tags):
+        if not tags:
+            return []
+        return [int(v or 0) for v in self.client.mget([self.prefix + 'tag:' + tag for tag in tags])]
+
+    def bump(self, tags):
+        pipeline = self.client.pipeline(transaction=False)
+        for tag in tags:
+            pipeline.incr(self.prefix + 'tag:' + tag)
+        pipeline.execute()
+
+    def stats(self):
+        # Evictions are governed by Redis' maxmemory policy
+        return {'backend': 'redis'}
+
+
+def create_backend(redis_url=None, max_entries=1000):
+    if redis_url:
+        import redis
+        return RedisBackend(redis.Redis.from_url(redis_url))
+    return LocalBackend(max_entries=max_entries)
+
+
+class ResponseCache:
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    def _key(self, name, path, parts, versions):
+        raw = json.dumps([name, path, parts, versions], default=str)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def lookup(self, name, path, parts, tags):
+        """
+        (key, entry) for a route's response; entry is None on a miss and key
+        is None if the backend failed. `path` is the request path with its
+        query string, as in Flask's request.full_path.
+        """
+        try:
+            key = self._key(name, path, parts, self.backend.tag_versions(tags))
+            entry = self.backend.get(key)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Response cache read error: {e}")
+            return None, None
+        if entry is None:
+            self.misses += 1
+            return key, None
+        self.hits += 1
+        return key, json.loads(entry)
+
+    def store(self, key, status, mimetype, body, timeout):
+        if key is None or status != 200:
+            return
+        try:
+            self.backend.set(key, json.dumps({'status': status, 'mimetype': mimetype, 'body': body}), timeout)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Response cache write error: {e}")
+
+    def cached(self, timeout, scope):
+        """
+        Cache successful responses of a route for `timeout` seconds.
+
+        `scope()` is called inside the request and returns (key_parts, tags):
+        the values that identify whose response this is, and the tags that
+        invalidate it. Returning (None, None) skips the cache.
+        """
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                parts, tags = scope()
+                if parts is None:
+                    return fn(*args, **kwargs)
+
+                key, cached = self.lookup(fn.__name__, request.full_path, parts, tags)
+                if cached is not None:
+                    response = make_response(cached['body'], cached['status'])
+                    response.mimetype = cached['mimetype']
+                    return response
+
+                response = make_response(fn(*args, **kwargs))
+                self.store(key, response.status_code, response.mimetype, response.get_data(as_text=True), timeout)
+                return response
+            return wrapper
+        return decorator
+
+    def invalidate(self, *tags):
+        if not tags:
+            return
+        try:
+            self.backend.bump(tags)
+            self.invalidations += len(tags)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Response cache invalidation error: {e}")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            **self.backend.stats(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'invalidations': self.invalidations,
+            'errors': self.errors
+        }
@@ -0,0 +1,39 @@
+"""Request validation schemas."""
+from marshmallow import Schema, fields, validate
+
+
+object_id = validate.Regexp(r'^[0-9a-fA-F]{24}$', error='Not a valid id.')
+
+
+class TaskSchema(Schema):
+    title = fields.Str(required=True, validate=validate.Length(min=1, max=100))
+    description = fields.Str(validate=validate.Length(max=500))
+    status = fields.Str(validate=validate.OneOf(['todo', 'in_progress', 'done']))
+    priority = fields.Str(validate=validate.OneOf(['low', 'medium', 'high']))
+    category = fields.Str()
+    due_date = fields.DateTime(allow_none=True)
+    assigned_to = fields.Str(validate=object_id)
+    version = fields.Int(load_only=True, validate=validate.Range(min=0))
+    created_at = fields.DateTime(dump_only=True)
+    user_id = fields.Str(dump_only=True)
+
+
+class UserSchema(Schema):
+    username = fields.Str(required=True, validate=validate.Length(min=3, max=50))
+    password = fields.Str(required=True, validate=validate.Length(min=6))
+    email = fields.Email(required=True)
+    role = fields.Str(required=True, validate=validate.OneOf(['user', 'admin']))
+    company_code = fields.Str(required=True)
+
+
+class AdminSchema(Schema):
+    username = fields.Str(required=True)
+    password = fields.Str(required=True)
+    company_code = fields.Str(required=True)
+    company_name = fields.Str()
+
+
+class CompanySchema(Schema):
+    name = fields.Str(required=True)
+    code = fields.Str(required=True)
+    created_by = fields.Str(required=True)
@@ -0,0 +1,263 @@
+"""
+Task search.
+
+Two backends share the same interface:
+
+* MongoTextSearch (default) uses the compound text index on
+  (company_code, title, description, category) for complete words, ranked by
+  textScore. The word still being typed is matched as a prefix against the
+  indexed `search_terms` array stored on every task.
+* InvertedIndexSearch keeps a per-company inverted index in process. It is
+  meant for tests and single-worker deployments; every worker rebuilds its own
+  copy, at most `max_age` seconds old.
+
+Results are always scoped to the caller's company and to the tasks they can
+see (everything for admins, created/assigned tasks for users).
+"""
+import base64
+import bisect
+import json
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from bson import ObjectId
+
+from pagination import PaginationError
+from queries import visibility_filter
+
+SEARCH_FIELDS = ('title', 'description', 'category')
+FIELD_WEIGHTS = {'title': 10, 'category': 5, 'description': 2}
+MAX_QUERY_TERMS = 8
+MAX_TERMS_PER_TASK = 200
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(text.lower()) if isinstance(text, str) else []
+
+
+def search_terms_for(task):
+    """Distinct lower-case words of the searchable fields, stored on the task."""
+    terms = set()
+    for field in SEARCH_FIELDS:
+        terms.update(tokenize(task.get(field)))
+    return sorted(terms)[:MAX_TERMS_PER_TASK]
+
+
+def parse_query(q):
+    """
+    Split a query into complete words and an optional trailing prefix. The
+    last word counts as a prefix unless the query ends with whitespace.
+    """
+    tokens = tokenize(q)[:MAX_QUERY_TERMS]
+    if not tokens:
+        return [], None
+    if q[-1:].isspace():
+        return tokens, None
+    return tokens[:-1], tokens[-1]
+
+
+def encode_offset(offset):
+    raw = json.dumps({'o': offset}).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_offset(cursor):
+    if not cursor:
+        return 0
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        offset = int(json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))['o'])
+    except (ValueError, KeyError, TypeError):
+        raise PaginationError('Invalid cursor')
+    if offset < 0:
+        raise PaginationError('Invalid cursor')
+    return offset
+
+
+class MongoTextSearch:
+
+    def __init__(self, tasks_collection):
+        self.tasks_collection = tasks_collection
+
+    def search(self, user, q, limit, offset=0):
+        words, prefix = parse_query(q)
+        if not words and not prefix:
+            return [], None
+
+        query = visibility_filter(user)
+        projection = {'search_terms': 0}
+        if words:
+            query['$text'] = {'$search': ' '.join(words)}
+            projection = {'score': {'$meta': 'textScore'}}
+        if prefix:
+            query['search_terms'] = {'$regex': '^' + re.escape(prefix)}
+
+        cursor = self.tasks_collection.find(query, projection)
+        if words:
+            cursor = cursor.sort([('score', {'$meta': 'textScore'})])
+        else:
+            cursor = cursor.sort([('created_at', -1), ('_id', -1)])
+        tasks = list(cursor.skip(offset).limit(limit + 1))
+
+        for task in tasks:
+            task.pop('search_terms', None)
+        if len(tasks) > limit:
+            return tasks[:limit], encode_offset(offset + limit)
+        return tasks, None
+
+    def task_changed(self, task):
+        pass
+
+    def task_removed(self, task):
+        pass
+
+
+class _CompanyIndex:
+
+    def __init__(self):
+        self.postings = defaultdict(dict)  # term -> {task_id: weight}
+        self.terms = []                    # sorted vocabulary for prefix lookups
+        self.docs = {}                     # task_id -> (created_by, assigned_to, created_ts, terms)
+        self.built_at = time.monotonic()
+
+    def add(self, task):
+        task_id = str(task['_id'])
+        self.remove(task_id)
+        terms = set()
+        for field in SEARCH_FIELDS:
+            for term in set(tokenize(task.get(field))):
+                posting = self.postings[term]
+                if not posting:
+                    bisect.insort(self.terms, term)
+                posting[task_id] = posting.get(task_id, 0) + FIELD_WEIGHTS[field]
+                terms.add(term)
+        created_at = task.get('created_at')
+        created_ts = created_at.timestamp() if isinstance(created_at, datetime) else 0
+        self.docs[task_id] = (str(task.get('created_by')), str(task.get('assigned_to')),
+                              created_ts, terms)
+
+    def remove(self, task_id):
+        doc = self.docs.pop(task_id, None)
+        if doc is None:
+            return
+        for term in doc[3]:
+            del self.postings[term][task_id]
+            if not self.postings[term]:
+                del self.postings[term]
+                self.terms.pop(bisect.bisect_left(self.terms, term))
+
+    def prefix_terms(self, prefix):
+        start = bisect.bisect_left(self.terms, prefix)
+        end = bisect.bisect_left(self.terms, prefix + '\U0010ffff')
+        return self.terms[start:end]
+
+
+class InvertedIndexSearch:
+
+    def __init__(self, tasks_collection, max_age=60):
+        self.tasks_collection = tasks_collection
+        self.max_age = max_age
+        self._companies = {}
+        self._lock = threading.Lock()
+
+    def _index(self, company_code):
+        index = self._companies.get(company_code)
+        if index is None or time.monotonic() - index.built_at > self.max_age:
+            index = _CompanyIndex()
+            projection = {field: 1 for field in SEARCH_FIELDS + ('created_by', 'assigned_to', 'created_at')}
+            for task in self.tasks_collection.find({'company_code': company_code}, projection):
+                index.add(task)
+            self._companies[company_code] = index
+        return index
+
+    def search(self, user, q, limit, offset=0):
+        words, prefix = parse_query(q)
+        if not words and not prefix:
+            return [], None
+
+        with self._lock:
+            index = self._index(user['company_code'])
+            scores = defaultdict(int)
+            for word in words:
+                for task_id, weight in index.postings.get(word, {}).items():
+                    scores[task_id] += weight
+            if prefix:
+                prefix_scores = defaultdict(int)
+                for term in index.prefix_terms(prefix):
+                    for task_id, weight in index.postings[term].items():
+                        prefix_scores[task_id] += weight
+                candidates = prefix_scores if not words else {
+                    task_id: score + prefix_scores[task_id]
+                    for task_id, score in scores.items() if task_id in prefix_scores
+                }
+                scores = candidates
+
+            user_id = str(user['_id'])
+            visible = [
+                (score, task_id) for task_id, score in scores.items()
+                if user['role'] == 'admin' or user_id in index.docs[task_id][:2]
+            ]
+            visible.sort(key=lambda item: (item[0], index.docs[item[1]][2], item[1]), reverse=True)
+            ranked = visible[offset:offset + limit + 1]
+
+        page = ranked[:limit]
+        found = {str(task['_id']): task for task in self.tasks_collection.find(
+            {'_id': {'$in': [ObjectId(task_id) for _, task_id in page]}},
+            {'search_terms': 0}
+        )}
+        tasks = []
+        for score, task_id in page:
+            if task_id in found:
+                found[task_id]['score'] = score
+                tasks.append(found[task_id])
+        return tasks, encode_offset(offset + limit) if len(ranked) > limit else None
+
+    def task_changed(self, task):
+        with self._lock:
+            index = self._companies.get(task.get('company_code'))
+            if index is not None:
+                index.add(task)
+
+    def task_removed(self, task):
+        with self._lock:
+            index = self._companies.get(task.get('company_code'))
+            if index is not None:
+                index.remove(str(task['_id']))
+
+
+def create_search(tasks_collection, backend='mongo'):
+    if backend == 'memory':
+        return InvertedIndexSearch(tasks_collection)
+    return MongoTextSearch(tasks_collection)
+
+
+def backfill_search_terms(tasks_collection, batch_size=1000):
+    """Store search_terms on tasks written before prefix search existed."""
+    from pymongo import UpdateOne
+
+    updated = 0
+    batch = []
+    projection = {field: 1 for field in SEARCH_FIELDS}
+    for task in tasks_collection.find({'search_terms': {'$exists': False}}, projection):
+        batch.append(UpdateOne({'_id': task['_id']}, {'$set': {'search_terms': search_terms_for(task)}}))
+        if len(batch) >= batch_size:
+            updated += tasks_collection.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch:
+        updated += tasks_collection.bulk_write(batch, ordered=False).modified_count
+    return updated
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+
+    import connection
+
+    load_dotenv()
+    tasks = connection.command_line_database()['tasks']
+    print(f"Backfilled search terms on {backfill_search_terms(tasks)} task(s)")
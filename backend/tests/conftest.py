@@ -0,0 +1,74 @@
+"""
+Route tests against the Flask app on mongomock, as in `bench.py --in-memory`.
+
+    pip install -r requirements-dev.txt
+    python -m pytest -q
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+import mongomock
+import pymongo
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pymongo.MongoClient = mongomock.MongoClient
+os.environ['MONGODB_DB'] = 'taskmate_test'
+os.environ['RATELIMIT_ENABLED'] = 'false'
+os.environ['EVENTS_BACKEND'] = 'local'
+os.environ['SEARCH_BACKEND'] = 'memory'
+os.environ['NAME_RECONCILE_INTERVAL_SECONDS'] = '0'
+os.environ['LOG_FILE'] = os.devnull
+
+import app as taskmate  # noqa: E402
+from flask_jwt_extended import create_access_token  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    for name in taskmate.db.list_collection_names():
+        taskmate.db.drop_collection(name)
+    taskmate.identity.cache.clear()
+    return taskmate.db
+
+
+@pytest.fixture
+def client(db):
+    taskmate.app.config['TESTING'] = True
+    return taskmate.app.test_client()
+
+
+@pytest.fixture
+def users(db):
+    admin = db.users.insert_one({
+        'username': 'boss', 'email': 'boss@example.com', 'password': b'x',
+        'role': 'admin', 'company_code': 'ACME'
+    }).inserted_id
+    member = db.users.insert_one({
+        'username': 'joe', 'email': 'joe@example.com', 'password': b'x',
+        'role': 'user', 'company_code': 'ACME'
+    }).inserted_id
+    return {'admin': admin, 'member': member}
+
+
+@pytest.fixture
+def tasks(db, users):
+    """Five active tasks created by the admin and assigned to the member, oldest first."""
+    created = datetime(2026, 1, 1)
+    return db.tasks.insert_many([{
+        'title': f'Task {i}', 'description': 'd', 'priority': 'low', 'status': 'todo',
+        'company_code': 'ACME', 'created_by': str(users['admin']), 'assigned_to': str(users['member']),
+        'created_at': created + timedelta(hours=i), 'due_date': created + timedelta(days=5 - i),
+        'version': 0
+    } for i in range(5)]).inserted_ids
+
+
+@pytest.fixture
+def auth():
+    """Authorization headers for a user id."""
+    def headers(user_id):
+        with taskmate.app.app_context():
+            return {'Authorization': 'Bearer ' + create_access_token(identity=str(user_id))}
+    return headers
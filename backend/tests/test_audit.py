@@ -0,0 +1,99 @@
+import threading
+from datetime import datetime
+
+import mongomock
+from bson import ObjectId
+
+from audit import AuditLog
+
+
+def task(title='Task'):
+    return {'_id': ObjectId(), 'company_code': 'ACME', 'title': title, 'status': 'todo'}
+
+
+def actor():
+    return {'_id': ObjectId(), 'username': 'boss'}
+
+
+class SlowCollection:
+    """Blocks insert_many until released, like a database that fell behind."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.release = threading.Event()
+
+    def insert_many(self, batch, ordered=True):
+        self.release.wait(5)
+        return self.collection.insert_many(batch, ordered=ordered)
+
+
+def test_entries_are_written_in_batches():
+    collection = mongomock.MongoClient().db.audit_log
+    log = AuditLog(collection, batch_size=2, flush_interval=0.05)
+
+    log.record([(None, task(f'Task {i}')) for i in range(5)], actor())
+
+    assert log.flush()
+    assert collection.count_documents({}) == 5
+    assert log.stats()['batches'] == 3
+    assert log.stats()['written'] == 5
+
+
+def test_close_flushes_queued_entries():
+    collection = mongomock.MongoClient().db.audit_log
+    # Without the flush the writer would wait a minute for the batch to fill
+    log = AuditLog(collection, batch_size=100, flush_interval=60)
+    before = task()
+
+    log.record([(before, {**before, 'status': 'done'}), (before, None)], actor())
+    log.close()
+
+    entries = list(collection.find().sort('type'))
+    assert [entry['type'] for entry in entries] == ['completed', 'deleted']
+    assert entries[0]['changes'] == {'status': ['todo', 'done']}
+    log.record([(None, task())], actor())
+    assert log.stats()['recorded'] == 2
+
+
+def test_full_queue_drops_entries_instead_of_blocking():
+    collection = SlowCollection(mongomock.MongoClient().db.audit_log)
+    log = AuditLog(collection, batch_size=1, flush_interval=0.05, max_pending=1, enqueue_timeout=0.2)
+
+    # The writer holds the first entry, the second fills the queue, the third is dropped
+    log.record([(None, task(f'Task {i}')) for i in range(3)], actor())
+
+    assert log.stats()['dropped'] == 1
+    collection.release.set()
+    assert log.flush()
+    assert collection.collection.count_documents({}) == 2
+
+
+def test_history_pages_by_time_then_id(client, db, users, tasks, auth):
+    at = datetime(2026, 3, 1)
+    # Entries recorded for one bulk write share a timestamp
+    db.audit_log.insert_many([
+        {'task_id': tasks[0], 'company_code': 'ACME', 'type': 'updated', 'title': f'v{i}',
+         'at': at.replace(hour=i // 2)}
+        for i in range(5)
+    ])
+    headers = auth(users['admin'])
+
+    titles = []
+    url = f'/tasks/{tasks[0]}/history?limit=2'
+    while url:
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200
+        titles += [entry['title'] for entry in response.get_json()]
+        cursor = response.headers.get('X-Next-Cursor')
+        url = cursor and f'/tasks/{tasks[0]}/history?limit=2&cursor={cursor}'
+
+    assert titles == ['v4', 'v3', 'v2', 'v1', 'v0']
+
+
+def test_history_is_hidden_from_users_who_cannot_see_the_task(client, db, users, auth):
+    other = db.tasks.insert_one({'company_code': 'ACME', 'created_by': str(users['admin']),
+                                 'title': 'Private', 'status': 'todo'}).inserted_id
+
+    response = client.get(f'/tasks/{other}/history', headers=auth(users['member']))
+
+    assert response.status_code == 404
@@ -0,0 +1,69 @@
+def test_complete_repeated_id_writes_once(client, db, users, tasks, auth):
+    task_id = str(tasks[0])
+    response = client.post('/tasks/bulk/complete', json={'ids': [task_id, task_id]}, headers=auth(users['admin']))
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [r['status'] for r in body['results']] == ['completed', 'error']
+    assert body['results'][1]['error'] == 'Duplicate task id'
+    assert db.tasks.find_one({'_id': tasks[0]})['version'] == 1
+
+
+def test_delete_repeated_id_fails_the_repeat(client, db, users, tasks, auth):
+    task_id = str(tasks[0])
+    response = client.post('/tasks/bulk/delete', json={'ids': [task_id, str(tasks[1]), task_id]},
+                           headers=auth(users['admin']))
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body['succeeded'], body['failed']) == (2, 1)
+    assert body['results'][2]['error'] == 'Duplicate task id'
+    assert db.tasks.count_documents({}) == 3
+
+
+def changed_before_write(monkeypatch, change):
+    """Run `change` between the route's read of the tasks and its bulk write."""
+    import bulk
+    execute_conditional = bulk.execute_conditional
+
+    def racing(*args, **kwargs):
+        change()
+        return execute_conditional(*args, **kwargs)
+    monkeypatch.setattr(bulk, 'execute_conditional', racing)
+
+
+def test_complete_skips_tasks_changed_since_read(client, db, users, tasks, auth, monkeypatch):
+    def change():
+        db.tasks.update_one({'_id': tasks[0]}, {'$set': {'title': 'Renamed'}, '$inc': {'version': 1}})
+        db.tasks.update_one({'_id': tasks[1]}, {'$set': {'assigned_to': str(users['admin'])}, '$inc': {'version': 1}})
+        db.tasks.delete_one({'_id': tasks[2]})
+    changed_before_write(monkeypatch, change)
+
+    response = client.post('/tasks/bulk/complete', json={'ids': [str(task_id) for task_id in tasks[:4]]},
+                           headers=auth(users['member']))
+
+    results = response.get_json()['results']
+    assert results[0]['error'] == 'Task was changed by someone else; reload it and retry'
+    assert results[0]['version'] == 1
+    assert results[1]['error'] == 'Unauthorized to complete this task'
+    assert results[2]['error'] == 'Task not found'
+    assert results[3]['status'] == 'completed'
+    assert db.tasks.find_one({'_id': tasks[0]})['status'] == 'todo'
+    assert db.tasks.count_documents({'status': 'done'}) == 1
+    assert db.tasks.count_documents({'bulk_write_id': {'$exists': True}}) == 0
+
+
+def test_delete_reports_tasks_deleted_by_someone_else(client, db, users, tasks, auth, monkeypatch):
+    import app as taskmate
+    recorded = []
+    monkeypatch.setattr(taskmate, 'tasks_written', lambda changes, actor: recorded.extend(changes))
+    changed_before_write(monkeypatch, lambda: db.tasks.delete_one({'_id': tasks[0]}))
+
+    response = client.post('/tasks/bulk/delete', json={'ids': [str(tasks[0]), str(tasks[1])]},
+                           headers=auth(users['admin']))
+
+    results = response.get_json()['results']
+    assert results[0]['error'] == 'Task not found'
+    assert results[1]['status'] == 'deleted'
+    assert [before['_id'] for before, after in recorded] == [tasks[1]]
+    assert db.tasks.count_documents({}) == 3
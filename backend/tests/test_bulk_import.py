@@ -0,0 +1,77 @@
+import io
+import os
+import tempfile
+
+import mongomock
+import pytest
+
+import bulk_import
+from passwords import PasswordHasher
+
+CSV = (
+    'username,email,password,role\n'
+    'ann,ann@example.com,secret1\n'
+    'bob,bob@example.com,secret2,admin\n'
+)
+
+
+class ListReport(bulk_import.Report):
+
+    def __init__(self):
+        super().__init__()
+        self.failures = []
+
+    def flush(self):
+        self.failures += self._pending
+        super().flush()
+
+
+@pytest.fixture(scope='module')
+def hasher():
+    hasher = PasswordHasher(rounds=4, workers=1)
+    yield hasher
+    hasher.shutdown()
+
+
+def import_csv(hasher, **kwargs):
+    users = mongomock.MongoClient().db.users
+    report = ListReport()
+    rows = bulk_import.read_rows(io.BytesIO(CSV.encode('utf-8')), 'csv')
+    bulk_import.import_users(rows, users, hasher, 'ACME', report, **kwargs)
+    report.flush()
+    return users, report
+
+
+def test_admin_rows_need_explicit_permission(hasher):
+    users, report = import_csv(hasher)
+
+    assert [user['role'] for user in users.find()] == ['user']
+    assert [(failure['row'], failure['error']) for failure in report.failures] == [
+        (2, 'role must be user; admins can only be imported when explicitly allowed')
+    ]
+
+
+def test_admin_rows_import_when_allowed(hasher):
+    users, report = import_csv(hasher, allow_admins=True)
+
+    assert sorted(user['role'] for user in users.find()) == ['admin', 'user']
+    assert report.failed == 0
+
+
+def test_oversized_upload_is_rejected_and_not_kept():
+    before = set(os.listdir(tempfile.gettempdir()))
+
+    with pytest.raises(bulk_import.ImportTooLarge):
+        bulk_import.save_upload(io.BytesIO(b'x' * 2048), max_bytes=1024)
+
+    assert set(os.listdir(tempfile.gettempdir())) == before
+
+
+def test_import_route_rejects_oversized_body(client, users, auth, monkeypatch):
+    import app as taskmate
+    monkeypatch.setattr(taskmate, 'IMPORT_MAX_BYTES', 16)
+
+    response = client.post('/admin/import/users?format=csv', data=CSV,
+                           headers={**auth(users['admin']), 'Content-Type': 'text/csv'})
+
+    assert response.status_code == 413
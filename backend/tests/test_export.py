@@ -0,0 +1,18 @@
+from datetime import datetime
+
+import pytest
+
+import export
+import listing
+
+
+def test_from_and_to_are_naive_utc_like_the_listing():
+    query, _ = export.export_query('ACME', {'from': '2026-01-01T05:30:00+05:30', 'to': '2026-01-02T00:00:00Z'})
+
+    assert query['created_at'] == {'$gte': datetime(2026, 1, 1), '$lt': datetime(2026, 1, 2)}
+    assert query['created_at']['$gte'] == listing._parse_date('2026-01-01T05:30:00+05:30', 'from')
+
+
+def test_bad_date_is_an_export_error():
+    with pytest.raises(export.ExportError, match='from must be an ISO 8601 date'):
+        export.export_query('ACME', {'from': 'yesterday'})
@@ -0,0 +1,20 @@
+import mongomock
+
+from indexes import INDEXES, ensure_indexes
+
+
+def test_one_failing_index_leaves_the_others():
+    db = mongomock.MongoClient().db
+    # Existing duplicates block the unique username index
+    db.users.insert_many([
+        {'username': 'joe', 'email': 'joe@example.com'},
+        {'username': 'joe', 'email': 'joe2@example.com'},
+    ])
+
+    failed = ensure_indexes(db)
+
+    assert failed == ['users.username_unique']
+    names = set(db.users.index_information())
+    assert {'email_unique', 'company_role'} <= names
+    assert 'username_unique' not in names
+    assert len(db.tasks.index_information()) == len(INDEXES['tasks']) + 1
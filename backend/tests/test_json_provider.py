@@ -0,0 +1,14 @@
+def test_task_dates_keep_flask_format(client, users, tasks, auth):
+    response = client.get('/tasks', headers=auth(users['admin']))
+
+    task = next(task for task in response.get_json() if task['title'] == 'Task 0')
+    assert task['created_at'] == 'Thu, 01 Jan 2026 00:00:00 GMT'
+    assert task['_id'] == str(tasks[0])
+
+
+def test_admin_task_dates_keep_isoformat(client, users, tasks, auth):
+    response = client.get('/admin/tasks', headers=auth(users['admin']))
+
+    task = next(task for task in response.get_json() if task['title'] == 'Task 0')
+    assert task['created_at'] == '2026-01-01T00:00:00'
+    assert task['due_date'] == '2026-01-06T00:00:00'
@@ -0,0 +1,48 @@
+def test_cursor_pages_through_its_sort(client, users, tasks, auth):
+    headers = auth(users['admin'])
+    first = client.get('/tasks?limit=3&sort=due_date', headers=headers)
+    second = client.get(f"/tasks?limit=3&sort=due_date&cursor={first.headers['X-Next-Cursor']}", headers=headers)
+
+    titles = [task['title'] for task in first.get_json() + second.get_json()]
+    assert titles == ['Task 4', 'Task 3', 'Task 2', 'Task 1', 'Task 0']
+
+
+def test_cursor_from_another_sort_is_rejected(client, users, tasks, auth):
+    headers = auth(users['admin'])
+    first = client.get('/tasks?limit=3', headers=headers)
+
+    response = client.get(f"/tasks?limit=3&sort=due_date&cursor={first.headers['X-Next-Cursor']}", headers=headers)
+
+    assert response.status_code == 400
+    assert 'different sort' in response.get_json()['error']
+
+
+def comments_page(client, task_id, headers, cursor=None):
+    url = f'/tasks/{task_id}/comments?limit=2' + (f'&cursor={cursor}' if cursor else '')
+    return client.get(url, headers=headers)
+
+
+def test_comment_cursor_pages_oldest_first(client, users, tasks, auth):
+    headers = auth(users['admin'])
+    for i in range(5):
+        client.post(f'/tasks/{tasks[0]}/comments', json={'text': f'Comment {i}'}, headers=headers)
+
+    texts = []
+    response = comments_page(client, tasks[0], headers)
+    while True:
+        texts += [comment['text'] for comment in response.get_json()]
+        if 'X-Next-Cursor' not in response.headers:
+            break
+        response = comments_page(client, tasks[0], headers, response.headers['X-Next-Cursor'])
+
+    assert texts == [f'Comment {i}' for i in range(5)]
+
+
+def test_task_cursor_is_rejected_by_comments(client, users, tasks, auth):
+    headers = auth(users['admin'])
+    cursor = client.get('/tasks?limit=3', headers=headers).headers['X-Next-Cursor']
+
+    response = comments_page(client, tasks[0], headers, cursor)
+
+    assert response.status_code == 400
+    assert 'different listing' in response.get_json()['error']
@@ -0,0 +1,32 @@
+import mongomock
+import pytest
+from limits import parse_many
+
+from rate_limits import CompanyQuotas
+
+
+@pytest.fixture
+def companies():
+    collection = mongomock.MongoClient().db.companies
+    collection.insert_one({'code': 'ACME', 'name': 'Acme'})
+    return collection
+
+
+def test_malformed_company_limit_falls_back_to_default(companies):
+    companies.update_one({'code': 'ACME'}, {'$set': {'rate_limit': 'lots per hour'}})
+
+    assert CompanyQuotas(companies, '20000 per hour').limits_for('ACME') == parse_many('20000 per hour')
+
+
+def test_set_limit_validates_and_applies_at_once(companies):
+    quotas = CompanyQuotas(companies, '20000 per hour')
+    quotas.limits_for('ACME')
+
+    with pytest.raises(ValueError):
+        quotas.set_limit('ACME', 'lots per hour')
+    assert quotas.set_limit('ACME', '50 per minute')
+
+    assert quotas.limits_for('ACME') == parse_many('50 per minute')
+    assert quotas.set_limit('ACME', None)
+    assert 'rate_limit' not in companies.find_one({'code': 'ACME'})
+    assert not quotas.set_limit('NOPE', '50 per minute')
@@ -0,0 +1,60 @@
+def test_update_with_stale_version_conflicts(client, db, users, tasks, auth):
+    task_id = str(tasks[0])
+    headers = auth(users['admin'])
+    assert client.put(f'/tasks/{task_id}', json={'title': 'First', 'version': 0}, headers=headers).status_code == 200
+
+    response = client.put(f'/tasks/{task_id}', json={'title': 'Second', 'version': 0}, headers=headers)
+
+    assert response.status_code == 409
+    assert response.get_json()['version'] == 1
+    assert db.tasks.find_one({'_id': tasks[0]})['title'] == 'First'
+
+
+def test_delete_with_stale_if_match_conflicts(client, db, users, tasks, auth):
+    task_id = str(tasks[0])
+    headers = auth(users['admin'])
+    client.put(f'/tasks/{task_id}', json={'title': 'First'}, headers=headers)
+
+    response = client.delete(f'/tasks/{task_id}', headers={**headers, 'If-Match': '"0"'})
+
+    assert response.status_code == 409
+    assert db.tasks.count_documents({'_id': tasks[0]}) == 1
+
+
+def test_bulk_update_with_stale_version_conflicts(client, db, users, tasks, auth):
+    headers = auth(users['admin'])
+    client.put(f'/tasks/{tasks[0]}', json={'title': 'First'}, headers=headers)
+
+    response = client.put('/tasks/bulk', json={'tasks': [
+        {'_id': str(tasks[0]), 'title': 'Stale', 'version': 0},
+        {'_id': str(tasks[1]), 'title': 'Fresh', 'version': 0},
+    ]}, headers=headers)
+
+    results = response.get_json()['results']
+    assert results[0]['error'] == 'Task was changed by someone else; reload it and retry'
+    assert results[0]['version'] == 1
+    assert results[1]['status'] == 'updated'
+    assert db.tasks.find_one({'_id': tasks[0]})['title'] == 'First'
+    assert db.tasks.find_one({'_id': tasks[1]})['version'] == 1
+
+
+def test_update_search_terms_include_a_concurrent_write(client, db, users, tasks, auth, monkeypatch):
+    import search
+    search_terms_for = search.search_terms_for
+    concurrent = []
+
+    def racing(task):
+        # Another request changes the description after this one read the task
+        if not concurrent:
+            concurrent.append(db.tasks.update_one(
+                {'_id': tasks[0]}, {'$set': {'description': 'quarterly report'}, '$inc': {'version': 1}}
+            ))
+        return search_terms_for(task)
+    monkeypatch.setattr(search, 'search_terms_for', racing)
+
+    response = client.put(f'/tasks/{tasks[0]}', json={'title': 'Budget'}, headers=auth(users['admin']))
+
+    assert response.status_code == 200
+    task = db.tasks.find_one({'_id': tasks[0]})
+    assert task['version'] == 2
+    assert {'budget', 'quarterly', 'report'} <= set(task['search_terms'])